@@ -0,0 +1,45 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULE_NAME = 'ytdlp_gui'
+
+
+def load_app_module():
+    """تحميل yt-dlp.py كوحدة (الاسم يحتوي '-' فلا يمكن استيراده مباشرة)."""
+    if MODULE_NAME not in sys.modules:
+        spec = importlib.util.spec_from_file_location(MODULE_NAME, os.path.join(ROOT, 'yt-dlp.py'))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[MODULE_NAME] = module
+        spec.loader.exec_module(module)
+    return sys.modules[MODULE_NAME]
+
+
+@pytest.fixture(scope='session')
+def app():
+    return load_app_module()
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """كل اختبار يكتب في مجلد مؤقت (مسارات الإخراج نسبية إلى مجلد العمل)."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def stand_in(app):
+    server = app.start_stand_in_server()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+@pytest.fixture(scope='session')
+def qapp(app):
+    """QApplication واحد لكل الاختبارات (لا يمكن إنشاء تطبيق Qt ثانٍ في العملية نفسها)."""
+    return app.QApplication.instance() or app.QApplication([])
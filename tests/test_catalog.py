@@ -0,0 +1,27 @@
+import os
+
+
+def test_import_folder_skips_temp_hidden_and_non_media_files(app, tmp_path):
+    root = tmp_path / 'downloads'
+    (root / app.OUTPUT_TEMP_DIR).mkdir(parents=True)
+    (root / 'Channel').mkdir()
+    media = root / 'Channel' / 'Talk [dQw4w9WgXcQ].mp4'
+    media.write_bytes(b'\x00' * 16)
+    for name in ('Talk [dQw4w9WgXcQ].jpg', 'Talk [dQw4w9WgXcQ].info.json', 'Talk [dQw4w9WgXcQ].description',
+                 'Next [aaaaaaaaaaa].mp4.part', '.Next [aaaaaaaaaaa].part.mp4'):
+        (root / 'Channel' / name).write_bytes(b'x')
+    (root / app.OUTPUT_TEMP_DIR / '.reserve-1-job').write_bytes(b'\x00' * 16)
+    (root / app.OUTPUT_TEMP_DIR / 'Other [bbbbbbbbbbb].mp4').write_bytes(b'x')
+
+    catalog = app.MediaCatalog(str(root / 'catalog.sqlite3'))
+    try:
+        assert catalog.import_folder(str(root)) == 1
+        [row] = catalog.find_by_id('dQw4w9WgXcQ')
+        assert row['file_path'] == str(media) and row['file_size'] == 16
+        assert not catalog.has('aaaaaaaaaaa') and not catalog.has('bbbbbbbbbbb')
+    finally:
+        catalog.close()
+
+
+def test_catalog_path_follows_output_root(app):
+    assert os.path.dirname(app.CATALOG_PATH) == app.OUTPUT_ROOT
@@ -0,0 +1,94 @@
+import contextlib
+
+import pytest
+
+CHANNEL = 'https://www.youtube.com/channel/UC' + 'x' * 22
+
+
+class FakeSync:
+    """ChannelSync فوق قائمة معرّفات ثابتة من الأحدث بدل سرد yt-dlp."""
+
+    def __init__(self, app, store, listing, catalog=None, **kwargs):
+        class _Sync(app.ChannelSync):
+            @contextlib.contextmanager
+            def _entries(self, listing_url):
+                yield [{'id': video_id} for video_id in listing]
+        self.sync = _Sync(store, catalog, **kwargs)
+
+
+class FakeQueue:
+    def __init__(self):
+        self.urls = []
+
+    def enqueue_many(self, urls, job_options=None):
+        self.urls.extend(urls)
+        return list(range(len(urls)))
+
+
+class FakeCatalog:
+    def __init__(self, ids):
+        self.ids = set(ids)
+
+    def has(self, video_id):
+        return video_id in self.ids
+
+
+@pytest.fixture
+def store(app, tmp_path):
+    store = app.SyncCursorStore(str(tmp_path / 'catalog.sqlite3'))
+    yield store
+    store.close()
+
+
+def _ids(urls):
+    return [url.rsplit('=', 1)[1] for url in urls]
+
+
+def test_preview_does_not_save_cursor(app, store):
+    listing = ['v3', 'v2', 'v1']
+    reports, new = FakeSync(app, store, listing).sync.sync([CHANNEL])
+    assert [entry['id'] for entry in new] == listing
+    assert store.get(reports[0]['source']) is None
+
+
+def test_limited_sync_resumes_older_items(app, store):
+    listing = [f'v{n}' for n in range(20, 0, -1)]
+    queue = FakeQueue()
+    FakeSync(app, store, listing).sync.sync([CHANNEL], queue, limit=8)
+    FakeSync(app, store, listing).sync.sync([CHANNEL], queue, limit=8)
+    FakeSync(app, store, listing).sync.sync([CHANNEL], queue, limit=8)
+    assert sorted(_ids(queue.urls)) == sorted(listing)
+    # المزامنة بعد اكتمال السرد تتوقف عند المعروف ولا تضيف شيئاً
+    listing.insert(0, 'v21')
+    reports, _new = FakeSync(app, store, listing).sync.sync([CHANNEL], queue, limit=8)
+    assert reports[0]['new'] == 1 and reports[0]['stopped_early'] and not reports[0]['truncated']
+
+
+def test_catalog_hits_need_stop_after_known(app, store):
+    # فيديو قديم واحد في الفهرس (مثلاً مستورد) لا يوقف أول مزامنة
+    listing = ['v5', 'v4', 'v3', 'v2', 'v1']
+    queue = FakeQueue()
+    FakeSync(app, store, listing, FakeCatalog({'v4'})).sync.sync([CHANNEL], queue)
+    assert sorted(_ids(queue.urls)) == ['v1', 'v2', 'v3', 'v5']
+
+
+def test_truncated_run_keeps_older_resume_point(app, store):
+    listing = [f'a{n}' for n in range(20, 0, -1)]
+    queue = FakeQueue()
+    FakeSync(app, store, listing).sync.sync([CHANNEL], queue, limit=8)
+    listing[:0] = [f'b{n}' for n in range(15, 0, -1)]
+    for _ in range(4):
+        FakeSync(app, store, listing).sync.sync([CHANNEL], queue, limit=8)
+    assert sorted(_ids(queue.urls)) == sorted(listing)
+    assert len(queue.urls) == len(listing)
+
+
+def test_full_playlist_cursor_drops_removed_ids_and_is_capped(app, store, monkeypatch):
+    playlist = 'https://www.youtube.com/playlist?list=PL' + 'y' * 16
+    queue = FakeQueue()
+    FakeSync(app, store, ['p1', 'p2', 'p3']).sync.sync([playlist], queue)
+    reports, _new = FakeSync(app, store, ['p1', 'p3', 'p4']).sync.sync([playlist], queue)
+    assert store.get(reports[0]['source'])['seen_ids'] == ['p1', 'p3', 'p4']
+    monkeypatch.setattr(app, 'SYNC_PLAYLIST_CURSOR_SIZE', 2)
+    FakeSync(app, store, ['p1', 'p3', 'p4', 'p5']).sync.sync([playlist], queue)
+    assert store.get(reports[0]['source'])['seen_ids'] == ['p4', 'p5']
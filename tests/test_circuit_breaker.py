@@ -0,0 +1,70 @@
+import threading
+
+import pytest
+
+
+def _half_open(app, host):
+    breaker = app.HostCircuitBreaker(threshold=1, base_cooldown=0, pacing=0)
+    breaker.record_failure(host, app.ERROR_THROTTLED)
+    assert breaker.state(host) == 'half-open'
+    return breaker
+
+
+def _admitted_within(breaker, host, timeout):
+    admitted = threading.Event()
+    thread = threading.Thread(target=lambda: (breaker.before_request(host), admitted.set()), daemon=True)
+    thread.start()
+    return admitted.wait(timeout)
+
+
+def test_half_open_admits_a_single_probe(app):
+    breaker = _half_open(app, 'youtube')
+    breaker.before_request('youtube')
+    assert not _admitted_within(breaker, 'youtube', 0.2)
+    breaker.record_success('youtube')
+    assert breaker.state('youtube') == 'closed'
+
+
+def test_cancelled_probe_releases_the_host(app, monkeypatch):
+    breaker = _half_open(app, 'youtube')
+    monkeypatch.setattr(app, 'CIRCUIT_BREAKERS', breaker)
+    worker = app.YtdlpWorker(url='https://www.youtube.com/watch?v=dQw4w9WgXcQ')
+
+    def cancelled_download():
+        worker._is_cancelled = True
+        raise SystemExit("Download cancelled by user.")
+
+    with pytest.raises(SystemExit):
+        worker._with_retries(cancelled_download)
+    assert _admitted_within(breaker, 'youtube', 2)
+
+
+def test_transient_errors_are_retried_without_opening_the_circuit(app, monkeypatch):
+    breaker = app.HostCircuitBreaker(threshold=1, pacing=0)
+    monkeypatch.setattr(app, 'CIRCUIT_BREAKERS', breaker)
+    monkeypatch.setitem(app.RETRY_POLICIES, app.ERROR_TRANSIENT, app.RetryPolicy(max_attempts=3))
+    worker = app.YtdlpWorker(url='https://www.youtube.com/watch?v=dQw4w9WgXcQ')
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ConnectionResetError("Connection reset by peer")
+        return 'ok'
+
+    assert worker._with_retries(flaky) == 'ok'
+    assert len(calls) == 3 and breaker.state('youtube') == 'closed'
+
+
+def test_permanent_error_is_not_retried(app, monkeypatch):
+    monkeypatch.setattr(app, 'CIRCUIT_BREAKERS', app.HostCircuitBreaker(pacing=0))
+    worker = app.YtdlpWorker(url='https://www.youtube.com/watch?v=dQw4w9WgXcQ')
+    calls = []
+
+    def removed():
+        calls.append(1)
+        raise Exception("ERROR: Video unavailable")
+
+    with pytest.raises(Exception):
+        worker._with_retries(removed)
+    assert len(calls) == 1 and worker.error_kind == app.ERROR_PERMANENT
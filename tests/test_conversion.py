@@ -0,0 +1,123 @@
+import pytest
+from PyQt6.QtCore import QObject, pyqtSignal
+
+
+def test_cost_model_ignores_corrupt_file(app, tmp_path):
+    path = tmp_path / 'conversion_costs.json'
+    path.write_text('{"libx264:h264": 0.5,', encoding='utf-8')
+    model = app.ConversionCostModel(str(path))
+    assert model.rates == {}
+    features = {'target': 'libx264', 'source_codec': 'h264', 'duration': 60, 'pixels': app.REFERENCE_PIXELS,
+                'image': False}
+    model.observe(features, 30.5)
+    assert app.ConversionCostModel(str(path)).rates == model.rates
+
+
+@pytest.mark.parametrize('requested, container, source_codec, expected', [
+    ('copy', 'webm', 'vp9', 'copy'),
+    ('copy', 'webm', 'h264', 'libvpx-vp9'),
+    ('copy', 'mov', 'vp9', 'libx264'),
+    ('copy', 'mkv', 'vp9', 'copy'),
+    ('copy', 'mp4', None, 'copy'),
+    ('copy', 'mov', None, 'libx264'),
+    ('libx265', 'mp4', 'h264', 'libx265'),
+])
+def test_copy_falls_back_to_reencode_when_container_rejects_codec(app, requested, container, source_codec,
+                                                                   expected):
+    assert app.resolve_video_codec(requested, container, source_codec, '/media/clip.mp4') == expected
+
+
+def test_explicit_encoder_must_fit_container(app):
+    with pytest.raises(ValueError):
+        app.resolve_video_codec('libx264', 'webm', 'h264')
+
+
+def test_catalog_follows_converted_file(app, tmp_path):
+    catalog = app.MediaCatalog(str(tmp_path / 'catalog.sqlite3'))
+    catalog.record({'video_id': 'abc', 'file_path': '/media/clip.webm', 'file_size': 10, 'sha256': 'old'})
+    catalog.relocate('/media/clip.webm', '/media/clip.mp4', file_size=20, sha256='new')
+    [row] = catalog.find_by_id('abc')
+    assert (row['file_path'], row['file_size'], row['sha256']) == ('/media/clip.mp4', 20, 'new')
+    catalog.close()
+
+
+class _ScheduledWorker(QObject):
+    """بديل ConversionWorker: يسجّل ترتيب البدء وينتهي عند الطلب."""
+    finished = pyqtSignal()
+
+    def __init__(self, name, seconds, started):
+        super().__init__()
+        self.name = name
+        self.started = started
+        self.job_status = 'done'
+        self.options = {'is_video_convert': True, 'video_codec': 'libx264', 'video_info': {'duration': seconds},
+                        'image_format': '-- الأصلي (لا تحويل) --'}
+
+    def start(self):
+        self.started.append(self.name)
+
+    def finish(self):
+        self.finished.emit()
+
+
+class _DurationCostModel:
+    """الزمن المتوقع = مدة الوسائط، بلا تعلم."""
+    def predict(self, features):
+        return features['duration']
+
+    def observe(self, features, elapsed):
+        pass
+
+
+def _scheduler(app, **kwargs):
+    return app.ConversionScheduler(_DurationCostModel(), **kwargs)
+
+
+def test_sjf_runs_shortest_pending_job_first(app):
+    started = []
+    scheduler = _scheduler(app, max_parallel=1)
+    workers = {name: _ScheduledWorker(name, seconds, started)
+               for name, seconds in (('first', 50), ('long', 30), ('short', 10), ('medium', 20))}
+    for worker in workers.values():
+        scheduler.submit(worker)
+    assert [worker.name for worker, _seconds in scheduler.pending()] == ['short', 'medium', 'long']
+    for name in ('first', 'short', 'medium', 'long'):
+        workers[name].finish()
+    assert started == ['first', 'short', 'medium', 'long']
+    assert scheduler.wait(0)
+
+
+def test_edf_runs_earliest_deadline_then_undated_shortest(app):
+    started = []
+    scheduler = _scheduler(app, policy='edf', max_parallel=1)
+    blocker = _ScheduledWorker('blocker', 1, started)
+    scheduler.submit(blocker)
+    for name, seconds, deadline in (('late', 5, 200.0), ('soon', 50, 100.0), ('undated-long', 30, None),
+                                    ('undated-short', 10, None)):
+        scheduler.submit(_ScheduledWorker(name, seconds, started), deadline)
+    assert [worker.name for worker, _seconds in scheduler.pending()] == \
+        ['soon', 'late', 'undated-short', 'undated-long']
+
+
+def test_max_heavy_limits_concurrent_heavy_encodes(app):
+    started = []
+    scheduler = _scheduler(app, max_parallel=3, max_heavy=1, heavy_seconds=100)
+    heavy_a = _ScheduledWorker('heavy-a', 200, started)
+    heavy_b = _ScheduledWorker('heavy-b', 300, started)
+    light = _ScheduledWorker('light', 5, started)
+    for worker in (heavy_a, heavy_b, light):
+        scheduler.submit(worker)
+    # الترميز الثقيل الثاني ينتظر، والمهمة الخفيفة لا تنتظر خلفه
+    assert started == ['heavy-a', 'light']
+    light.finish()
+    assert started == ['heavy-a', 'light']
+    heavy_a.finish()
+    assert started == ['heavy-a', 'light', 'heavy-b']
+    assert not scheduler.wait(0)
+    heavy_b.finish()
+    assert scheduler.wait(0)
+
+
+def test_unknown_policy_is_rejected(app):
+    with pytest.raises(ValueError):
+        _scheduler(app, policy='fifo')
@@ -0,0 +1,97 @@
+import errno
+import os
+import threading
+
+import pytest
+
+MB = 1024 * 1024
+
+
+def _admission(app, tmp_path, free):
+    admission = app.DiskSpaceAdmission(str(tmp_path), reserve_bytes=10 * MB, poll_seconds=0.05)
+    admission.free_bytes = lambda: free[0]
+    return admission
+
+
+def _admit_in_thread(admission, job_id, footprint, **kwargs):
+    outcome = []
+
+    def admit():
+        try:
+            admission.admit(job_id, footprint, **kwargs)
+            outcome.append('admitted')
+        except SystemExit:
+            outcome.append('cancelled')
+
+    thread = threading.Thread(target=admit, daemon=True)
+    thread.start()
+    return thread, outcome
+
+
+def test_reservations_count_against_free_space(app, tmp_path):
+    admission = _admission(app, tmp_path, [100 * MB])
+    admission.admit('a', 50 * MB)
+    assert admission.has_headroom(40 * MB) and not admission.has_headroom(41 * MB)
+    admission.consume('a', 20 * MB)
+    assert admission.remaining('a') == 30 * MB
+    admission.release('a')
+    assert admission.has_headroom(90 * MB)
+
+
+def test_admit_waits_for_space_then_proceeds(app, tmp_path):
+    free = [50 * MB]
+    admission = _admission(app, tmp_path, free)
+    waits = []
+    thread, outcome = _admit_in_thread(admission, 'a', 80 * MB, on_wait=waits.append)
+    thread.join(0.3)
+    assert thread.is_alive() and waits == [80 * MB]
+    free[0] = 200 * MB
+    thread.join(2)
+    assert outcome == ['admitted'] and admission.remaining('a') == 80 * MB
+
+
+def test_release_wakes_a_waiting_job(app, tmp_path):
+    admission = _admission(app, tmp_path, [100 * MB])
+    admission.poll_seconds = 60
+    admission.admit('a', 60 * MB)
+    thread, outcome = _admit_in_thread(admission, 'b', 60 * MB)
+    thread.join(0.2)
+    assert not outcome
+    admission.release('a')
+    thread.join(2)
+    assert outcome == ['admitted']
+
+
+def test_cancel_while_waiting_leaves_no_reservation(app, tmp_path):
+    admission = _admission(app, tmp_path, [50 * MB])
+    cancelled = threading.Event()
+    thread, outcome = _admit_in_thread(admission, 'a', 80 * MB, cancelled=cancelled.is_set)
+    thread.join(0.2)
+    cancelled.set()
+    thread.join(2)
+    assert outcome == ['cancelled'] and admission.remaining('a') == 0
+    assert admission.has_headroom(40 * MB)
+
+
+def test_footprint_larger_than_disk_fails_fast(app, tmp_path):
+    admission = _admission(app, tmp_path, [100 * MB])
+    with pytest.raises(OSError) as raised:
+        admission.admit('a', 1 << 62)
+    assert raised.value.errno == errno.EFBIG
+
+
+@pytest.mark.skipif(not hasattr(os, 'posix_fallocate'), reason="no posix_fallocate")
+def test_reservation_file_shrinks_and_is_removed(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'PREALLOCATE_MIN_BYTES', MB)
+    monkeypatch.setattr(app, 'RESERVATION_SHRINK_STEP', MB // 2)
+    admission = app.DiskSpaceAdmission(str(tmp_path), reserve_bytes=0)
+    admission.admit('a', 2 * MB)
+    [name] = os.listdir(tmp_path / app.OUTPUT_TEMP_DIR)
+    reserve = tmp_path / app.OUTPUT_TEMP_DIR / name
+    assert name.startswith('.reserve-') and reserve.stat().st_size == 2 * MB
+    admission.consume('a', MB)
+    assert reserve.stat().st_size == MB
+    admission.hand_over('a')
+    assert reserve.stat().st_size == 0 and admission.remaining('a') == 0
+    admission.release('a')
+    assert not reserve.exists()
@@ -0,0 +1,20 @@
+import time
+import urllib.error
+
+import pytest
+
+
+def _http_error(status, url='https://rr1---sn.googlevideo.com/videoplayback?expire=9999999999'):
+    return urllib.error.HTTPError(url, status, 'error', None, None)
+
+
+@pytest.mark.parametrize('status, kind', [(403, 'throttled'), (429, 'throttled'), (404, 'permanent'),
+                                          (410, 'permanent'), (503, 'transient')])
+def test_status_and_message_paths_agree(app, status, kind):
+    assert app.classify_error(_http_error(status)) == kind
+    assert app.classify_error(Exception(f"ERROR: unable to download video data: HTTP Error {status}: x")) == kind
+
+
+def test_403_on_expired_signed_url_is_expired(app):
+    expired = f"https://rr1---sn.googlevideo.com/videoplayback?expire={int(time.time()) - 60}"
+    assert app.classify_error(_http_error(403, expired)) == app.ERROR_EXPIRED
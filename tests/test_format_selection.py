@@ -0,0 +1,82 @@
+import types
+
+import pytest
+
+
+def _formats():
+    return [
+        {'id': '137', 'vcodec': 'avc1.640028', 'acodec': 'none', 'height': 1080, 'tbr': 4000,
+         'filesize_bytes': 300 * 1024 * 1024},
+        {'id': '22', 'vcodec': 'avc1.64001F', 'acodec': 'none', 'height': 720, 'tbr': 1500,
+         'filesize_bytes': 110 * 1024 * 1024},
+        {'id': '140', 'vcodec': 'none', 'acodec': 'mp4a.40.2', 'tbr': 128, 'filesize_bytes': 9 * 1024 * 1024},
+    ]
+
+
+def test_cap_uses_bitrate_when_duration_is_unknown(app):
+    engine = app.FormatSelectionEngine(app.FormatPolicy(max_mb_per_minute=15))
+    choice = engine.select({'key': 'v', 'duration': None, 'formats': _formats()})
+    # 1500+128 kbps ≈ 11.6 MB/min يتسع، 4000+128 kbps ≈ 29.5 MB/min لا يتسع
+    assert choice['format'] == '22+140'
+
+
+def test_cap_excludes_formats_without_duration_or_bitrate(app):
+    formats = [dict(fmt, tbr=None) for fmt in _formats()]
+    engine = app.FormatSelectionEngine(app.FormatPolicy(max_mb_per_minute=1000))
+    assert engine.select({'key': 'v', 'duration': None, 'formats': formats}) is None
+
+
+def test_item_from_info_maps_raw_formats(app):
+    info = {'id': 'abc', 'duration': 60, 'formats': [
+        {'format_id': '22', 'vcodec': 'avc1', 'acodec': 'none', 'height': 720, 'tbr': 1500, 'filesize': 10},
+        {'format_id': '140', 'vcodec': 'none', 'acodec': 'mp4a', 'tbr': 128, 'filesize_approx': 5},
+    ]}
+    item = app.FormatSelectionEngine.item_from_info(info)
+    assert item['key'] == 'abc' and item['duration'] == 60
+    assert [fmt['filesize_bytes'] for fmt in item['formats']] == [10, 5]
+    assert app.FormatSelectionEngine(app.FormatPolicy()).select(item)['format'] == '22+140'
+
+
+def _cli(**overrides):
+    values = {'format': None, 'max_mb_per_minute': None, 'max_height': None, 'remux_container': None,
+              'audio_codec': None, 'full_decode': False}
+    values.update(overrides)
+    return types.SimpleNamespace(**values)
+
+
+def test_queue_options_carry_format_policy(app):
+    options = app._queue_job_options(_cli(max_height=720, remux_container='mp4'))
+    assert options == {'format_policy': {'max_height': 720, 'remux_container': 'mp4'}}
+
+
+def test_queue_options_reject_format_with_policy(app):
+    with pytest.raises(ValueError):
+        app._queue_job_options(_cli(format='best', max_height=720))
+
+
+def test_worker_applies_policy_only_for_its_download(app):
+    import yt_dlp
+    ydl = yt_dlp.YoutubeDL({'quiet': True})
+    default_selector = ydl.format_selector
+    worker = app.YtdlpWorker(url='https://example.com/v', download_options={'format_policy': {'max_height': 720}})
+    info = {'id': 'abc', 'duration': 60, 'formats': [
+        {'format_id': '137', 'vcodec': 'avc1', 'acodec': 'none', 'height': 1080, 'tbr': 4000, 'filesize': 30},
+        {'format_id': '22', 'vcodec': 'avc1', 'acodec': 'none', 'height': 720, 'tbr': 1500, 'filesize': 10},
+        {'format_id': '140', 'vcodec': 'none', 'acodec': 'mp4a', 'tbr': 128, 'filesize': 5},
+    ]}
+    with worker._policy_format(ydl, info) as selected:
+        assert [fmt['format_id'] for fmt in selected['requested_formats']] == ['22', '140']
+        assert ydl.format_selector is not default_selector
+    assert ydl.format_selector is default_selector
+    ydl.close()
+
+
+@pytest.mark.parametrize('overrides', [{'format': 'bestvideo+bestaudio'}, {'max_height': 720}])
+def test_queue_options_reject_audio_codec_with_explicit_format(app, overrides):
+    with pytest.raises(ValueError):
+        app._queue_job_options(_cli(audio_codec='mp3', **overrides))
+
+
+def test_queue_options_audio_codec_selects_audio(app):
+    options = app._queue_job_options(_cli(audio_codec='mp3'))
+    assert options['format'] == app.audio_download_options('mp3')['format']
@@ -0,0 +1,32 @@
+import hashlib
+import os
+
+
+def _progress(hasher, path, size):
+    hasher.on_progress({'status': 'downloading', 'filename': path, 'tmpfilename': path, 'downloaded_bytes': size})
+    hasher.on_progress({'status': 'finished', 'filename': path})
+
+
+def test_duplicate_finished_does_not_rehash(app, tmp_path):
+    path = tmp_path / 'clip.mp4'
+    path.write_bytes(b'a' * 4096)
+    hasher = app.StreamingHasher()
+    _progress(hasher, str(path), 4096)
+    hasher.on_progress({'status': 'finished', 'filename': str(path)})
+    assert hasher.digests[str(path)] == hashlib.sha256(b'a' * 4096).hexdigest()
+    assert hasher.digest_for(str(path), str(path)) == hasher.digests[str(path)]
+
+
+def test_digest_invalidated_when_postprocessor_rewrites_file(app, tmp_path):
+    path = tmp_path / 'clip.m4a'
+    path.write_bytes(b'a' * 4096)
+    hasher = app.StreamingHasher()
+    _progress(hasher, str(path), 4096)
+    # معالج لاحق (مثل FFmpegFixupM4aPP) يكتب ملفاً جديداً ثم يستبدل الأصلي
+    fixed = tmp_path / 'clip.temp.m4a'
+    fixed.write_bytes(b'b' * 4000)
+    os.replace(fixed, path)
+    assert hasher.digest_for(str(path), str(path)) is None
+    report = app.verify_media_integrity(str(path))
+    assert report['sha256'] == hashlib.sha256(b'b' * 4000).hexdigest()
+    assert report['decoded'] is None
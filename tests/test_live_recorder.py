@@ -0,0 +1,67 @@
+import json
+import os
+
+
+def _record(app, stand_in_handler, **kwargs):
+    server = app.start_stand_in_server(stand_in_handler)
+    url = f"http://127.0.0.1:{server.server_address[1]}/master.m3u8"
+    removed = []
+    recorder = app.LiveRecorder(url, job_id='live-test', max_segment_seconds=2, on_segment_removed=removed.append,
+                                **kwargs)
+    try:
+        segments = recorder.record(max_duration=3.5)
+    finally:
+        server.shutdown()
+    return recorder, segments, removed
+
+
+def test_records_rolling_segments_and_drops_retained(app, workdir):
+    class Handler(app._LiveHlsHandler):
+        segment_seconds = 0.5
+        segment_bytes = 1024
+
+    recorder, segments, removed = _record(app, Handler, retain_segments=1)
+    assert recorder.segment_count >= 2
+    assert len(segments) == 1 and os.path.exists(segments[0])
+    assert removed and not any(os.path.exists(path) for path in removed)
+    indexed = app.ARTIFACT_INDEX.get('live-test')['segment']
+    assert indexed == segments
+    manifest = segments[0].rsplit('.live-', 1)[0] + '.live.jsonl'
+    with open(manifest, encoding='utf-8') as fh:
+        lines = [json.loads(line) for line in fh]
+    assert {line['path'] for line in lines if 'removed_at' in line} == set(removed)
+
+
+def test_missing_segments_are_skipped(app, workdir):
+    class Handler(app._LiveHlsHandler):
+        segment_seconds = 0.5
+        segment_bytes = 1024
+
+        def do_GET(self):
+            # كل ثالث مقطع خرج من النافذة قبل طلبه
+            if self.path.startswith('/seg-') and int(self.path[5:-3]) % 3 == 0:
+                self.send_error(404)
+                return
+            super().do_GET()
+
+    recorder, segments, _removed = _record(app, Handler)
+    assert recorder.skipped_segments >= 1
+    assert segments and recorder.bytes_recorded > 0
+
+
+def test_gui_recording_has_a_default_retention_cap(app, monkeypatch):
+    captured = {}
+
+    class Recorder:
+        def __init__(self, url, name_template, **kwargs):
+            captured.update(kwargs)
+
+        def record(self, stop_event):
+            return []
+
+    monkeypatch.setattr(app, 'LiveRecorder', Recorder)
+    worker = app.YtdlpWorker(url='https://www.youtube.com/watch?v=dQw4w9WgXcQ')
+    worker._record_live({'title_slug': 'live', 'live_record': True})
+    assert captured['retain_segments'] == app.LIVE_RETAIN_SEGMENTS
+    worker._record_live({'title_slug': 'live', 'live_record': True, 'retain_segments': 3})
+    assert captured['retain_segments'] == 3
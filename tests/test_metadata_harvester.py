@@ -0,0 +1,17 @@
+def _harvester(app, tmp_path):
+    harvester = app.MetadataHarvester(['thumbnail'], layout=app.OutputLayout('flat', str(tmp_path)), max_workers=1)
+    harvester._fetch_thumbnail = lambda info: (b'\xff\xd8', 'jpg')
+    return harvester
+
+
+def test_thumbnail_only_harvest_names_files_by_id_without_title(app, tmp_path):
+    results, errors = _harvester(app, tmp_path).harvest(['https://www.youtube.com/watch?v=dQw4w9WgXcQ'])
+    assert not errors
+    assert results[0]['artifacts']['thumbnail'] == str(tmp_path / '[dQw4w9WgXcQ].jpg')
+    assert (tmp_path / '[dQw4w9WgXcQ].jpg').read_bytes() == b'\xff\xd8'
+
+
+def test_known_title_keeps_the_title_template(app, tmp_path):
+    results, _errors = _harvester(app, tmp_path).harvest(['https://www.youtube.com/watch?v=dQw4w9WgXcQ'],
+                                                         seed_info={'title': 'Talk'})
+    assert results[0]['artifacts']['thumbnail'] == str(tmp_path / 'Talk [dQw4w9WgXcQ].jpg')
@@ -0,0 +1,88 @@
+import os
+import threading
+
+import pytest
+
+
+def test_layout_templates_and_unknown_name(app, monkeypatch):
+    assert app.OutputLayout('flat').output_template('x') == 'x.%(ext)s'
+    assert app.OutputLayout('id_prefix').output_template('x') == '%(id).2s/x.%(ext)s'
+    monkeypatch.setenv(app.OUTPUT_LAYOUT_ENV_VAR, 'channel')
+    assert app.OutputLayout().name == 'channel'
+    with pytest.raises(ValueError):
+        app.OutputLayout('by-color')
+
+
+def test_temp_paths_map_to_their_final_place(app, tmp_path):
+    layout = app.OutputLayout('date', str(tmp_path / 'downloads'))
+    temp_file = os.path.join(layout.temp_root, '2024', '05', 'clip.mp4')
+    assert layout.to_final_path(temp_file) == os.path.join(layout.root, '2024', '05', 'clip.mp4')
+    outside = str(tmp_path / 'elsewhere' / 'clip.mp4')
+    assert layout.to_final_path(outside) == outside
+    assert layout.to_final_path(None) is None
+
+
+def test_atomic_output_path_renames_on_success(app, tmp_path):
+    final = tmp_path / 'sub' / 'out.json'
+    with app.atomic_output_path(str(final)) as temp_path:
+        assert os.path.dirname(temp_path) == str(final.parent)
+        assert temp_path.endswith('.json') and os.path.basename(temp_path).startswith('.')
+        with open(temp_path, 'w') as fh:
+            fh.write('new')
+        assert not final.exists()
+    assert final.read_text() == 'new'
+    assert os.listdir(final.parent) == ['out.json']
+
+
+def test_atomic_output_path_keeps_previous_file_on_failure(app, tmp_path):
+    final = tmp_path / 'out.json'
+    final.write_text('old')
+    with pytest.raises(RuntimeError):
+        with app.atomic_output_path(str(final)) as temp_path:
+            with open(temp_path, 'w') as fh:
+                fh.write('half')
+            raise RuntimeError('writer crashed')
+    assert final.read_text() == 'old'
+    assert os.listdir(tmp_path) == ['out.json']
+
+
+def test_concurrent_writers_of_one_path_do_not_share_a_temp_file(app, tmp_path):
+    final = str(tmp_path / 'rates.json')
+    both_open = threading.Barrier(2)
+    temp_paths, errors = [], []
+
+    def write(content):
+        try:
+            with app.atomic_output_path(final) as temp_path:
+                temp_paths.append(temp_path)
+                with open(temp_path, 'w') as fh:
+                    fh.write(content)
+                    both_open.wait(5)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(content,)) for content in ('a' * 1000, 'b' * 10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors and len(set(temp_paths)) == 2
+    with open(final) as fh:
+        assert fh.read() in ('a' * 1000, 'b' * 10)
+    assert os.listdir(tmp_path) == ['rates.json']
+
+
+def test_artifact_index_deduplicates_evicts_and_removes(app):
+    index = app.ArtifactIndex(max_jobs=2)
+    index.add(1, 'media', 'a.mp4')
+    index.add(1, 'media', 'a.mp4')
+    index.add(1, 'thumbnail', 'a.jpg')
+    assert index.get(1) == {'media': ['a.mp4'], 'thumbnail': ['a.jpg']}
+    index.get(1)['media'].append('mutated')
+    assert index.first(1, 'media') == 'a.mp4'
+    index.add(2, 'media', 'b.mp4')
+    index.add(1, 'description', 'a.description')  # المهمة 1 أحدث استخداماً الآن
+    index.add(3, 'media', 'c.mp4')
+    assert index.get(2) == {} and index.first(1, 'media') == 'a.mp4'
+    index.remove(1, 'a.mp4')
+    assert index.first(1, 'media') is None and index.first(3, 'media') == 'c.mp4'
@@ -0,0 +1,30 @@
+def _download(pool, url, hook, outtmpl):
+    opts = {'quiet': True, 'noprogress': True, 'format': 'best',
+            'outtmpl': outtmpl, 'progress_hooks': [hook]}
+    with pool.session(opts) as ydl:
+        ydl.extract_info(url, download=True)
+
+
+def test_hooks_run_once_and_only_for_their_own_job(app, workdir, stand_in):
+    pool = app.YdlSessionPool()
+    calls = {'first': [], 'second': []}
+
+    _download(pool, f"{stand_in}/v/one.mp4",
+              lambda d: calls['first'].append(d['status']), 'one.%(ext)s')
+    _download(pool, f"{stand_in}/v/two.mp4",
+              lambda d: calls['second'].append(d['status']), 'two.%(ext)s')
+
+    assert calls['first'].count('finished') == 1
+    assert calls['second'].count('finished') == 1
+    # الجلسة نفسها أُعيد استخدامها، ولم يُستدعَ hook المهمة الأولى أثناء الثانية
+    assert len(calls['first']) == len(calls['second'])
+    assert sum(len(idle) for idle in pool._idle.values()) == 1
+    pool.close_all()
+
+
+def test_session_does_not_keep_job_hooks_registered(app):
+    pool = app.YdlSessionPool()
+    hook = lambda d: None
+    with pool.session({'quiet': True, 'progress_hooks': [hook]}) as ydl:
+        assert hook not in ydl._progress_hooks
+    pool.close_all()
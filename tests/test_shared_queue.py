@@ -0,0 +1,78 @@
+import json
+import os
+import subprocess
+import sys
+import time
+import weakref
+
+from conftest import ROOT
+
+CLAIMER = """
+import importlib.util, json, sys
+spec = importlib.util.spec_from_file_location('ytdlp_gui', sys.argv[1])
+app = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(app)
+queue = app.SharedJobQueue(sys.argv[2])
+claimed = []
+while True:
+    job = queue.claim(sys.argv[3], host='test-host')
+    if job is None:
+        break
+    claimed.append(job['id'])
+    queue.complete(job['id'], sys.argv[3], {'by': sys.argv[3]})
+queue.close()
+print(json.dumps(claimed))
+"""
+
+
+def test_two_processes_never_claim_the_same_job(app, tmp_path):
+    db_path = str(tmp_path / 'queue.sqlite3')
+    queue = app.SharedJobQueue(db_path)
+    ids = queue.enqueue_many([f'https://www.youtube.com/watch?v={n:011d}' for n in range(200)])
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+    processes = [subprocess.Popen([sys.executable, '-c', CLAIMER, os.path.join(ROOT, 'yt-dlp.py'), db_path, name],
+                                  stdout=subprocess.PIPE, env=env, text=True)
+                 for name in ('worker-a', 'worker-b')]
+    claimed = [json.loads(process.communicate(timeout=120)[0]) for process in processes]
+    assert all(process.returncode == 0 for process in processes)
+    assert not set(claimed[0]) & set(claimed[1])
+    assert sorted(claimed[0] + claimed[1]) == sorted(ids)
+    assert queue.stats() == {'done': 200}
+    queue.close()
+
+
+def test_expired_lease_moves_to_another_worker(app, tmp_path):
+    queue_a = app.SharedJobQueue(str(tmp_path / 'queue.sqlite3'))
+    queue_b = app.SharedJobQueue(str(tmp_path / 'queue.sqlite3'))
+    [job_id] = queue_a.enqueue_many(['https://www.youtube.com/watch?v=dQw4w9WgXcQ'])
+    assert queue_a.claim('worker-a', host='test-host', lease_seconds=0.2)['id'] == job_id
+    assert queue_b.claim('worker-b', host='test-host') is None
+    time.sleep(0.3)
+    job = queue_b.claim('worker-b', host='test-host')
+    assert job['id'] == job_id and job['attempts'] == 2
+    # العامل الأول فقد المطالبة ولا يستطيع إنهاء المهمة
+    assert not queue_a.heartbeat(job_id, 'worker-a')
+    queue_a.complete(job_id, 'worker-a')
+    assert queue_b.stats() == {'running': 1}
+    queue_a.close()
+    queue_b.close()
+
+
+def test_headless_job_releases_its_worker(app, workdir, stand_in, monkeypatch):
+    workers = []
+
+    class Worker(app.YtdlpWorker):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            workers.append(weakref.ref(self))
+
+    monkeypatch.setattr(app, 'YtdlpWorker', Worker)
+    queue = app.SharedJobQueue(str(workdir / 'queue.sqlite3'))
+    queue.enqueue(f"{stand_in}/video/1.mp4")
+    app._run_queue_job(queue, queue.claim('worker-a'), 'worker-a', 60)
+    assert queue.stats() == {'done': 1}
+    deadline = time.monotonic() + 5
+    while workers[0]() is not None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert workers[0]() is None
+    queue.close()
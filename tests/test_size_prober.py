@@ -0,0 +1,27 @@
+import http.client
+
+
+def _fmt(url, format_id='mp4'):
+    return {'format_id': format_id, 'url': url, 'protocol': 'http', 'tbr': 800}
+
+
+def test_cache_is_keyed_by_source_url(app, stand_in):
+    prober = app.SizeProber()
+    first = prober.probe(f'{stand_in}/a', [_fmt(f'{stand_in}/a.mp4')], 10)
+    assert first['mp4'][1] == 'probed'
+    prober._head_size = lambda fmt: 1
+    # المستخرج العام: نفس معرّف الصيغة لفيديو آخر لا يأخذ حجم الأول من المخبأ
+    second = prober.probe(f'{stand_in}/b', [_fmt(f'{stand_in}/b.mp4')], 10)
+    assert second['mp4'] == (1, 'probed')
+    assert prober.probe(f'{stand_in}/a', [_fmt(f'{stand_in}/a.mp4')], 10) == first
+
+
+def test_http_exceptions_fall_back_to_bitrate_estimate(app):
+    prober = app.SizeProber()
+
+    def incomplete(_fmt):
+        raise http.client.IncompleteRead(b'')
+
+    prober._head_size = incomplete
+    sizes = prober.probe('https://example.invalid/v', [_fmt('https://example.invalid/v.mp4')], 10)
+    assert sizes['mp4'] == (app.SizeProber.bitrate_estimate(_fmt(''), 10), 'estimated')
@@ -0,0 +1,12 @@
+def test_theme_benchmark_smoke(app, qapp, workdir, capsys):
+    first_paint, timings = app.run_theme_benchmark(iterations=4)
+    assert first_paint > 0
+    assert len(timings) == 4 and timings == sorted(timings)
+    assert 'theme switch (4x)' in capsys.readouterr().out
+
+
+def test_compiled_stylesheets_differ_per_theme(app):
+    light, dark = app.compile_theme_stylesheet('light'), app.compile_theme_stylesheet('dark')
+    assert light and dark and light != dark
+    # الأزرار تُلوَّن من الورقة العامة عبر محددات الخاصية variant
+    assert 'variant' in light and 'variant' in dark
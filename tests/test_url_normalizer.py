@@ -0,0 +1,17 @@
+import pytest
+
+
+@pytest.mark.parametrize('url', [
+    'https://www.youtube.com/@SomeChannel',
+    'youtube.com/@somechannel/videos',
+    'https://m.youtube.com/@SOMECHANNEL',
+])
+def test_channel_handles_are_case_insensitive(app, url):
+    canonical = app.URL_NORMALIZER.normalize(url)
+    assert canonical.key == 'youtube:@somechannel'
+    assert canonical.url == 'https://www.youtube.com/@somechannel'
+
+
+def test_channel_ids_keep_their_case(app):
+    channel_id = 'UCabcDEFghiJKLmnoPQRstuv'
+    assert app.URL_NORMALIZER.normalize(f'https://www.youtube.com/channel/{channel_id}').id == channel_id
@@ -0,0 +1,120 @@
+import threading
+import time
+
+from PyQt6 import sip
+from PyQt6.QtCore import QCoreApplication, QEvent
+
+
+def _flush_deletes():
+    QCoreApplication.sendPostedEvents(None, QEvent.Type.DeferredDelete.value)
+
+
+def test_reset_application_releases_download_worker(app, qapp, workdir):
+    gui = app.YtdlpGui()
+    worker = app.YtdlpWorker(url='https://www.youtube.com/watch?v=dQw4w9WgXcQ')
+    worker.finished.connect(gui._on_worker_finished)
+    gui.download_worker = worker
+    gui.reset_application()
+    _flush_deletes()
+    assert gui.download_worker is None
+    assert sip.isdeleted(worker)
+    gui.close()
+    gui.deleteLater()
+    _flush_deletes()
+
+
+def test_soak_releases_every_worker(app, qapp, workdir):
+    samples = app.run_soak_test(12, concurrency=3, sample_every=6)
+    _finished, _rss, _threads, active, _history = samples[-1]
+    assert active == 0
+    assert not app.JOB_REGISTRY.active
+
+
+def test_profile_peak_is_per_job_when_jobs_run_alone(app, workdir, monkeypatch):
+    monkeypatch.setenv(app.PROFILE_ENV_VAR, '1')
+    peaks = []
+    monkeypatch.setattr(app, '_write_profile_report',
+                        lambda name, profiler, elapsed, peak, top, shared=False: peaks.append((peak, shared)))
+
+    class Job:
+        def __init__(self, size):
+            self.size = size
+
+        @app.profiled_run
+        def run(self):
+            return len(bytearray(self.size))
+
+    Job(32 * 1024 * 1024).run()
+    Job(1024).run()
+    (big, big_shared), (small, small_shared) = peaks
+    assert big >= 32 * 1024 * 1024 and not big_shared
+    assert small < 1024 * 1024 and not small_shared
+
+
+def test_overlapping_jobs_report_a_shared_process_peak(app, workdir, monkeypatch):
+    monkeypatch.setenv(app.PROFILE_ENV_VAR, '1')
+    shared = {}
+    monkeypatch.setattr(app, '_write_profile_report',
+                        lambda name, profiler, elapsed, peak, top, shared_peak=False: shared.update({name: shared_peak}))
+    release = threading.Event()
+
+    class Job:
+        def __init__(self, wait):
+            self.wait = wait
+
+        @app.profiled_run
+        def run(self):
+            if self.wait:
+                release.wait(5)
+
+    first = threading.Thread(target=Job(True).run)
+    first.start()
+    while not app._active_profiles:
+        time.sleep(0.01)
+    Job(False).run()
+    release.set()
+    first.join()
+    assert list(shared.values()) == [True, True]
+
+
+def test_second_cpu_profiler_is_skipped_not_fatal(app, workdir, monkeypatch):
+    monkeypatch.setenv(app.PROFILE_ENV_VAR, '1')
+
+    class BusyProfiler(app.cProfile.Profile):
+        def enable(self, *args, **kwargs):
+            raise ValueError('Another profiling tool is already active')
+
+    monkeypatch.setattr(app.cProfile, 'Profile', BusyProfiler)
+
+    class Job:
+        @app.profiled_run
+        def run(self):
+            return 'done'
+
+    assert Job().run() == 'done'
+    assert not app._active_profiles and not app.tracemalloc.is_tracing()
+    [report] = (workdir / app.PROFILE_DIR).glob('*.txt')
+    assert 'CPU profile skipped' in report.read_text(encoding='utf-8')
+    assert not list((workdir / app.PROFILE_DIR).glob('*.prof'))
+
+
+def test_cancelled_download_reports_a_terminal_status(app, workdir, stand_in):
+    worker = app.YtdlpWorker(url=f"{stand_in}/video/1.mp4",
+                             download_options={'format': 'best', 'title_slug': '%(id)s'})
+    events = []
+    worker.download_cancelled.connect(lambda: events.append('cancelled'))
+    worker.download_error.connect(events.append)
+    worker.download_finished.connect(events.append)
+    worker.cancel_download()
+    worker.run()
+    assert events == ['cancelled'] and worker.job_status == 'cancelled'
+
+
+def test_job_list_trims_cancelled_rows(app, qapp):
+    model = app.JobListModel(max_rows=2)
+    model.add_jobs([{'job_id': 1, 'title': 'a', 'status': 'running'},
+                    {'job_id': 2, 'title': 'b', 'status': 'running'}])
+    model.update_job(1, status='cancelled')
+    model.add_jobs([{'job_id': 3, 'title': 'c'}])
+    assert [model.data(model.index(row), app.Qt.ItemDataRole.UserRole)['job_id'] for row in range(model.rowCount())] \
+        == [2, 3]
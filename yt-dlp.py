@@ -1,16 +1,41 @@
 import sys
+import argparse
 import re
 import random
 import time
 import os
+import errno
+import json
+import threading
+import contextlib
+import sqlite3
+import hashlib
+import functools
+import cProfile
+import pstats
+import tracemalloc
+import io
+import shutil
+import socket
+import subprocess
+import collections
+import itertools
+import http.client
+import http.server
+import concurrent.futures
+import urllib.error
+import urllib.parse
+import urllib.request
+from urllib.parse import urlsplit, parse_qs
 from PIL import Image
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QPushButton, QLineEdit, QStackedWidget, QProgressBar,
-    QComboBox, QCheckBox, QListWidget, QLabel, QListWidgetItem
+    QComboBox, QCheckBox, QListView, QLabel
 )
 from PyQt6.QtCore import (
-    Qt, QThread, pyqtSignal, QSize
+    Qt, QObject, QRunnable, QThreadPool, QCoreApplication, QTimer, pyqtSignal, QSize,
+    QAbstractListModel, QSortFilterProxyModel, QModelIndex
 )
 from PyQt6.QtGui import QFont
 
@@ -76,23 +101,20 @@ THEMES = {
 # ----------------------------------------------------------------------
 ## 2. تصميم الزر المخصص (CustomButton)
 # ----------------------------------------------------------------------
-class CustomButton(QPushButton):
-    """زر مع تأثير Hover/Press باستخدام QSS."""
-    def __init__(self, text, parent=None):
-        super().__init__(text, parent)
-        self.setCursor(Qt.CursorShape.PointingHandCursor)
-        self.setMinimumHeight(40)
-        font = QFont()
-        font.setPointSize(10)
-        self.setFont(font)
+# ألوان كل نوع من الأزرار (عادي، هوفر، ضغط) كمفاتيح في THEMES
+BUTTON_VARIANTS = {
+    'success': ('PRIMARY', 'PRIMARY_HOVER', 'PRIMARY_PRESS'),
+    'warning': ('WARNING', 'WARNING_HOVER', 'WARNING_PRESS'),
+    'danger': ('DANGER', 'DANGER_HOVER', 'DANGER_PRESS'),
+    'theme': ('THEME_BUTTON_COLOR', 'THEME_BUTTON_COLOR', 'THEME_BUTTON_COLOR'),
+}
 
-    def set_theme_colors(self, color, hover_color, press_color):
-        self.setStyleSheet(self.get_style_sheet(color, hover_color, press_color))
 
-    def get_style_sheet(self, color, hover_color, press_color):
-        """توليد ورقة الأنماط للزر."""
-        return f"""
-            QPushButton {{
+def _button_style_sheet(variant, color, hover_color, press_color):
+    """توليد قواعد الأنماط لنوع زر واحد (يُختار عبر الخاصية الديناميكية variant)."""
+    selector = f'QPushButton[variant="{variant}"]'
+    return f"""
+            {selector} {{
                 background-color: {color};
                 color: white;
                 border: none;
@@ -104,48 +126,1229 @@ class CustomButton(QPushButton):
                 border-radius: 8px;
                 font-weight: bold;
             }}
-            QPushButton:hover {{
+            {selector}:hover {{
                 background-color: {hover_color};
                 border: 1px solid #ffffff30;
             }}
-            QPushButton:pressed {{
+            {selector}:pressed {{
                 background-color: {press_color};
                 padding-left: 14px;
                 padding-right: 16px;
                 border: none;
             }}
-            QPushButton:disabled {{
+            {selector}:disabled {{
                 background-color: #555555;
                 color: #aaaaaa;
                 font-weight: normal;
             }}
         """
 
-    def set_warning_style(self, theme):
-        self.set_theme_colors(theme['WARNING'], theme['WARNING_HOVER'], theme['WARNING_PRESS'])
 
-    def set_danger_style(self, theme):
-        self.set_theme_colors(theme['DANGER'], theme['DANGER_HOVER'], theme['DANGER_PRESS'])
+@functools.lru_cache(maxsize=None)
+def compile_theme_stylesheet(theme_name):
+    """ترجمة ورقة الأنماط الكاملة للوضع مرة واحدة فقط (تُخزَّن مؤقتاً)."""
+    theme = THEMES[theme_name]
+    global_style = f"""
+            QWidget {{
+                background-color: {theme['BG']};
+                color: {theme['FG']};
+                font-family: 'Arial', 'Segoe UI', sans-serif;
+            }}
+            QLineEdit, QComboBox, QListView {{
+                padding: 10px;
+                border: 2px solid #555555;
+                border-radius: 10px;
+                background-color: {theme['INPUT_BG']};
+                color: {theme['FG']};
+            }}
+            QListView::item:selected {{
+                background-color: {theme['PROGRESS_BAR']};
+                color: white;
+            }}
+            QLabel#header {{
+                font-size: 24px;
+                font-weight: 800;
+                color: {theme['HEADER']};
+                margin-bottom: 20px;
+            }}
+            QProgressBar {{
+                border: 2px solid {theme['FG']};
+                border-radius: 10px;
+                text-align: center;
+                background-color: {theme['INPUT_BG']};
+                color: {theme['FG']};
+                font-weight: bold;
+            }}
+            QProgressBar::chunk {{
+                background-color: {theme['PROGRESS_BAR']};
+                border-radius: 8px;
+            }}
+            QCheckBox {{
+                color: {theme['FG']};
+                spacing: 8px;
+                padding: 5px;
+            }}
+        """
+    button_styles = [_button_style_sheet(variant, *(theme[key] for key in keys))
+                     for variant, keys in BUTTON_VARIANTS.items()]
+    return global_style + ''.join(button_styles)
+
+
+class CustomButton(QPushButton):
+    """زر مع تأثير Hover/Press باستخدام QSS (الألوان من ورقة الأنماط العامة حسب variant)."""
+    def __init__(self, text, parent=None, variant='success'):
+        super().__init__(text, parent)
+        self.setCursor(Qt.CursorShape.PointingHandCursor)
+        self.setMinimumHeight(40)
+        font = QFont()
+        font.setPointSize(10)
+        self.setFont(font)
+        self.setProperty('variant', variant)
+
+    def set_variant(self, variant):
+        """تغيير نوع الزر وإعادة تطبيق الأنماط عليه وحده."""
+        if self.property('variant') == variant:
+            return
+        self.setProperty('variant', variant)
+        self.style().unpolish(self)
+        self.style().polish(self)
+
+    def set_warning_style(self):
+        self.set_variant('warning')
+
+    def set_danger_style(self):
+        self.set_variant('danger')
+
+    def set_success_style(self):
+        self.set_variant('success')
+
+# ----------------------------------------------------------------------
+## 1.1 توحيد الروابط والمعرّفات (URL Normalization)
+# ----------------------------------------------------------------------
+YOUTUBE_HOSTS = frozenset({
+    'youtube.com', 'www.youtube.com', 'm.youtube.com', 'music.youtube.com',
+    'youtube-nocookie.com', 'www.youtube-nocookie.com',
+})
+SHORT_LINK_HOSTS = frozenset({'youtu.be', 'www.youtu.be'})
+
+# أنماط مُترجمة مسبقاً مرة واحدة
+VIDEO_ID_RE = re.compile(r'[A-Za-z0-9_-]{11}')
+PLAYLIST_ID_RE = re.compile(r'[A-Za-z0-9_-]{2,64}')
+CHANNEL_ID_RE = re.compile(r'UC[A-Za-z0-9_-]{22}')
+VIDEO_PATH_RE = re.compile(r'/(shorts|embed|live|v|e)/(?!videoseries)([A-Za-z0-9_-]{11})(?:[/?#]|$)')
+CHANNEL_PATH_RE = re.compile(r'/(?:(channel)/([^/?#]+)|(@[^/?#]+)|(c|user)/([^/?#]+))')
+SCHEME_RE = re.compile(r'^[a-zA-Z][a-zA-Z0-9+.-]*://')
+
+# نوع الرابط حسب المسار
+VIDEO_PATH_KINDS = {'shorts': 'short', 'embed': 'video', 'live': 'live', 'v': 'video', 'e': 'video'}
+
+
+class CanonicalUrl(collections.namedtuple('CanonicalUrl', 'extractor id kind')):
+    """الصيغة الموحدة للرابط: (المستخرج، المعرّف، النوع)."""
+    __slots__ = ()
+
+    @property
+    def key(self):
+        """مفتاح ثابت للمخابئ وإزالة التكرار والفهارس."""
+        return f"{self.extractor}:{self.id}"
+
+    @property
+    def url(self):
+        """الرابط القانوني الذي يُمرَّر إلى yt-dlp."""
+        if self.kind == 'playlist':
+            return f"https://www.youtube.com/playlist?list={self.id}"
+        if self.kind == 'channel':
+            if self.id.startswith('UC'):
+                return f"https://www.youtube.com/channel/{self.id}"
+            return f"https://www.youtube.com/{self.id}"
+        return f"https://www.youtube.com/watch?v={self.id}"
+
+
+class UrlNormalizer:
+    """تحويل كل أشكال روابط YouTube المدعومة إلى CanonicalUrl مع أسباب الرفض."""
+
+    def parse(self, url):
+        """تعيد (CanonicalUrl, None) أو (None, سبب الرفض) دون رفع استثناءات (للمعالجة بالجملة)."""
+        if not url or not url.strip():
+            return None, 'empty'
+        url = url.strip()
+        if not SCHEME_RE.match(url):
+            url = 'https://' + url
+        try:
+            parts = urlsplit(url)
+        except ValueError:
+            return None, 'malformed'
+        if parts.scheme not in ('http', 'https'):
+            return None, 'unsupported scheme'
+        host = (parts.hostname or '').lower()
+
+        if host in SHORT_LINK_HOSTS:
+            video_id = parts.path.strip('/').split('/')[0]
+            if VIDEO_ID_RE.fullmatch(video_id):
+                return CanonicalUrl('youtube', video_id, 'video'), None
+            return None, 'invalid video id'
+
+        if host not in YOUTUBE_HOSTS:
+            return None, 'unsupported host'
+
+        path = parts.path
+        query = parse_qs(parts.query) if parts.query else {}
+
+        # الفيديو له الأولوية على قائمة التشغيل (watch?v=...&list=...)
+        if path in ('/watch', '/watch/'):
+            video_id = query.get('v', [''])[0]
+            if VIDEO_ID_RE.fullmatch(video_id):
+                return CanonicalUrl('youtube', video_id, 'video'), None
+            if 'list' not in query:
+                return None, 'invalid video id'
+
+        match = VIDEO_PATH_RE.match(path)
+        if match:
+            return CanonicalUrl('youtube', match.group(2), VIDEO_PATH_KINDS[match.group(1)]), None
+
+        playlist_id = query.get('list', [''])[0]
+        if playlist_id:
+            if PLAYLIST_ID_RE.fullmatch(playlist_id):
+                return CanonicalUrl('youtube', playlist_id, 'playlist'), None
+            return None, 'invalid playlist id'
+
+        match = CHANNEL_PATH_RE.match(path)
+        if match:
+            if match.group(1):
+                if CHANNEL_ID_RE.fullmatch(match.group(2)):
+                    return CanonicalUrl('youtube', match.group(2), 'channel'), None
+                return None, 'invalid channel id'
+            if match.group(3):
+                # المعرّفات المختصرة (@handle) لا تميّز حالة الأحرف: @Foo و @foo القناة نفسها
+                return CanonicalUrl('youtube', match.group(3).lower(), 'channel'), None
+            return CanonicalUrl('youtube', f"{match.group(4)}/{match.group(5)}", 'channel'), None
+
+        return None, 'unsupported path'
+
+    def normalize(self, url):
+        """توحيد رابط واحد؛ يرفع ValueError مع سبب الرفض."""
+        canonical, reason = self.parse(url)
+        if canonical is None:
+            raise ValueError(f"رابط غير مدعوم ({reason}): {url}")
+        return canonical
+
+    def normalize_batch(self, urls):
+        """توحيد قائمة روابط دفعة واحدة مع إزالة التكرار.
+
+        تعيد (قائمة CanonicalUrl بترتيب أول ظهور، قائمة (الرابط، السبب) المرفوضة).
+        """
+        accepted, rejects, seen = [], [], set()
+        parse = self.parse
+        for url in urls:
+            canonical, reason = parse(url)
+            if canonical is None:
+                rejects.append((url, reason))
+            elif canonical.key not in seen:
+                seen.add(canonical.key)
+                accepted.append(canonical)
+        return accepted, rejects
+
+
+URL_NORMALIZER = UrlNormalizer()
+
+# ----------------------------------------------------------------------
+## 2.1 مجمع جلسات yt-dlp (Session Pool)
+# ----------------------------------------------------------------------
+# مفاتيح تتغير من مهمة لأخرى ولا تدخل في تحديد "ملف الخيارات" (Profile) للجلسة
+PER_JOB_YDL_KEYS = ('outtmpl', 'progress_hooks', 'postprocessor_hooks', 'writedescription',
+                    'writethumbnail', 'skip_download', 'paths')
+
+
+class _YdlSession:
+    """جلسة YoutubeDL طويلة العمر مع عدّاد الاستخدام ومُوزِّع للـ hooks الخاصة بالمهمة الحالية."""
+    def __init__(self, ydl_opts):
+        # نمرر نسخة بدون خيارات المهمة (YoutubeDL يعدّل القاموس ويسجّل الـ hooks مدى حياة الجلسة)؛
+        # خيارات المهمة تُطبَّق لكل استعارة في _prepare_for_job والـ hooks تمر عبر الموزِّعين فقط
+        self.ydl = yt_dlp.YoutubeDL({k: v for k, v in ydl_opts.items() if k not in PER_JOB_YDL_KEYS})
+        self.uses = 0
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.broken = False
+        self.job_progress_hooks = []
+        self.job_postprocessor_hooks = []
+        # نسجّل hook واحداً ثابتاً عند الإنشاء ثم نوجّهه لمهمة الاستخدام الحالي
+        self.ydl.add_progress_hook(self._dispatch_progress)
+        self.ydl.add_postprocessor_hook(self._dispatch_postprocessor)
+
+    def _dispatch_progress(self, d):
+        for hook in self.job_progress_hooks:
+            hook(d)
+
+    def _dispatch_postprocessor(self, d):
+        for hook in self.job_postprocessor_hooks:
+            hook(d)
+
+    def close(self):
+        try:
+            self.ydl.close()
+        except Exception:
+            pass
+
+
+class YdlSessionPool:
+    """مجمع جلسات YoutubeDL مُجمَّعة حسب ملف الخيارات.
+
+    يحافظ على اتصالات HTTP ومخابئ المستخرجات (extractors) دافئة بين المهام،
+    ويعيد تدوير الجلسة بعد عدد محدد من الاستخدامات أو بعد فترة خمول طويلة.
+    """
+    def __init__(self, max_uses=50, max_idle_seconds=300, max_idle_per_profile=2):
+        self.max_uses = max_uses
+        self.max_idle_seconds = max_idle_seconds
+        self.max_idle_per_profile = max_idle_per_profile
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def profile_key(ydl_opts):
+        """مفتاح ثابت لملف الخيارات (بدون الخيارات الخاصة بكل مهمة)."""
+        profile = {k: v for k, v in ydl_opts.items() if k not in PER_JOB_YDL_KEYS}
+        return json.dumps(profile, sort_keys=True, default=repr)
+
+    def _is_healthy(self, session):
+        """فحص صلاحية الجلسة قبل إعادة استخدامها."""
+        if session.broken or session.uses >= self.max_uses:
+            return False
+        return time.monotonic() - session.last_used < self.max_idle_seconds
+
+    @contextlib.contextmanager
+    def session(self, ydl_opts):
+        """استعارة جلسة جاهزة لمهمة واحدة (بديل `with yt_dlp.YoutubeDL(ydl_opts)`)."""
+        key = self.profile_key(ydl_opts)
+        session = None
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle and session is None:
+                candidate = idle.pop()
+                if self._is_healthy(candidate):
+                    session = candidate
+                else:
+                    candidate.close()
+        if session is None:
+            session = _YdlSession(ydl_opts)
+
+        self._prepare_for_job(session, ydl_opts)
+        try:
+            yield session.ydl
+        except BaseException:
+            # أي خطأ (بما فيه الإلغاء عبر SystemExit) قد يترك الجلسة بحالة غير معروفة
+            session.broken = True
+            raise
+        finally:
+            session.job_progress_hooks = []
+            session.job_postprocessor_hooks = []
+            session.uses += 1
+            session.last_used = time.monotonic()
+            self._release(key, session)
+
+    def _prepare_for_job(self, session, ydl_opts):
+        """تطبيق الخيارات الخاصة بالمهمة على جلسة مُعاد استخدامها."""
+        params = session.ydl.params
+        for key in ('writedescription', 'writethumbnail', 'skip_download'):
+            params[key] = ydl_opts.get(key, False)
+        params['paths'] = ydl_opts.get('paths', {})
+        if 'outtmpl' in ydl_opts:
+            outtmpl = ydl_opts['outtmpl']
+            params['outtmpl']['default'] = outtmpl if isinstance(outtmpl, str) else outtmpl['default']
+        session.job_progress_hooks = list(ydl_opts.get('progress_hooks', []))
+        session.job_postprocessor_hooks = list(ydl_opts.get('postprocessor_hooks', []))
+
+    def _release(self, key, session):
+        if not self._is_healthy(session):
+            session.close()
+            return
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_profile:
+                idle.append(session)
+                return
+        session.close()
+
+    def close_all(self):
+        """إغلاق كل الجلسات الخاملة (عند إنهاء التطبيق)."""
+        with self._lock:
+            sessions = [s for idle in self._idle.values() for s in idle]
+            self._idle.clear()
+        for session in sessions:
+            session.close()
+
+
+# مجمع مشترك لكل العمال في التطبيق
+YDL_SESSION_POOL = YdlSessionPool()
+
+# ----------------------------------------------------------------------
+## 2.1.1 تخطيط مجلدات الإخراج وفهرس الملفات الناتجة (Output Layout)
+# ----------------------------------------------------------------------
+OUTPUT_ROOT = 'downloads'
+OUTPUT_TEMP_DIR = '.tmp'  # نسبي إلى OUTPUT_ROOT (نفس نظام الملفات => نقل ذري بإعادة التسمية)
+OUTPUT_LAYOUT_ENV_VAR = 'YTDLP_GUI_LAYOUT'
+
+# التقسيم إلى مجلدات فرعية عبر قوالب yt-dlp نفسها
+OUTPUT_LAYOUTS = {
+    'flat': '',
+    'id_prefix': '%(id).2s/',
+    'channel': '%(channel_id,uploader_id|unknown)s/',
+    'date': '%(upload_date>%Y|unknown)s/%(upload_date>%m|unknown)s/',
+}
+
+
+class OutputLayout:
+    """تخطيط مجلد الإخراج (مسطح أو مقسم حسب بادئة المعرّف أو القناة أو التاريخ)."""
+    def __init__(self, name=None, root=OUTPUT_ROOT):
+        name = name or os.environ.get(OUTPUT_LAYOUT_ENV_VAR, 'flat')
+        if name not in OUTPUT_LAYOUTS:
+            raise ValueError(f"تخطيط إخراج غير معروف: {name} (المتاح: {', '.join(OUTPUT_LAYOUTS)})")
+        self.name = name
+        self.root = root
+
+    @property
+    def temp_root(self):
+        return os.path.join(self.root, OUTPUT_TEMP_DIR)
+
+    def output_template(self, title_slug):
+        """قالب الإخراج النسبي داخل المجلد الجذر."""
+        return f"{OUTPUT_LAYOUTS[self.name]}{title_slug}.%(ext)s"
+
+    def ydl_paths(self):
+        """yt-dlp يكتب في المجلد المؤقت ثم ينقل الملفات المكتملة إلى مكانها النهائي."""
+        return {'home': self.root, 'temp': OUTPUT_TEMP_DIR}
+
+    def to_final_path(self, path):
+        """تحويل مسار داخل المجلد المؤقت إلى مساره النهائي بعد النقل."""
+        if not path:
+            return path
+        relative = os.path.relpath(os.path.abspath(path), os.path.abspath(self.temp_root))
+        if relative.startswith(os.pardir):
+            return path
+        return os.path.join(self.root, relative)
+
+
+OUTPUT_LAYOUT = OutputLayout()
+
+
+@contextlib.contextmanager
+def atomic_output_path(final_path):
+    """مسار مؤقت بجوار الملف النهائي يُعاد تسميته ذرياً عند النجاح ويُحذف عند الفشل.
+
+    اسم المؤقت خاص بالعملية والخيط: كاتبان متزامنان للملف نفسه لا يتشاركان ملفاً جزئياً،
+    وآخر من ينهي يحل محل الآخر كاملاً. الامتداد يبقى في النهاية (ffmpeg وPillow يستنتجان الصيغة منه).
+    """
+    directory, name = os.path.split(final_path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+    stem, ext = os.path.splitext(name)
+    temp_path = os.path.join(directory, f".{stem}.{os.getpid()}-{threading.get_ident()}.part{ext}")
+    try:
+        yield temp_path
+        os.replace(temp_path, final_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+class ArtifactIndex:
+    """فهرس في الذاكرة للملفات الناتجة عن كل مهمة (بحد أقصى لعدد المهام)."""
+    def __init__(self, max_jobs=200):
+        self.max_jobs = max_jobs
+        self._jobs = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, job_id, kind, path):
+        with self._lock:
+            artifacts = self._jobs.setdefault(job_id, {})
+            self._jobs.move_to_end(job_id)
+            artifacts.setdefault(kind, [])
+            if path not in artifacts[kind]:
+                artifacts[kind].append(path)
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+
+    def get(self, job_id):
+        """كل ملفات المهمة: {النوع: [المسارات]}."""
+        with self._lock:
+            return {kind: list(paths) for kind, paths in self._jobs.get(job_id, {}).items()}
+
+    def first(self, job_id, kind):
+        paths = self.get(job_id).get(kind)
+        return paths[0] if paths else None
+
+    def remove(self, job_id, path):
+        """إزالة ملف حُذف من القرص من كل أنواع المهمة."""
+        with self._lock:
+            for paths in self._jobs.get(job_id, {}).values():
+                if path in paths:
+                    paths.remove(path)
+
+
+ARTIFACT_INDEX = ArtifactIndex()
+
+
+# ----------------------------------------------------------------------
+## 2.1.2 المجاميع الاختبارية والتحقق من سلامة الملفات (Integrity)
+# ----------------------------------------------------------------------
+HASH_READ_THRESHOLD = 1024 * 1024  # نقرأ البايتات الجديدة كل 1MB (ما زالت في ذاكرة الصفحات)
+DURATION_TOLERANCE = 0.01  # 1% من المدة المتوقعة (بحد أدنى ثانيتان)
+
+
+class StreamingHasher:
+    """حساب SHA-256 تدريجياً أثناء التحميل من خلال progress hooks.
+
+    yt-dlp يكتب الملف بنفسه، لذا نقرأ فقط الجزء المضاف حديثاً إلى ملف .part بعد كل دفعة،
+    فلا تحتاج المجاميع إلى قراءة ثانية كاملة للملف بعد انتهاء التحميل.
+    مع كل مجموع نحفظ توقيع الملف (inode، الحجم، زمن التعديل): أي معالج لاحق يعيد كتابة الملف
+    (مثل FFmpegFixupM4aPP) يغيّر التوقيع فيُلغى المجموع بدل تخزين مجموع لبايتات لم تعد موجودة.
+    """
+    def __init__(self):
+        self._states = {}
+        self.digests = {}
+        self.signatures = {}
+
+    @staticmethod
+    def signature(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def on_progress(self, d):
+        filename = d.get('filename')
+        if not filename or d.get('status') not in ('downloading', 'finished'):
+            return
+        if d['status'] == 'downloading':
+            state = self._states.setdefault(filename, {'digest': hashlib.sha256(), 'offset': 0})
+            downloaded = d.get('downloaded_bytes') or 0
+            if downloaded - state['offset'] >= HASH_READ_THRESHOLD:
+                self._consume(state, d.get('tmpfilename') or filename, downloaded)
+        elif filename not in self.digests:
+            # بعد الانتهاء يكون ملف .part قد أعيدت تسميته إلى الاسم النهائي
+            state = self._states.pop(filename, None) or {'digest': hashlib.sha256(), 'offset': 0}
+            self._consume(state, filename, None)
+            self.digests[filename] = state['digest'].hexdigest()
+            self.signatures[filename] = self.signature(filename)
+
+    def digest_for(self, filename, final_path):
+        """المجموع المحسوب أثناء التحميل إن لم يتغير الملف النهائي منذ ذلك الحين، وإلا None."""
+        signature = self.signatures.get(filename)
+        if signature is None or self.signature(final_path) != signature:
+            return None
+        return self.digests.get(filename)
+
+    @staticmethod
+    def _consume(state, path, upto):
+        try:
+            with open(path, 'rb') as fh:
+                fh.seek(0, os.SEEK_END)
+                if fh.tell() < state['offset']:
+                    # أعاد yt-dlp بدء الملف من الصفر (إعادة محاولة بدون استئناف)
+                    state['digest'], state['offset'] = hashlib.sha256(), 0
+                fh.seek(state['offset'])
+                remaining = None if upto is None else upto - state['offset']
+                while remaining is None or remaining > 0:
+                    chunk = fh.read(HASH_READ_THRESHOLD if remaining is None else min(remaining, HASH_READ_THRESHOLD))
+                    if not chunk:
+                        break
+                    state['digest'].update(chunk)
+                    state['offset'] += len(chunk)
+                    if remaining is not None:
+                        remaining -= len(chunk)
+        except OSError:
+            pass  # نحاول مجدداً في الدفعة التالية
+
+
+def probe_container(path):
+    """فحص سريع للحاوية عبر ffprobe (الترويسة والفهرس فقط)؛ تعيد (المدة، رسالة الخطأ)."""
+    if not shutil.which('ffprobe'):
+        return None, ''
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'csv=p=0', path],
+        capture_output=True, text=True)
+    if result.returncode != 0:
+        return None, result.stderr.strip() or f"ffprobe exit {result.returncode}"
+    try:
+        return float(result.stdout.strip()), ''
+    except ValueError:
+        return None, ''
+
+
+def probe_duration(path):
+    """مدة الملف عبر ffprobe (يقرأ الترويسة فقط)؛ None إذا تعذر."""
+    return probe_container(path)[0]
+
+
+def verify_media_integrity(path, expected_duration=None, sha256=None, full_decode=False):
+    """التحقق من سلامة ملف نهائي: فحص الحاوية ومطابقة المدة، وفك ترميز كامل اختيارياً.
+
+    الفحص الافتراضي سريع (ffprobe يقرأ الترويسة والفهرس). full_decode يمرر الملف كاملاً
+    إلى ffmpeg بمساره (لا عبر pipe، فملفات MP4 التي فهرسها moov في آخرها تُقرأ بشكل صحيح)،
+    ويُعد الملف تالفاً فقط إذا خرج ffmpeg بخطأ (-xerror)، لا لمجرد وجود تحذيرات.
+    """
+    report = {'path': path, 'sha256': sha256 or file_sha256(path), 'duration': None, 'decoded': None,
+              'ok': True, 'errors': ''}
+
+    report['duration'], container_error = probe_container(path)
+    if container_error:
+        report['ok'] = False
+        report['errors'] = container_error
+
+    if full_decode and report['ok'] and shutil.which('ffmpeg'):
+        result = subprocess.run(['ffmpeg', '-v', 'error', '-xerror', '-i', path, '-map', '0', '-f', 'null', '-'],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        report['decoded'] = result.returncode == 0
+        if not report['decoded']:
+            report['ok'] = False
+            report['errors'] = result.stderr.decode('utf-8', 'replace').strip()[-2000:]
+
+    if expected_duration and report['duration'] is not None:
+        tolerance = max(2.0, expected_duration * DURATION_TOLERANCE)
+        if abs(report['duration'] - expected_duration) > tolerance:
+            report['ok'] = False
+            report['errors'] = (report['errors'] + f"\nduration {report['duration']:.1f}s != expected {expected_duration:.1f}s").strip()
+    return report
+
+
+# ----------------------------------------------------------------------
+## 2.1.3 تقدير أحجام الصيغ غير المعروفة (Size Probing)
+# ----------------------------------------------------------------------
+SIZE_PROBE_CACHE_TTL = 600  # روابط الصيغ الموقعة تنتهي صلاحيتها، لذا المخبأ قصير العمر
+SIZE_PROBE_TIMEOUT = 5
+SIZE_PROBE_WORKERS = 8
+# بروتوكولات يمكن معرفة حجمها بطلب HEAD واحد (ليست قوائم مقاطع مثل m3u8/dash)
+SIZE_PROBE_PROTOCOLS = ('http', 'https')
+
+
+class SizeProber:
+    """تقدير أحجام الصيغ التي لا يعطي yt-dlp حجمها: طلبات HEAD متوازية أو معدل البت × المدة."""
+    def __init__(self, max_workers=SIZE_PROBE_WORKERS, ttl=SIZE_PROBE_CACHE_TTL):
+        self.max_workers = max_workers
+        self.ttl = ttl
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _cached(self, key):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry and entry[0] > time.monotonic():
+                return entry[1]
+            self._cache.pop(key, None)
+        return None
+
+    def _store(self, key, value):
+        with self._lock:
+            self._cache[key] = (time.monotonic() + self.ttl, value)
+
+    @staticmethod
+    def _head_size(fmt):
+        request = urllib.request.Request(fmt['url'], method='HEAD', headers=fmt.get('http_headers') or {})
+        with urllib.request.urlopen(request, timeout=SIZE_PROBE_TIMEOUT) as response:
+            length = response.headers.get('Content-Length')
+        return int(length) if length and length.isdigit() and int(length) > 0 else None
+
+    @staticmethod
+    def bitrate_estimate(fmt, duration):
+        bitrate = fmt.get('tbr') or ((fmt.get('vbr') or 0) + (fmt.get('abr') or 0))
+        return int(bitrate * 1000 / 8 * duration) if bitrate and duration else None
+
+    def probe(self, source_url, formats, duration):
+        """تعيد {format_id: (الحجم بالبايت، المصدر)} حيث المصدر 'probed' أو 'estimated'.
+
+        المخبأ مفتاحه (رابط صفحة الفيديو، معرّف الصيغة): المستخرج العام لا يعطي معرّفاً فريداً
+        للفيديو ومعرّفات صيغه متكررة، فلا يكفي المعرّف وحده. بدون رابط لا يُستخدم المخبأ.
+        """
+        sizes, to_probe = {}, []
+        for fmt in formats:
+            cached = self._cached((source_url, fmt['format_id'])) if source_url else None
+            if cached:
+                sizes[fmt['format_id']] = cached
+            elif fmt.get('url') and fmt.get('protocol', 'https') in SIZE_PROBE_PROTOCOLS:
+                to_probe.append(fmt)
+            else:
+                estimate = self.bitrate_estimate(fmt, duration)
+                if estimate:
+                    sizes[fmt['format_id']] = (estimate, 'estimated')
+
+        if to_probe:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.max_workers, len(to_probe))) as executor:
+                futures = {executor.submit(self._head_size, fmt): fmt for fmt in to_probe}
+                for future in concurrent.futures.as_completed(futures):
+                    fmt = futures[future]
+                    try:
+                        size = future.result()
+                    except (OSError, ValueError, http.client.HTTPException):
+                        # IncompleteRead وما شابه ليست OSError؛ نرجع إلى التقدير
+                        size = None
+                    if size:
+                        result = (size, 'probed')
+                    else:
+                        estimate = self.bitrate_estimate(fmt, duration)
+                        result = (estimate, 'estimated') if estimate else None
+                    if result:
+                        sizes[fmt['format_id']] = result
+
+        if source_url:
+            for fmt in formats:
+                if fmt['format_id'] in sizes:
+                    self._store((source_url, fmt['format_id']), sizes[fmt['format_id']])
+        return sizes
+
+
+SIZE_PROBER = SizeProber()
+
+
+# ----------------------------------------------------------------------
+## 2.1.4 قبول المهام حسب المساحة الحرة (Disk Space Admission)
+# ----------------------------------------------------------------------
+DISK_RESERVE_BYTES = 256 * 1024 * 1024  # هامش لا تستخدمه التحميلات أبداً
+DISK_POLL_SECONDS = 5
+# مساحة الذروة ÷ حجم الوسائط: الدمج والتحويل يُبقيان المصدر والناتج معاً حتى حذف المصدر
+MERGE_OVERHEAD = 2.0
+POSTPROCESS_OVERHEAD = 2.0
+PREALLOCATE_MIN_BYTES = 64 * 1024 * 1024
+RESERVATION_SHRINK_STEP = 16 * 1024 * 1024
+
+
+def estimate_footprint(info, postprocessing=False):
+    """المساحة القصوى المتوقعة لمهمة على القرص (بالبايت)؛ 0 إذا كان الحجم مجهولاً."""
+    formats = info.get('requested_formats') or [info]
+    size = 0
+    for fmt in formats:
+        size += fmt.get('filesize') or fmt.get('filesize_approx') \
+            or SizeProber.bitrate_estimate(fmt, info.get('duration')) or 0
+    merged = len(formats) > 1
+    factor = MERGE_OVERHEAD if merged else POSTPROCESS_OVERHEAD if postprocessing else 1.0
+    return int(size * factor)
+
+
+class DiskSpaceAdmission:
+    """قبول المهام حسب حجمها المتوقع مقابل المساحة الحرة، مع حجز المساحة وإيقاف مؤقت بدل الفشل.
+
+    الحجز ملف محجوز مسبقاً (posix_fallocate) في المجلد المؤقت على نفس القرص، فيراه أي عامل آخر
+    على الجهاز نفسه، ويُقلَّص كلما كتبت المهمة بياناتها الفعلية. إذا لم يدعم نظام الملفات الحجز
+    المسبق يُحسب الحجز في الذاكرة فقط.
+    """
+    def __init__(self, root=OUTPUT_ROOT, reserve_bytes=DISK_RESERVE_BYTES, poll_seconds=DISK_POLL_SECONDS):
+        self.root = root
+        self.reserve_bytes = reserve_bytes
+        self.poll_seconds = poll_seconds
+        self._reservations = {}  # job_id -> {'size', 'written', 'file', 'allocated'}
+        self._cond = threading.Condition()
+
+    def free_bytes(self):
+        os.makedirs(self.root, exist_ok=True)
+        return shutil.disk_usage(self.root).free
+
+    def _available(self):
+        """المساحة القابلة للحجز: الحرة ناقص الهامش وناقص الحجوزات غير المحجوزة فعلياً على القرص."""
+        unbacked = sum(max(0, max(0, r['size'] - r['written']) - r['allocated'])
+                       for r in self._reservations.values())
+        return self.free_bytes() - self.reserve_bytes - unbacked
+
+    def has_headroom(self, needed=0):
+        with self._cond:
+            return self._available() >= needed
+
+    def _wait(self, needed, cancelled, on_wait):
+        """الانتظار (مع القفل) حتى تتوفر المساحة المطلوبة."""
+        notified = False
+        while self._available() < needed:
+            if cancelled():
+                raise SystemExit("Download cancelled by user.")
+            if on_wait and not notified:
+                on_wait(needed)
+                notified = True
+            # الحجوزات في عمليات أخرى لا تُبلغنا، لذا نعيد الفحص دورياً
+            self._cond.wait(self.poll_seconds)
+
+    def admit(self, job_id, footprint, cancelled=lambda: False, on_wait=None):
+        """حجز مساحة المهمة؛ ينتظر (إيقاف مؤقت) حتى تتوفر بدل الفشل."""
+        capacity = shutil.disk_usage(self.root if os.path.exists(self.root) else '.').total
+        if footprint > capacity - self.reserve_bytes:
+            raise OSError(errno.EFBIG, f"الحجم المتوقع ({footprint} بايت) أكبر من سعة القرص")
+        with self._cond:
+            self._wait(footprint, cancelled, on_wait)
+            reservation = {'size': footprint, 'written': 0, 'file': None, 'allocated': 0}
+            self._reservations[job_id] = reservation
+        if footprint >= PREALLOCATE_MIN_BYTES and hasattr(os, 'posix_fallocate'):
+            self._preallocate(job_id, reservation)
+
+    def _preallocate(self, job_id, reservation):
+        temp_dir = os.path.join(self.root, OUTPUT_TEMP_DIR)
+        os.makedirs(temp_dir, exist_ok=True)
+        path = os.path.join(temp_dir, f".reserve-{os.getpid()}-{job_id}")
+        fd = os.open(path, os.O_CREAT | os.O_WRONLY, 0o600)
+        try:
+            os.posix_fallocate(fd, 0, reservation['size'])
+        except OSError:
+            # نظام ملفات لا يدعم الحجز المسبق: نكتفي بالحساب في الذاكرة
+            os.close(fd)
+            os.remove(path)
+            return
+        os.close(fd)
+        with self._cond:
+            reservation['file'] = path
+            reservation['allocated'] = reservation['size']
+
+    def consume(self, job_id, written):
+        """تحديث ما كتبته المهمة فعلياً وتقليص ملف الحجز بنفس القدر (على دفعات)."""
+        with self._cond:
+            reservation = self._reservations.get(job_id)
+            if reservation is None:
+                return
+            reservation['written'] = written
+            remaining = max(0, reservation['size'] - written)
+            if reservation['file'] and reservation['allocated'] - remaining >= RESERVATION_SHRINK_STEP:
+                os.truncate(reservation['file'], remaining)
+                reservation['allocated'] = remaining
+
+    def remaining(self, job_id):
+        with self._cond:
+            reservation = self._reservations.get(job_id)
+            return max(0, reservation['size'] - reservation['written']) if reservation else 0
+
+    def hand_over(self, job_id):
+        """تحرير ملف الحجز قبل خطوة تكتبها أداة خارجية (دمج/تحويل ffmpeg) لتستخدم المساحة نفسها."""
+        with self._cond:
+            reservation = self._reservations.get(job_id)
+            if reservation and reservation['file']:
+                os.truncate(reservation['file'], 0)
+                reservation['allocated'] = 0
+                reservation['written'] = reservation['size']
+
+    def wait_for_space(self, needed=RESERVATION_SHRINK_STEP, cancelled=lambda: False, on_wait=None):
+        """إيقاف المهمة مؤقتاً حتى تتوفر مساحة إضافية (تجاوزت حجمها المتوقع أو امتلأ القرص)."""
+        with self._cond:
+            self._wait(needed, cancelled, on_wait)
+
+    def release(self, job_id):
+        with self._cond:
+            reservation = self._reservations.pop(job_id, None)
+            self._cond.notify_all()
+        if reservation and reservation['file']:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(reservation['file'])
+
+
+DISK_ADMISSION = DiskSpaceAdmission()
+
+
+# ----------------------------------------------------------------------
+## 2.1.5 تصنيف الأخطاء وإعادة المحاولة وقواطع الدوائر (Retries & Circuit Breakers)
+# ----------------------------------------------------------------------
+ERROR_TRANSIENT = 'transient'    # انقطاع/مهلة شبكة: إعادة بتأخير أسي عشوائي
+ERROR_THROTTLED = 'throttled'    # HTTP 429/403 أو طلب التحقق من الروبوت: إبطاء المضيف
+ERROR_EXPIRED = 'expired'        # رابط موقّع منتهي الصلاحية: إعادة الاستخراج فوراً
+ERROR_DISK_FULL = 'disk_full'    # امتلاء القرص: انتظار المساحة ثم الاستئناف (القسم 2.1.4)
+ERROR_PERMANENT = 'permanent'    # فيديو محذوف/خاص/غير مدعوم: لا فائدة من الإعادة
+
+TRANSIENT_ERRNOS = frozenset({errno.ECONNRESET, errno.ECONNREFUSED, errno.ECONNABORTED, errno.ETIMEDOUT,
+                              errno.EHOSTUNREACH, errno.ENETUNREACH, errno.EPIPE})
+THROTTLE_MESSAGE_RE = re.compile(r"Too Many Requests|rate.?limit|confirm you.re not a bot", re.I)
+# رمز الحالة من نص الخطأ عندما لا يحمل الخطأ نفسه status؛ يُصنَّف بالقاعدة نفسها (_classify_status)
+HTTP_STATUS_MESSAGE_RE = re.compile(r"HTTP Error (\d{3})", re.I)
+PERMANENT_MESSAGE_RE = re.compile(
+    r"Video unavailable|Private video|removed|copyright|not available in your country|Unsupported URL|"
+    r"Requested format is not available", re.I)
+TRANSIENT_MESSAGE_RE = re.compile(r"timed out|Connection (?:reset|refused|aborted)|Temporary failure|"
+                                  r"IncompleteRead", re.I)
+
+
+def _exception_chain(exc):
+    """الخطأ وأسبابه المتسلسلة (بما فيها exc_info في DownloadError الخاص بـ yt-dlp)."""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        yield exc
+        exc_info = getattr(exc, 'exc_info', None)
+        exc = exc.__cause__ or exc.__context__ or (exc_info[1] if exc_info else None)
+
+
+def _signed_url_expired(url):
+    """هل انتهت صلاحية رابط googlevideo الموقّع (المعامل expire)؟"""
+    expire = parse_qs(urlsplit(url or '').query).get('expire')
+    return bool(expire and expire[0].isdigit() and int(expire[0]) <= time.time())
+
+
+def _classify_status(status, url=None):
+    """تصنيف رمز حالة HTTP: 403 على رابط موقّع منتهٍ = انتهاء صلاحية، وغير ذلك 403/429 = حظر."""
+    if status == 403 and _signed_url_expired(url):
+        return ERROR_EXPIRED
+    if status in (403, 429):
+        return ERROR_THROTTLED
+    return ERROR_TRANSIENT if status >= 500 else ERROR_PERMANENT
+
+
+def classify_error(exc):
+    """تصنيف خطأ تحميل/استخراج إلى إحدى فئات ERROR_*."""
+    chain = list(_exception_chain(exc))
+    for error in chain:
+        if isinstance(error, OSError) and error.errno == errno.ENOSPC:
+            return ERROR_DISK_FULL
+        status = getattr(error, 'status', None)
+        if isinstance(status, int) and status >= 400:
+            url = getattr(getattr(error, 'response', None), 'url', None) or getattr(error, 'url', None)
+            return _classify_status(status, url)
+    message = ' '.join(str(error) for error in chain)
+    if THROTTLE_MESSAGE_RE.search(message):
+        return ERROR_THROTTLED
+    match = HTTP_STATUS_MESSAGE_RE.search(message)
+    if match and int(match.group(1)) >= 400:
+        # النص لا يحمل الرابط، فلا نعرف إن كان موقّعاً منتهياً: 403 هنا حظر كما في مسار الحالة
+        return _classify_status(int(match.group(1)))
+    if PERMANENT_MESSAGE_RE.search(message):
+        return ERROR_PERMANENT
+    if TRANSIENT_MESSAGE_RE.search(message) or any(
+            isinstance(error, (TimeoutError, ConnectionError, http.client.IncompleteRead))
+            or (isinstance(error, OSError) and error.errno in TRANSIENT_ERRNOS) for error in chain):
+        return ERROR_TRANSIENT
+    return ERROR_PERMANENT
+
+
+class RetryPolicy:
+    """سياسة إعادة المحاولة لفئة أخطاء: عدد المحاولات وتأخير أسي بعشوائية كاملة (full jitter)."""
+    def __init__(self, max_attempts, base_delay=0.0, max_delay=0.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+RETRY_POLICIES = {
+    ERROR_TRANSIENT: RetryPolicy(max_attempts=5, base_delay=2, max_delay=60),
+    ERROR_THROTTLED: RetryPolicy(max_attempts=4, base_delay=30, max_delay=600),
+    ERROR_EXPIRED: RetryPolicy(max_attempts=2),
+    # ERROR_DISK_FULL لا يستهلك محاولات، ERROR_PERMANENT لا يُعاد
+}
+
+CIRCUIT_FAILURE_THRESHOLD = 3      # أخطاء حظر متتالية قبل فتح الدائرة
+CIRCUIT_BASE_COOLDOWN = 60
+CIRCUIT_MAX_COOLDOWN = 1800
+CIRCUIT_PACING_SECONDS = 2.0       # فاصل إضافي بين الطلبات لكل خطأ حظر حديث
+
+
+def host_key(url):
+    """مفتاح المضيف للقاطع: كل روابط YouTube (بكل نطاقاتها) مضيف واحد."""
+    canonical, _reason = URL_NORMALIZER.parse(url)
+    if canonical:
+        return canonical.extractor
+    return (urlsplit(url if SCHEME_RE.match(url) else f"https://{url}").hostname or url).lower()
+
+
+class HostCircuitBreaker:
+    """قاطع دائرة لكل مضيف: يبطئ الطلبات عند بدء الحظر ويوقفها مؤقتاً عند تكراره.
+
+    مغلق: طلبات عادية (مع فاصل يزداد بعدد أخطاء الحظر الحديثة).
+    مفتوح: كل الطلبات للمضيف تنتظر انتهاء فترة التهدئة (تتضاعف مع كل فتح متكرر).
+    نصف مفتوح: يمر طلب تجريبي واحد؛ نجاحه يغلق الدائرة وفشله يعيد فتحها.
+    """
+    def __init__(self, threshold=CIRCUIT_FAILURE_THRESHOLD, base_cooldown=CIRCUIT_BASE_COOLDOWN,
+                 max_cooldown=CIRCUIT_MAX_COOLDOWN, pacing=CIRCUIT_PACING_SECONDS):
+        self.threshold = threshold
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self.pacing = pacing
+        self._hosts = {}
+        self._cond = threading.Condition()
+
+    def _state(self, host):
+        return self._hosts.setdefault(host, {'failures': 0, 'opened': 0, 'open_until': 0.0,
+                                             'probing': False, 'next_request': 0.0})
+
+    def state(self, host):
+        with self._cond:
+            state = self._state(host)
+            if state['open_until'] > time.monotonic():
+                return 'open'
+            return 'half-open' if state['opened'] and state['failures'] else 'closed'
+
+    def before_request(self, host, cancelled=lambda: False, on_wait=None):
+        """الانتظار حتى يُسمح بطلب للمضيف (إيقاف مؤقت أثناء فتح الدائرة)."""
+        notified = False
+        with self._cond:
+            while True:
+                if cancelled():
+                    raise SystemExit("Download cancelled by user.")
+                state = self._state(host)
+                now = time.monotonic()
+                wait_until = max(state['open_until'], state['next_request'])
+                half_open = state['opened'] and state['failures'] and state['open_until'] <= now
+                if wait_until <= now and not (half_open and state['probing']):
+                    state['probing'] = bool(half_open)
+                    state['next_request'] = now + self.pacing * min(state['failures'], self.threshold)
+                    return
+                if on_wait and not notified and state['open_until'] > now:
+                    on_wait(host, state['open_until'] - now)
+                    notified = True
+                self._cond.wait(min(1.0, max(0.05, wait_until - now)))
+
+    def record_success(self, host):
+        with self._cond:
+            self._hosts[host] = {'failures': 0, 'opened': 0, 'open_until': 0.0,
+                                 'probing': False, 'next_request': 0.0}
+            self._cond.notify_all()
+
+    def record_failure(self, host, kind):
+        """تسجيل خطأ؛ أخطاء الحظر فقط تُحتسب لفتح الدائرة."""
+        with self._cond:
+            state = self._state(host)
+            state['probing'] = False
+            if kind == ERROR_THROTTLED:
+                state['failures'] += 1
+                if state['failures'] >= self.threshold or state['opened']:
+                    cooldown = min(self.max_cooldown, self.base_cooldown * 2 ** state['opened'])
+                    state['opened'] += 1
+                    state['open_until'] = time.monotonic() + cooldown
+            self._cond.notify_all()
+
+    def record_cancelled(self, host):
+        """طلب أُلغي قبل أن يُعرف نجاحه: لا يُحتسب، لكن يُحرَّر الطلب التجريبي ليمر غيره."""
+        with self._cond:
+            self._state(host)['probing'] = False
+            self._cond.notify_all()
+
+
+CIRCUIT_BREAKERS = HostCircuitBreaker()
+
+
+# ----------------------------------------------------------------------
+## 2.2 أدوات التحليل الاختيارية (Profiling Hooks)
+# ----------------------------------------------------------------------
+PROFILE_ENV_VAR = 'YTDLP_GUI_PROFILE'
+PROFILE_DIR = 'profiles'
+PROFILE_TOP_N = 25
+
+# tracemalloc عام على مستوى العملية، لذا نتتبع المهام النشطة ونوقفه عند انتهاء آخرها.
+# الذروة تُصفَّر عند بدء مهمة فقط إذا لم تكن هناك مهام أخرى (فتصبح ذروة المهمة وحدها)؛
+# أي مهمة تداخلت مع غيرها تُعلَّم بأن ذروتها ذروة العملية المشتركة.
+_profile_lock = threading.Lock()
+_active_profiles = {}  # اسم المهمة -> {'shared': bool}
+
+
+def profiling_enabled():
+    """التحليل مفعّل عبر متغير البيئة YTDLP_GUI_PROFILE أو الخيار --profile."""
+    return os.environ.get(PROFILE_ENV_VAR, '') not in ('', '0')
+
+
+def profiled_run(run):
+    """تغليف run() للعامل بتحليل CPU وتتبع الذاكرة وحفظ نتائج كل مهمة.
+
+    يُشغَّل cProfile داخل خيط العامل نفسه (حيث لا تصل أدوات التحليل العادية)،
+    وتُحفظ النتائج في profiles/<العامل>-<الوقت>.prof مع ملخص نصي .txt.
+    """
+    @functools.wraps(run)
+    def wrapper(self, *args, **kwargs):
+        if not profiling_enabled():
+            return run(self, *args, **kwargs)
+
+        job_name = f"{type(self).__name__}-{time.strftime('%Y%m%d-%H%M%S')}-{id(self):x}"
+        with _profile_lock:
+            if not _active_profiles:
+                if tracemalloc.is_tracing():
+                    tracemalloc.reset_peak()
+                else:
+                    tracemalloc.start()
+            for other in _active_profiles.values():
+                other['shared'] = True
+            state = _active_profiles[job_name] = {'shared': bool(_active_profiles)}
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            try:
+                profiler.enable()
+            except ValueError:
+                # Python 3.12+ يسمح بمحلل CPU واحد نشط في العملية: المهمة المتداخلة تكتفي بالذاكرة والزمن
+                profiler = None
+            return run(self, *args, **kwargs)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            elapsed = time.perf_counter() - started
+            _current, peak = tracemalloc.get_traced_memory()
+            top_allocations = tracemalloc.take_snapshot().statistics('lineno')[:10]
+            with _profile_lock:
+                del _active_profiles[job_name]
+                if not _active_profiles:
+                    tracemalloc.stop()
+            _write_profile_report(job_name, profiler, elapsed, peak, top_allocations, state['shared'])
+
+    return wrapper
+
+
+def _write_profile_report(job_name, profiler, elapsed, peak, top_allocations, shared=False):
+    """حفظ ملف .prof (لأدوات مثل snakeviz، إن شُغّل محلل CPU) وملخص لأهم النقاط الساخنة وذروة الذاكرة."""
+    try:
+        if not os.path.exists(PROFILE_DIR):
+            os.makedirs(PROFILE_DIR)
+        base_path = os.path.join(PROFILE_DIR, job_name)
+        stream = io.StringIO()
+        if profiler is not None:
+            profiler.dump_stats(base_path + '.prof')
+            stats = pstats.Stats(profiler, stream=stream)
+            stats.sort_stats('cumulative').print_stats(PROFILE_TOP_N)
+            stats.sort_stats('tottime').print_stats(PROFILE_TOP_N)
+        else:
+            stream.write("CPU profile skipped: another profiler was active in this process\n")
+
+        with open(base_path + '.txt', 'w', encoding='utf-8') as fh:
+            fh.write(f"job: {job_name}\n")
+            fh.write(f"wall time: {elapsed:.3f}s\n")
+            scope = "process peak, shared with concurrent jobs" if shared else "this job"
+            fh.write(f"peak traced memory ({scope}): {peak / (1024 * 1024):.2f} MB\n\n")
+            fh.write("top allocations:\n")
+            for stat in top_allocations:
+                fh.write(f"  {stat}\n")
+            fh.write("\n")
+            fh.write(stream.getvalue())
+        print(f"[PROFILE]: {job_name} {elapsed:.2f}s, {'process ' if shared else ''}peak "
+              f"{peak / (1024 * 1024):.1f} MB -> {base_path}.txt")
+    except OSError as e:
+        print(f"[PROFILE]: تعذر حفظ نتائج التحليل: {e}")
+
+
+# ----------------------------------------------------------------------
+## 2.3 خيوط قابلة لإعادة الاستخدام وسجل المهام (Worker Pool)
+# ----------------------------------------------------------------------
+JOB_HISTORY_LIMIT = 200
+
+_worker_pool = None
+
+
+def worker_pool():
+    """مجمع خيوط مشترك؛ الخيوط تُعاد استخدامها بين المهام بدل إنشاء QThread لكل مهمة."""
+    global _worker_pool
+    if _worker_pool is None:
+        _worker_pool = QThreadPool()
+        _worker_pool.setMaxThreadCount(max(4, os.cpu_count() or 1))
+        _worker_pool.setExpiryTimeout(60 * 1000)
+    return _worker_pool
+
+
+class JobRegistry:
+    """المهام النشطة مع سجل محدود الحجم للمهام المنتهية (بدون الاحتفاظ بكائنات العمال)."""
+    def __init__(self, history_limit=JOB_HISTORY_LIMIT):
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.active = {}
+        self.history = collections.deque(maxlen=history_limit)
+
+    def job_started(self, worker):
+        with self._lock:
+            worker.job_id = next(self._ids)
+            worker.job_started_at = time.monotonic()
+            self.active[worker.job_id] = type(worker).__name__
+        return worker.job_id
+
+    def job_finished(self, worker, status):
+        with self._lock:
+            kind = self.active.pop(worker.job_id, type(worker).__name__)
+            self.history.append({
+                'job_id': worker.job_id,
+                'kind': kind,
+                'status': status,
+                'elapsed': time.monotonic() - worker.job_started_at,
+            })
+
+
+JOB_REGISTRY = JobRegistry()
+
+
+class _WorkerTask(QRunnable):
+    """غلاف QRunnable يشغّل العامل على أحد خيوط المجمع."""
+    def __init__(self, worker):
+        super().__init__()
+        self.worker = worker
+        self.setAutoDelete(True)
+
+    def run(self):
+        worker, self.worker = self.worker, None
+        worker._run_in_pool()
+
+
+class PooledWorker(QObject):
+    """بديل QThread بنفس الواجهة (start / isRunning / wait / run) لكن على مجمع خيوط مشترك.
+
+    الأصناف المشتقة تعرّف run(). الإشارات تُرسل من خيط المجمع وتصل إلى الواجهة عبر اتصال
+    Queued تلقائياً. بعد `finished` يجب على المالك استدعاء release_worker لتحرير الكائن.
+    """
+    finished = pyqtSignal()
+
+    def __init__(self):
+        super().__init__()
+        self.job_id = None
+        self.job_started_at = None
+        self.job_status = 'done'
+        self._running = False
+        self._done = threading.Event()
+        self._done.set()
+
+    def start(self):
+        self._running = True
+        self._done.clear()
+        JOB_REGISTRY.job_started(self)
+        worker_pool().start(_WorkerTask(self))
+
+    def _run_in_pool(self):
+        try:
+            self.run()
+        except BaseException:
+            self.job_status = 'error'
+            raise
+        finally:
+            self._running = False
+            JOB_REGISTRY.job_finished(self, self.job_status)
+            self._done.set()
+            self.finished.emit()
+
+    def _mark_failed(self, *_args):
+        self.job_status = 'error'
+
+    def isRunning(self):
+        return self._running
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+
+def release_worker(worker):
+    """تحرير عامل منتهٍ: حذف كائن Qt (واتصالاته) في حلقة الأحداث."""
+    if worker is not None:
+        worker.deleteLater()
 
-    def set_success_style(self, theme):
-        self.set_theme_colors(theme['PRIMARY'], theme['PRIMARY_HOVER'], theme['PRIMARY_PRESS'])
 
 # ----------------------------------------------------------------------
 ## 3. عامل yt-dlp في خيط منفصل (Worker Thread)
 # ----------------------------------------------------------------------
-class YtdlpWorker(QThread):
+class YtdlpWorker(PooledWorker):
     # إشارات مخصصة
     formats_ready = pyqtSignal(list, str)
     download_progress = pyqtSignal(int)
     download_finished = pyqtSignal(str)
     download_error = pyqtSignal(str)
-
-    def __init__(self, url=None, download_options=None):
+    metadata_ready = pyqtSignal(dict)
+    artifacts_ready = pyqtSignal(dict)
+    integrity_ready = pyqtSignal(dict)
+    download_paused = pyqtSignal(str)
+    download_cancelled = pyqtSignal()
+    live_segment_ready = pyqtSignal(dict)
+    live_segment_removed = pyqtSignal(str)
+
+    def __init__(self, url=None, download_options=None, probe_sizes=False):
         super().__init__()
         self.url = url
         self.download_options = download_options
+        self.probe_sizes = probe_sizes
+        self.error_kind = None
+        self._live_stop = threading.Event()
         self.is_downloading = False
         self._is_cancelled = False
+        self._hasher = StreamingHasher()
+        self.download_error.connect(self._mark_failed, Qt.ConnectionType.DirectConnection)
 
         # **الإعدادات الأساسية:** نظيفة من أي postprocessors لتجنب أخطاء FFmpeg أثناء الجلب
         self.ydl_opts_base = {
@@ -155,6 +1358,7 @@ class YtdlpWorker(QThread):
             'postprocessors': [],
         }
 
+    @profiled_run
     def run(self):
         if self.download_options is None:
             self._fetch_formats()
@@ -170,7 +1374,10 @@ class YtdlpWorker(QThread):
         if self._is_cancelled:
             raise SystemExit("Download cancelled by user.")
 
+        self._hasher.on_progress(d)
+
         if d['status'] == 'downloading':
+            self._track_disk_usage(d)
             total_bytes = d.get('total_bytes') or d.get('total_bytes_estimate', 1)
             downloaded_bytes = d.get('downloaded_bytes', 0)
 
@@ -178,8 +1385,103 @@ class YtdlpWorker(QThread):
                  percent = int(downloaded_bytes * 100 / total_bytes)
                  self.download_progress.emit(percent)
         elif d['status'] == 'finished':
-            self.download_finished.emit(d.get('filename', ''))
-            self.is_downloading = False
+            # ملف وسيط (قد يُدمج أو يُحوَّل لاحقاً)؛ المسار النهائي يأتي من _collect_artifacts
+            ARTIFACT_INDEX.add(self.job_id, 'intermediate', d.get('filename', ''))
+
+    @contextlib.contextmanager
+    def _policy_format(self, ydl, info):
+        """تطبيق سياسة الاختيار التلقائي (format_policy) على هذا التحميل فقط.
+
+        الجلسة مشتركة ومفتاحها يشمل 'format'، لذا نستبدل محدد الصيغ مؤقتاً بدل تعديل params.
+        تعيد info بالصيغ التي ستُحمَّل فعلاً (لتقدير المساحة).
+        """
+        policy = self.download_options.get('format_policy')
+        if not policy:
+            yield info
+            return
+        choice = FormatSelectionEngine(FormatPolicy(**policy)).select(FormatSelectionEngine.item_from_info(info))
+        if choice is None:
+            raise ValueError(f"لا توجد صيغة تحقق سياسة الاختيار {policy}")
+        by_id = {f['format_id']: f for f in info.get('formats') or []}
+        chosen_ids = [fmt['id'] for fmt in (choice['video'], choice['audio']) if fmt]
+        previous = ydl.format_selector
+        ydl.format_selector = ydl.build_format_selector(choice['format'])
+        try:
+            yield dict(info, requested_formats=[by_id[format_id] for format_id in chosen_ids])
+        finally:
+            ydl.format_selector = previous
+
+    def _admit(self, info):
+        """قبول المهمة قبل طلب الوسائط (الصيغ المختارة معروفة بعد الاستخراج)؛ الانتظار هنا لا يُبقي اتصالاً مفتوحاً."""
+        if self._admitted:
+            return
+        footprint = estimate_footprint(info, bool(self.download_options.get('postprocessor')))
+        DISK_ADMISSION.admit(self.job_id, footprint, lambda: self._is_cancelled, self._on_disk_wait)
+        self._admitted = True
+        self._last_space_check = 0
+
+    def _track_disk_usage(self, d):
+        """تحديث حجز المهمة بما كُتب فعلاً.
+
+        لا ننتظر داخل الـ hook (الاتصال مفتوح وسينتهي بمهلة): إذا تجاوزت المهمة حجمها المتوقع ولم
+        تبقَ مساحة نوقف النقل بخطأ ENOSPC، و _with_retries ينتظر المساحة ثم يستأنف من ملف .part.
+        """
+        self._written[d.get('filename')] = d.get('downloaded_bytes') or 0
+        written = sum(self._written.values())
+        DISK_ADMISSION.consume(self.job_id, written)
+        if not DISK_ADMISSION.remaining(self.job_id) and written - self._last_space_check >= RESERVATION_SHRINK_STEP:
+            self._last_space_check = written
+            if not DISK_ADMISSION.has_headroom(RESERVATION_SHRINK_STEP):
+                raise OSError(errno.ENOSPC, "المساحة الحرة غير كافية لمتابعة التحميل")
+
+    def _postprocessor_hook(self, d):
+        # الدمج/التحويل يكتبه ffmpeg: نسلّمه المساحة المحجوزة
+        if d.get('status') == 'started':
+            DISK_ADMISSION.hand_over(self.job_id)
+
+    def _with_retries(self, operation):
+        """تنفيذ عملية شبكية مع إعادة محاولة حسب فئة الخطأ وقاطع الدائرة الخاص بالمضيف."""
+        host = host_key(self.url)
+        cancelled = lambda: self._is_cancelled
+        attempt = 0
+        while True:
+            CIRCUIT_BREAKERS.before_request(host, cancelled, self._on_host_wait)
+            try:
+                result = operation()
+            except Exception as e:
+                kind = classify_error(e)
+                self.error_kind = kind
+                CIRCUIT_BREAKERS.record_failure(host, kind)
+                if kind == ERROR_DISK_FULL:
+                    # امتلأ القرص أثناء الكتابة: ننتظر المساحة بين المحاولات ثم نستأنف (لا يُحتسب كمحاولة)
+                    self._on_disk_wait(RESERVATION_SHRINK_STEP)
+                    DISK_ADMISSION.wait_for_space(RESERVATION_SHRINK_STEP, cancelled)
+                    continue
+                policy = RETRY_POLICIES.get(kind)
+                attempt += 1
+                if policy is None or attempt >= policy.max_attempts:
+                    raise
+                delay = policy.delay(attempt)
+                self.download_paused.emit(f"خطأ ({kind})، إعادة المحاولة {attempt} بعد {delay:.0f} ثانية: {e}")
+                deadline = time.monotonic() + delay
+                while time.monotonic() < deadline:
+                    if self._is_cancelled:
+                        raise SystemExit("Download cancelled by user.")
+                    time.sleep(min(0.5, deadline - time.monotonic()))
+                continue
+            except BaseException:
+                # الإلغاء (SystemExit) لا يمر بـ except Exception: بدونه يبقى المضيف محجوزاً لطلب تجريبي لن يكتمل
+                CIRCUIT_BREAKERS.record_cancelled(host)
+                raise
+            CIRCUIT_BREAKERS.record_success(host)
+            self.error_kind = None
+            return result
+
+    def _on_host_wait(self, host, seconds):
+        self.download_paused.emit(f"المضيف {host} يحد من الطلبات، إيقاف مؤقت لمدة {seconds:.0f} ثانية...")
+
+    def _on_disk_wait(self, needed):
+        self.download_paused.emit(f"المساحة الحرة غير كافية ({self._format_size(needed)} مطلوبة)، التحميل متوقف مؤقتاً...")
 
     def _fetch_formats(self):
         """جلب الصيغ المتاحة للفيديو."""
@@ -188,8 +1490,18 @@ class YtdlpWorker(QThread):
             # تعطيل postprocessors بوضوح لتجنب خطأ FFmpegExtractThumbnailPP
             ydl_opts.update({'simulate': True, 'force_generic_extractor': True, 'postprocessors': []})
 
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info_dict = ydl.extract_info(self.url, download=False)
+            with YDL_SESSION_POOL.session(ydl_opts) as ydl:
+                info_dict = self._with_retries(lambda: ydl.extract_info(self.url, download=False))
+
+                # مرحلة اختيارية: تقدير أحجام الصيغ التي لا يعطي yt-dlp حجمها
+                probed_sizes = {}
+                if self.probe_sizes:
+                    unknown = [f for f in info_dict.get('formats', [])
+                               if not (f.get('filesize') or f.get('filesize_approx'))]
+                    if unknown:
+                        probed_sizes = SIZE_PROBER.probe(info_dict.get('webpage_url') or self.url, unknown,
+                                                         info_dict.get('duration'))
+
                 formats = []
                 for f in info_dict.get('formats', []):
                     # عرض صيغ الفيديو (vcodec != 'none') وصيغ الصوت المنفردة
@@ -197,7 +1509,12 @@ class YtdlpWorker(QThread):
                         format_note = f.get('format_note', 'N/A')
                         ext = f.get('ext', 'N/A')
                         filesize_bytes = f.get('filesize') or f.get('filesize_approx')
+                        size_source = 'exact' if f.get('filesize') else 'approx'
+                        if not filesize_bytes and f['format_id'] in probed_sizes:
+                            filesize_bytes, size_source = probed_sizes[f['format_id']]
                         filesize = self._format_size(filesize_bytes) if filesize_bytes else 'N/A'
+                        if size_source == 'estimated':
+                            filesize = f"~{filesize}"
 
                         is_audio_only = f.get('vcodec') == 'none'
 
@@ -206,12 +1523,30 @@ class YtdlpWorker(QThread):
                             'ext': ext,
                             'resolution': format_note if not is_audio_only else 'صوت فقط',
                             'filesize': filesize,
-                            'note': f.get('vcodec') if not is_audio_only else f.get('acodec')
+                            'note': f.get('vcodec') if not is_audio_only else f.get('acodec'),
+                            # قيم خام دقيقة لمحرك الاختيار التلقائي (بدون التذبذب المستخدم في العرض)
+                            'filesize_bytes': filesize_bytes,
+                            'filesize_source': size_source if filesize_bytes else None,
+                            'tbr': f.get('tbr'),
+                            'height': f.get('height'),
+                            'vcodec': f.get('vcodec'),
+                            'acodec': f.get('acodec'),
+                            'duration': info_dict.get('duration'),
                         })
 
-                formats.sort(key=lambda x: self._size_to_sortable(x['filesize']), reverse=True)
+                formats.sort(key=lambda x: x['filesize_bytes'] or 0, reverse=True)
 
                 title = info_dict.get('title', 'فيديو يوتيوب')
+                self.metadata_ready.emit({
+                    'video_id': info_dict.get('id'),
+                    'title': title,
+                    'uploader': info_dict.get('uploader'),
+                    'channel_id': info_dict.get('channel_id') or info_dict.get('uploader_id'),
+                    'duration': info_dict.get('duration'),
+                    'upload_date': info_dict.get('upload_date'),
+                    'webpage_url': info_dict.get('webpage_url'),
+                    'is_live': bool(info_dict.get('is_live')),
+                })
                 self.formats_ready.emit(formats, title)
 
         except Exception as e:
@@ -221,9 +1556,13 @@ class YtdlpWorker(QThread):
         """بدء عملية التحميل."""
         self.is_downloading = True
         options = self.download_options
+        self._hasher = StreamingHasher()
+        self._admitted = False
+        self._written = {}
+        self._last_space_check = 0
 
-        if not os.path.exists('downloads'):
-            os.makedirs('downloads')
+        if not os.path.exists(OUTPUT_LAYOUT.root):
+            os.makedirs(OUTPUT_LAYOUT.root)
 
         ydl_opts = self.ydl_opts_base.copy()
 
@@ -236,45 +1575,120 @@ class YtdlpWorker(QThread):
         # تعيين قائمة المعالجات اللاحقة كاملة
         ydl_opts['postprocessors'] = custom_postprocessors
 
-        # تعيين قالب الإخراج ليتطابق مع الـ slug
-        output_template = f'downloads/{options["title_slug"]}.%(ext)s'
+        # تعيين قالب الإخراج ليتطابق مع الـ slug (داخل مجلد التقسيم حسب التخطيط)
+        output_template = OUTPUT_LAYOUT.output_template(options["title_slug"])
 
         # تحديث خيارات yt-dlp
         ydl_opts.update({
             'format': options['format'],
             # استخدام الـ slug الذي تم إنشاؤه من العنوان
             'outtmpl': output_template,
+            'paths': OUTPUT_LAYOUT.ydl_paths(),
             'progress_hooks': [self._progress_hook],
+            'postprocessor_hooks': [self._postprocessor_hook],
             'writedescription': options.get('write_description', False),
             'writethumbnail': options.get('write_thumbnail', False), # نبقيها لتنزيل الصورة الأصلية
         })
 
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                # إذا كانت الصيغة 'none' (تحميل ملحقات فقط)
-                if options['format'] == 'none':
-                    # عند تحميل بيانات مساعدة فقط (وصف/صورة مصغرة)
-                    ydl.params['skip_download'] = True
-                    ydl.params['writethumbnail'] = options.get('write_thumbnail', False)
-                    ydl.params['writedescription'] = options.get('write_description', False)
-
-                    ydl.extract_info(self.url, download=True)
-                    # يجب أن يشير إنهاء التحميل إلى اسم الملف الأساسي للصورة المصغرة (yt-dlp يحدد الامتداد)
-                    self.download_finished.emit(f'downloads/{self.download_options["title_slug"]}')
-                else:
-                    # تحميل فيديو/صوت فعلي
-                    ydl.download([self.url])
+            # إذا كانت الصيغة 'none' (تحميل ملحقات فقط): المسار السريع بدون استخراج كامل أو تحميل
+            if options['format'] == 'none':
+                self._harvest_auxiliary(options)
+                return
+
+            # البث المباشر: مقاطع متتالية تُنهى أثناء التسجيل بدل ملف واحد بلا نهاية
+            if options.get('live_record'):
+                self._record_live(options)
+                return
+
+            def download_once():
+                # كل محاولة تعيد الاستخراج (روابط موقعة جديدة) وتستأنف من ملفات .part
+                with YDL_SESSION_POOL.session(ydl_opts) as ydl:
+                    # الاستخراج أولاً لمعرفة الصيغ المختارة وحجمها، ثم القبول (والانتظار إن لزم) قبل طلب الوسائط
+                    info = ydl.extract_info(self.url, download=False)
+                    with self._policy_format(ydl, info) as selected:
+                        self._admit(selected)
+                        # تحميل فيديو/صوت فعلي؛ نحتاج info لمعرفة المسارات النهائية
+                        info = ydl.process_ie_result(info, download=True)
+                    return info, self._collect_artifacts(ydl, info)
+
+            info, artifacts = self._with_retries(download_once)
+            self.artifacts_ready.emit(artifacts)
+            if options.get('verify_integrity', True) and artifacts.get('media'):
+                integrity = self._verify_outputs(artifacts['media'], info.get('duration'),
+                                                 options.get('full_decode', False))
+                self.integrity_ready.emit(integrity)
+                failed = [report for report in integrity.values() if not report['ok']]
+                if failed:
+                    self.download_error.emit(f"فشل التحقق من سلامة الملف {failed[0]['path']}: {failed[0]['errors']}")
+                    return
+            main_file = (artifacts.get('media') or artifacts.get('thumbnail') or artifacts.get('description') or [''])[0]
+            self.download_finished.emit(main_file)
         except SystemExit:
-            pass
+            # حالة نهائية صريحة: بدونها يبقى صف المهمة 'running' في القائمة
+            self.job_status = 'cancelled'
+            self.download_cancelled.emit()
         except Exception as e:
             self.download_error.emit(f"خطأ أثناء التحميل: {e}")
         finally:
+            DISK_ADMISSION.release(self.job_id)
             self.is_downloading = False
 
+    def _harvest_auxiliary(self, options):
+        """تنزيل الصورة المصغرة و/أو الوصف فقط عبر MetadataHarvester."""
+        fields = [field for field, wanted in (('thumbnail', options.get('write_thumbnail')),
+                                              ('description', options.get('write_description'))) if wanted]
+        harvester = MetadataHarvester(fields, max_workers=1)
+        _results, errors = harvester.harvest([self.url], name_template=options['title_slug'], job_id=self.job_id,
+                                             seed_info=options.get('video_info'))
+        if errors:
+            self.download_error.emit(f"خطأ أثناء التحميل: {errors[0][1]}")
+            return
+        artifacts = ARTIFACT_INDEX.get(self.job_id)
+        self.artifacts_ready.emit(artifacts)
+        self.download_finished.emit((artifacts.get('thumbnail') or artifacts.get('description') or [''])[0])
+
+    def _record_live(self, options):
+        """تسجيل بث مباشر حتى انتهائه أو الإلغاء؛ كل مقطع منتهٍ يُرسل فوراً."""
+        recorder = LiveRecorder(self.url, options['title_slug'], job_id=self.job_id,
+                                retain_segments=options.get('retain_segments', LIVE_RETAIN_SEGMENTS),
+                                on_segment=self.live_segment_ready.emit, on_disk_wait=self._on_disk_wait,
+                                on_segment_removed=self.live_segment_removed.emit)
+        segments = recorder.record(self._live_stop)
+        self.artifacts_ready.emit(ARTIFACT_INDEX.get(self.job_id))
+        self.download_finished.emit(segments[-1] if segments else '')
+
+    def _collect_artifacts(self, ydl, info):
+        """تسجيل المسارات النهائية لكل ملف ناتج في فهرس المهمة (بدون تخمين الامتدادات)."""
+        for download in info.get('requested_downloads') or []:
+            if download.get('filepath'):
+                ARTIFACT_INDEX.add(self.job_id, 'media', download['filepath'])
+        for thumbnail in info.get('thumbnails') or []:
+            if thumbnail.get('filepath'):
+                ARTIFACT_INDEX.add(self.job_id, 'thumbnail', OUTPUT_LAYOUT.to_final_path(thumbnail['filepath']))
+        if ydl.params.get('writedescription') and info.get('description') is not None:
+            ARTIFACT_INDEX.add(self.job_id, 'description', ydl.prepare_filename(info, 'description'))
+        return ARTIFACT_INDEX.get(self.job_id)
+
+    def _verify_outputs(self, media_paths, expected_duration, full_decode=False):
+        """التحقق من الملفات النهائية بعد كل المعالجات اللاحقة.
+
+        المجموع المحسوب أثناء التحميل يُستخدم فقط إذا لم يُعِد أي معالج كتابة الملف؛
+        غير ذلك (دمج، تصحيح، تحويل) يُحسب من الملف النهائي.
+        """
+        names = {os.path.abspath(OUTPUT_LAYOUT.to_final_path(name)): name for name in self._hasher.digests}
+        reports = {}
+        for path in media_paths:
+            name = names.get(os.path.abspath(path))
+            inline = self._hasher.digest_for(name, path) if name else None
+            reports[path] = verify_media_integrity(path, expected_duration, inline, full_decode)
+        return reports
+
     # ... (بقية دوال المساعدة لـ YtdlpWorker)
     def cancel_download(self):
-        """إلغاء التحميل."""
+        """إلغاء التحميل (أو إيقاف تسجيل البث مع الاحتفاظ بالمقاطع المنتهية)."""
         self._is_cancelled = True
+        self._live_stop.set()
 
     def _format_size(self, bytes_val):
         """تحويل البايت إلى KB/MB/GB."""
@@ -292,32 +1706,60 @@ class YtdlpWorker(QThread):
         else:
             return f"{bytes_val / (1024 * 1024 * 1024):.1f} GB"
 
-    def _size_to_sortable(self, size_str):
-        """تحويل حجم الملف إلى رقم قابل للفرز."""
-        if 'KB' in size_str:
-            return float(size_str.replace(' KB', ''))
-        elif 'MB' in size_str:
-            return float(size_str.replace(' MB', '')) * 1024
-        elif 'GB' in size_str:
-            return float(size_str.replace(' GB', '')) * 1024 * 1024
-        return 0
-
 
 # ----------------------------------------------------------------------
 ## 3.1 عامل التحويل في خيط منفصل (Conversion Worker)
 # ----------------------------------------------------------------------
-class ConversionWorker(QThread):
+# اختيارات codec_combo => مرمّز ffmpeg
+VIDEO_CODEC_CHOICES = {"libx264 (H.264)": 'libx264', "libx265 (HEVC)": 'libx265', "vp9": 'libvpx-vp9',
+                       "copy (الأصلي)": 'copy'}
+# حاويات لا تقبل الصوت الأصلي غالباً (AAC/Opus) => مرمّز صوت متوافق
+CONTAINER_AUDIO_CODECS = {'webm': 'libopus', 'avi': 'libmp3lame'}
+# ترميزات الفيديو التي تقبلها كل حاوية؛ الحاوية غير المذكورة (mkv) تقبل أي ترميز
+CONTAINER_VIDEO_CODECS = {'webm': {'vp8', 'vp9', 'av1'},
+                          'mp4': {'h264', 'hevc', 'av1', 'vp9', 'mpeg4'},
+                          'mov': {'h264', 'hevc', 'mpeg4', 'prores', 'mjpeg'},
+                          'avi': {'h264', 'mpeg4', 'mjpeg'}}
+# مرمّز إعادة الترميز عندما لا تقبل الحاوية الترميز الأصلي مع copy
+CONTAINER_DEFAULT_ENCODERS = {'webm': 'libvpx-vp9', 'mp4': 'libx264', 'mov': 'libx264', 'avi': 'libx264'}
+ENCODER_CODECS = {'libx264': 'h264', 'libx265': 'hevc', 'libvpx-vp9': 'vp9'}
+
+
+def resolve_video_codec(video_codec, container, source_codec, source_path=None):
+    """المرمّز الفعلي لـ ffmpeg: copy فقط إذا قبلت الحاوية الترميز الأصلي، وإلا إعادة ترميز بمرمّز الحاوية.
+
+    ترميز أصلي مجهول (لا ffprobe) يُنسخ فقط إذا لم تتغير الحاوية. مرمّز صريح لا تقبله الحاوية خطأ.
+    """
+    allowed = CONTAINER_VIDEO_CODECS.get(container)
+    if video_codec == 'copy':
+        same_container = source_path is not None and os.path.splitext(source_path)[1].lstrip('.') == container
+        if allowed is None or source_codec in allowed or (source_codec is None and same_container):
+            return 'copy'
+        return CONTAINER_DEFAULT_ENCODERS[container]
+    if allowed is not None and ENCODER_CODECS.get(video_codec, video_codec) not in allowed:
+        raise ValueError(f"الحاوية {container} لا تدعم المرمّز {video_codec}")
+    return video_codec
+
+
+class ConversionWorker(PooledWorker):
     conversion_progress = pyqtSignal(int)
     conversion_finished = pyqtSignal()
     conversion_error = pyqtSignal(str)
+    media_converted = pyqtSignal(dict)  # {'source', 'path', 'file_size', 'sha256'} لتحديث الفهرس
 
     def __init__(self, url, options):
         super().__init__()
         self.url = url
         self.options = options
         self._is_cancelled = False
+        self.conversion_error.connect(self._mark_failed, Qt.ConnectionType.DirectConnection)
 
+    @profiled_run
     def run(self):
+        if self._is_cancelled:
+            # أُلغيت وهي تنتظر دورها في المجدول
+            self.job_status = 'cancelled'
+            return
         try:
             is_image_conversion_needed = self.options['image_format'] != '-- الأصلي (لا تحويل) --'
 
@@ -325,17 +1767,17 @@ class ConversionWorker(QThread):
             if is_image_conversion_needed:
                 self._convert_image()
 
-            # 2. محاكاة تحويل الفيديو/الصوت (إذا طُلب)
+            # 2. تحويل الفيديو/الصوت عبر ffmpeg (إذا طُلب)
             if self.options['is_video_convert']:
                  # إذا لم يكن هناك تحويل للصورة، نبدأ من 0
                  start_progress = 50 if is_image_conversion_needed else 0
-
-                 self.conversion_progress.emit(start_progress + 5)
-                 time.sleep(1.5) # محاكاة وقت التحويل
+                 self._convert_video(start_progress)
 
             self.conversion_progress.emit(100)
             self.conversion_finished.emit()
 
+        except InterruptedError:
+            self.job_status = 'cancelled'
         except Exception as e:
             self.conversion_error.emit(f"خطأ في التحويل: {e}")
 
@@ -347,37 +1789,29 @@ class ConversionWorker(QThread):
         target_ext = self.options['image_format'].lower() # مثلاً 'png'
         file_slug = self.options["title_slug"] # هذا هو الـ slug المصحح (عنوان الفيديو)
 
-        # 1. تحديد الملف الأصلي (نبحث عن webp أو jpg/jpeg)
-
-        # قائمة الامتدادات المحتملة لملف الصورة المصغرة الذي تم تنزيله بواسطة yt-dlp
-        possible_exts = ['webp', 'jpg', 'jpeg']
-        original_file_path = None
-
-        for ext in possible_exts:
-            # نبحث عن الملف في مسار downloads باسم الـ slug
-            temp_path = f'downloads/{file_slug}.{ext}'
-            if os.path.exists(temp_path):
-                original_file_path = temp_path
-                break
+        # 1. تحديد الملف الأصلي من فهرس ملفات المهمة (بدون تخمين الامتدادات)
+        thumbnails = self.options.get('artifacts', {}).get('thumbnail') or []
+        original_file_path = thumbnails[0] if thumbnails else None
 
-        if not original_file_path:
+        if not original_file_path or not os.path.exists(original_file_path):
             # نرفع خطأ إذا لم نجد ملف الصورة الأصلية
-            raise FileNotFoundError(f"لم يتم العثور على ملف الصورة المصغرة الأصلي لـ {file_slug} بأي صيغة متوقعة.")
+            raise FileNotFoundError(f"لم يتم العثور على ملف الصورة المصغرة الأصلي لـ {file_slug}.")
 
-        # 2. مسار ملف الإخراج الجديد
-        output_file_path = f'downloads/{file_slug}.{target_ext}'
+        # 2. مسار ملف الإخراج الجديد (بجوار الأصلي داخل مجلد التقسيم نفسه)
+        output_file_path = f'{os.path.splitext(original_file_path)[0]}.{target_ext}'
 
         self.conversion_progress.emit(10) # 10% لبدء المعالجة
 
         try:
-            # استخدام Pillow للتحويل
-            img = Image.open(original_file_path)
-            img.save(output_file_path)
+            # استخدام Pillow للتحويل (الكتابة إلى مسار مؤقت ثم إعادة تسمية ذرية)
+            with Image.open(original_file_path) as img, atomic_output_path(output_file_path) as temp_path:
+                img.save(temp_path)
 
             self.conversion_progress.emit(50) # 50% عند الانتهاء
 
             # حذف الملف الأصلي بعد التحويل لتجنب اللبس
-            os.remove(original_file_path)
+            if os.path.abspath(original_file_path) != os.path.abspath(output_file_path):
+                os.remove(original_file_path)
 
 
         except Exception as e:
@@ -385,10 +1819,1824 @@ class ConversionWorker(QThread):
             raise Exception(f"فشل تحويل الصورة المصغرة يدوياً إلى {target_ext}: {e}")
 
 
+    def _convert_video(self, start_progress):
+        """تحويل الملف المحمّل إلى الترميز/الحاوية المختارة عبر ffmpeg مع تقرير التقدم."""
+        media = self.options.get('artifacts', {}).get('media') or []
+        source = media[0] if media else None
+        if not source or not os.path.exists(source):
+            raise FileNotFoundError(f"لم يتم العثور على ملف الفيديو لـ {self.options['title_slug']}.")
+
+        features = self.options.get('features') or {}
+        container = self.options.get('container') or os.path.splitext(source)[1].lstrip('.')
+        source_codec = features.get('source_codec') or probe_video_stream(source).get('codec')
+        video_codec = resolve_video_codec(self.options.get('video_codec') or 'copy', container, source_codec, source)
+        audio_codec = CONTAINER_AUDIO_CODECS.get(container, 'copy')
+        target = f"{os.path.splitext(source)[0]}.{container}"
+        duration = features.get('duration') or probe_duration(source)
+
+        with atomic_output_path(target) as temp_path:
+            process = subprocess.Popen(
+                ['ffmpeg', '-y', '-v', 'error', '-nostats', '-progress', 'pipe:1', '-i', source,
+                 '-map', '0:v:0?', '-map', '0:a?', '-c:v', video_codec, '-c:a', audio_codec, temp_path],
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            for line in process.stdout:
+                if self._is_cancelled:
+                    process.terminate()
+                    break
+                key, _, value = line.strip().partition('=')
+                if key == 'out_time_us' and value.isdigit() and duration:
+                    done = min(1.0, int(value) / 1e6 / duration)
+                    self.conversion_progress.emit(start_progress + int((99 - start_progress) * done))
+            _stdout, stderr = process.communicate()
+            if self._is_cancelled:
+                raise InterruptedError("Conversion cancelled by user.")
+            if process.returncode != 0:
+                raise RuntimeError(stderr.strip()[-500:] or f"ffmpeg exit {process.returncode}")
+
+        if os.path.abspath(source) != os.path.abspath(target):
+            os.remove(source)
+        # سجل الفهرس يجب أن يشير إلى الناتج الجديد ومجموعه، لا إلى المصدر المحذوف
+        self.media_converted.emit({'source': source, 'path': target, 'file_size': os.path.getsize(target),
+                                   'sha256': file_sha256(target)})
+
     def cancel_conversion(self):
         self._is_cancelled = True
 
 
+# ----------------------------------------------------------------------
+## 3.1.1 نموذج كلفة التحويل والجدولة (Conversion Cost Model & Scheduler)
+# ----------------------------------------------------------------------
+COST_MODEL_PATH = os.path.join(OUTPUT_ROOT, 'conversion_costs.json')
+REFERENCE_PIXELS = 1920 * 1080
+COST_EWMA_ALPHA = 0.3
+PROCESS_OVERHEAD_SECONDS = 0.5
+IMAGE_CONVERSION_SECONDS = 0.2
+HEAVY_CONVERSION_SECONDS = 120  # مهمة أطول من هذا تُعد ترميزاً ثقيلاً
+# ثوانٍ لكل ثانية وسائط عند 1080p (تقديرات أولية تحل محلها القياسات على هذا الجهاز)
+DEFAULT_COST_RATES = {'copy': 0.01, 'libx264': 0.6, 'libx265': 2.5, 'libvpx-vp9': 3.0}
+
+
+def probe_video_stream(path):
+    """ترميز وأبعاد أول مسار فيديو ومدة الملف عبر ffprobe؛ قاموس فارغ إذا تعذر."""
+    if not path or not shutil.which('ffprobe'):
+        return {}
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries',
+         'stream=codec_name,width,height:format=duration', '-of', 'json', path],
+        capture_output=True, text=True)
+    try:
+        data = json.loads(result.stdout)
+    except ValueError:
+        return {}
+    stream = (data.get('streams') or [{}])[0]
+    duration = (data.get('format') or {}).get('duration')
+    return {'codec': stream.get('codec_name'), 'width': stream.get('width'), 'height': stream.get('height'),
+            'duration': float(duration) if duration else None}
+
+
+def conversion_features(options):
+    """خصائص مهمة التحويل التي يبني عليها نموذج الكلفة."""
+    media = (options.get('artifacts') or {}).get('media') or []
+    stream = probe_video_stream(media[0]) if options.get('is_video_convert') and media else {}
+    target = None
+    if options.get('is_video_convert'):
+        target = options.get('video_codec') or 'copy'
+        if media:
+            container = options.get('container') or os.path.splitext(media[0])[1].lstrip('.')
+            # copy إلى حاوية لا تقبل الترميز يصبح إعادة ترميز، فكلفته كلفة المرمّز الفعلي
+            with contextlib.suppress(ValueError, KeyError):
+                target = resolve_video_codec(target, container, stream.get('codec'), media[0])
+    return {
+        'target': target,
+        'source_codec': stream.get('codec'),
+        'duration': stream.get('duration') or (options.get('video_info') or {}).get('duration') or 0,
+        'pixels': (stream.get('width') or 0) * (stream.get('height') or 0) or REFERENCE_PIXELS,
+        'image': options.get('image_format') != '-- الأصلي (لا تحويل) --',
+    }
+
+
+class ConversionCostModel:
+    """توقع زمن التحويل من المدة والدقة والترميز المصدر والهدف، مع التعلم من المهام المنتهية.
+
+    الكلفة = معدل (ثانية لكل ثانية وسائط عند 1080p) × المدة × نسبة البكسلات + كلفة ثابتة.
+    المعدل لكل (هدف، مصدر) يُحدَّث بمتوسط أسي (EWMA) ويُحفظ في ملف JSON.
+    """
+    def __init__(self, path=COST_MODEL_PATH, alpha=COST_EWMA_ALPHA):
+        self.path = path
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self.rates = {}
+        if path and os.path.exists(path):
+            # ملف تالف أو غير مقروء لا يمنع التحويل: نبدأ من التقديرات الأولية ويُعاد كتابته ذرياً
+            try:
+                with open(path, encoding='utf-8') as fh:
+                    rates = json.load(fh)
+            except (OSError, ValueError):
+                rates = {}
+            if isinstance(rates, dict):
+                self.rates = {key: value for key, value in rates.items() if isinstance(value, (int, float))}
+
+    @staticmethod
+    def _key(features):
+        return f"{features['target']}:{features['source_codec'] or '?'}"
+
+    @staticmethod
+    def _scale(features):
+        # النسخ (remux) يعتمد على الحجم لا على فك الترميز، فنقيسه بالمدة فقط
+        if features['target'] == 'copy':
+            return features['duration']
+        return features['duration'] * features['pixels'] / REFERENCE_PIXELS
+
+    def _rate(self, features):
+        with self._lock:
+            return self.rates.get(self._key(features),
+                                  self.rates.get(f"{features['target']}:*",
+                                                 DEFAULT_COST_RATES.get(features['target'], DEFAULT_COST_RATES['libx264'])))
+
+    def predict(self, features):
+        """الزمن المتوقع بالثواني."""
+        seconds = IMAGE_CONVERSION_SECONDS if features['image'] else 0.0
+        if features['target']:
+            seconds += PROCESS_OVERHEAD_SECONDS + self._rate(features) * self._scale(features)
+        return seconds
+
+    def observe(self, features, elapsed):
+        """تحديث المعدل من زمن مهمة منتهية على هذا الجهاز."""
+        scale = self._scale(features) if features['target'] else 0
+        if not scale:
+            return
+        video_seconds = elapsed - PROCESS_OVERHEAD_SECONDS - (IMAGE_CONVERSION_SECONDS if features['image'] else 0)
+        observed = max(0.0, video_seconds) / scale
+        with self._lock:
+            for key in (self._key(features), f"{features['target']}:*"):
+                previous = self.rates.get(key)
+                self.rates[key] = observed if previous is None else previous + self.alpha * (observed - previous)
+            rates = dict(self.rates)
+        if self.path:
+            with atomic_output_path(self.path) as temp_path:
+                with open(temp_path, 'w', encoding='utf-8') as fh:
+                    json.dump(rates, fh, indent=1, sort_keys=True)
+
+
+class ConversionScheduler:
+    """ترتيب مهام التحويل حسب كلفتها المتوقعة بدل ترتيب النقر.
+
+    sjf: الأقصر أولاً. edf: الأقرب موعداً نهائياً أولاً (المهام بلا موعد بعدها، الأقصر أولاً).
+    max_heavy يحدّ عدد الترميزات الثقيلة المتزامنة حتى لا تحجز كل الأنوية وتنتظر المهام الرخيصة.
+    """
+    def __init__(self, cost_model=None, policy='sjf', max_parallel=None, max_heavy=1,
+                 heavy_seconds=HEAVY_CONVERSION_SECONDS):
+        if policy not in ('sjf', 'edf'):
+            raise ValueError(f"سياسة جدولة غير معروفة: {policy}")
+        self.cost_model = cost_model or ConversionCostModel()
+        self.policy = policy
+        self.max_parallel = max_parallel or max(1, available_cores() // 2)
+        self.max_heavy = max_heavy
+        self.heavy_seconds = heavy_seconds
+        self._pending = []
+        self._running = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._idle = threading.Event()
+        self._idle.set()
+
+    def _sort_key(self, entry):
+        if self.policy == 'edf':
+            return (entry['deadline'] is None, entry['deadline'] or 0, entry['predicted'], entry['seq'])
+        return (entry['predicted'], entry['seq'])
+
+    def submit(self, worker, deadline=None):
+        """إضافة عامل تحويل (ConversionWorker) للجدول؛ تعيد الزمن المتوقع بالثواني."""
+        features = conversion_features(worker.options)
+        worker.options['features'] = features
+        entry = {'worker': worker, 'features': features, 'predicted': self.cost_model.predict(features),
+                 'deadline': deadline, 'seq': next(self._sequence), 'started_at': None}
+        entry['heavy'] = entry['predicted'] >= self.heavy_seconds
+        worker.finished.connect(functools.partial(self._on_finished, entry), Qt.ConnectionType.DirectConnection)
+        with self._lock:
+            self._pending.append(entry)
+            self._idle.clear()
+        self._dispatch()
+        return entry['predicted']
+
+    def _dispatch(self):
+        to_start = []
+        with self._lock:
+            self._pending.sort(key=self._sort_key)
+            heavy_running = sum(1 for entry in self._running if entry['heavy'])
+            for entry in list(self._pending):
+                if len(self._running) >= self.max_parallel:
+                    break
+                if entry['heavy'] and heavy_running >= self.max_heavy:
+                    continue
+                self._pending.remove(entry)
+                self._running.append(entry)
+                heavy_running += entry['heavy']
+                entry['started_at'] = time.monotonic()
+                to_start.append(entry['worker'])
+        for worker in to_start:
+            worker.start()
+
+    def _on_finished(self, entry):
+        elapsed = time.monotonic() - entry['started_at']
+        with self._lock:
+            self._running.remove(entry)
+        if entry['worker'].job_status == 'done':
+            self.cost_model.observe(entry['features'], elapsed)
+        self._dispatch()
+        with self._lock:
+            if not self._pending and not self._running:
+                self._idle.set()
+
+    def pending(self):
+        """المهام المنتظرة بترتيب التنفيذ مع زمنها المتوقع."""
+        with self._lock:
+            return [(entry['worker'], entry['predicted']) for entry in sorted(self._pending, key=self._sort_key)]
+
+    def wait(self, timeout=None):
+        return self._idle.wait(timeout)
+
+
+_conversion_scheduler = None
+
+
+def conversion_scheduler():
+    """مجدول التحويل المشترك (يُنشأ عند أول استخدام لأنه يقرأ ملف النموذج)."""
+    global _conversion_scheduler
+    if _conversion_scheduler is None:
+        _conversion_scheduler = ConversionScheduler()
+    return _conversion_scheduler
+
+
+# ----------------------------------------------------------------------
+## 3.2 محرك اختيار الصيغ التلقائي (Format Selection Engine)
+# ----------------------------------------------------------------------
+# بادئات الترميزات التي يمكن وضعها في الحاوية دون إعادة ترميز (Remux فقط)
+REMUX_FRIENDLY_CODECS = {
+    'mp4': ('avc1', 'h264', 'hev1', 'hvc1', 'av01', 'mp4a', 'aac'),
+    'webm': ('vp8', 'vp9', 'vp09', 'av01', 'opus', 'vorbis'),
+    'mkv': None,  # mkv يقبل كل الترميزات
+}
+
+
+class FormatPolicy:
+    """سياسة الاختيار التلقائي للصيغ بدلاً من النقر اليدوي."""
+    def __init__(self, max_mb_per_minute=None, total_budget_bytes=None,
+                 remux_container=None, max_height=None):
+        self.max_mb_per_minute = max_mb_per_minute
+        self.total_budget_bytes = total_budget_bytes
+        self.remux_container = remux_container
+        self.max_height = max_height
+
+
+class FormatSelectionEngine:
+    """اختيار صيغة لكل عنصر من الأحجام ومعدلات البت الدقيقة، مع التحسين على مستوى الدفعة كاملة.
+
+    كل عنصر قاموس بالشكل: {'key': ..., 'duration': ثوانٍ, 'formats': [صيغ _fetch_formats]}.
+    حد الميغابايت لكل دقيقة يُحسب من الحجم ÷ المدة، وإذا كانت المدة مجهولة فمن معدل البت (tbr)؛
+    خيار لا يُعرف له أي منهما يُستبعد بدل تجاوز الحد بصمت.
+    """
+    def __init__(self, policy):
+        self.policy = policy
+
+    @staticmethod
+    def item_from_info(info):
+        """عنصر للمحرك من نتيجة extract_info الخام (بنفس حقول صيغ _fetch_formats)."""
+        return {'key': info.get('id') or info.get('webpage_url'), 'duration': info.get('duration'),
+                'formats': [{'id': f['format_id'], 'filesize_bytes': f.get('filesize') or f.get('filesize_approx'),
+                             'tbr': f.get('tbr'), 'height': f.get('height'), 'vcodec': f.get('vcodec'),
+                             'acodec': f.get('acodec')}
+                            for f in info.get('formats') or [] if f.get('format_id')]}
+
+    @staticmethod
+    def _estimated_bytes(fmt, duration):
+        if fmt.get('filesize_bytes'):
+            return fmt['filesize_bytes']
+        if fmt.get('tbr') and duration:
+            return int(fmt['tbr'] * 1000 / 8 * duration)
+        return None
+
+    @staticmethod
+    def _mb_per_minute(total_bytes, duration, video, audio):
+        if duration:
+            return total_bytes / (1024 * 1024) / (duration / 60)
+        if not video.get('tbr'):
+            return None
+        bitrate = video['tbr'] + ((audio or {}).get('tbr') or 0)
+        return bitrate * 1000 / 8 * 60 / (1024 * 1024)
+
+    def _is_remux_friendly(self, codec):
+        allowed = REMUX_FRIENDLY_CODECS.get(self.policy.remux_container)
+        if not self.policy.remux_container or allowed is None:
+            return True
+        return bool(codec) and codec.lower().startswith(allowed)
+
+    def candidates(self, item):
+        """كل أزواج (فيديو + أفضل صوت) المسموحة للعنصر، مرتبة تصاعدياً حسب الحجم."""
+        duration = item.get('duration') or 0
+        formats = item['formats']
+        audios = [f for f in formats if f.get('vcodec') == 'none' and self._estimated_bytes(f, duration)]
+        friendly_audios = [a for a in audios if self._is_remux_friendly(a.get('acodec'))]
+        audios = friendly_audios or audios
+        audio = max(audios, key=lambda a: a.get('tbr') or 0) if audios else None
+        audio_bytes = self._estimated_bytes(audio, duration) if audio else 0
+
+        pairs = []
+        for fmt in formats:
+            if fmt.get('vcodec') in (None, 'none'):
+                continue
+            video_bytes = self._estimated_bytes(fmt, duration)
+            if not video_bytes:
+                continue
+            height = fmt.get('height') or 0
+            if self.policy.max_height and height > self.policy.max_height:
+                continue
+            total = video_bytes + audio_bytes
+            if self.policy.max_mb_per_minute:
+                mb_per_minute = self._mb_per_minute(total, duration, fmt, audio)
+                if mb_per_minute is None or mb_per_minute > self.policy.max_mb_per_minute:
+                    continue
+            pairs.append({
+                'format': f"{fmt['id']}+{audio['id']}" if audio else fmt['id'],
+                'expected_bytes': total,
+                'quality': height + (fmt.get('tbr') or 0) / 100000,
+                'remux_friendly': self._is_remux_friendly(fmt.get('vcodec')),
+                'video': fmt,
+                'audio': audio,
+            })
+
+        if any(p['remux_friendly'] for p in pairs):
+            pairs = [p for p in pairs if p['remux_friendly']]
+
+        # نُبقي فقط الخيارات التي تزيد الجودة مع زيادة الحجم (Pareto frontier)
+        pairs.sort(key=lambda p: (p['expected_bytes'], -p['quality']))
+        frontier = []
+        for pair in pairs:
+            if not frontier or pair['quality'] > frontier[-1]['quality']:
+                frontier.append(pair)
+        return frontier
+
+    def select(self, item):
+        """اختيار أفضل صيغة لعنصر واحد ضمن السياسة."""
+        return self.select_batch([item])[item['key']]
+
+    def select_batch(self, items):
+        """توزيع ميزانية التخزين على الدفعة: نبدأ بأصغر خيار لكل عنصر ثم نرقّي الأكثر فائدة لكل بايت.
+
+        تعيد قاموساً {key: اختيار أو None} حيث None تعني أن العنصر لا يتسع في الميزانية.
+        """
+        frontiers = {item['key']: self.candidates(item) for item in items}
+        chosen = {key: 0 for key, frontier in frontiers.items() if frontier}
+        budget = self.policy.total_budget_bytes
+
+        def used():
+            return sum(frontiers[key][idx]['expected_bytes'] for key, idx in chosen.items())
+
+        if budget is not None:
+            # إذا لم تتسع حتى أصغر الخيارات، نستبعد العناصر الأكبر أولاً
+            for key in sorted(chosen, key=lambda k: frontiers[k][0]['expected_bytes'], reverse=True):
+                if used() <= budget:
+                    break
+                del chosen[key]
+
+        while True:
+            remaining = None if budget is None else budget - used()
+            best_key, best_gain = None, 0
+            for key, idx in chosen.items():
+                if idx + 1 >= len(frontiers[key]):
+                    continue
+                current, upgrade = frontiers[key][idx], frontiers[key][idx + 1]
+                extra = upgrade['expected_bytes'] - current['expected_bytes']
+                if remaining is not None and extra > remaining:
+                    continue
+                gain = (upgrade['quality'] - current['quality']) / max(extra, 1)
+                if gain > best_gain:
+                    best_key, best_gain = key, gain
+            if best_key is None:
+                break
+            chosen[best_key] += 1
+
+        return {item['key']: frontiers[item['key']][chosen[item['key']]] if item['key'] in chosen else None
+                for item in items}
+
+
+# ----------------------------------------------------------------------
+## 3.3 فهرس الوسائط المحمّلة (SQLite Catalog)
+# ----------------------------------------------------------------------
+CATALOG_PATH = os.path.join(OUTPUT_ROOT, 'catalog.sqlite3')
+
+# امتدادات ملفات الوسائط عند استيراد مجلد موجود (غيرها: صور مصغرة، وصف، ملفات جزئية أو محجوزة)
+CATALOG_MEDIA_EXTS = ('.mp4', '.m4v', '.mkv', '.webm', '.mov', '.avi', '.flv', '.ts',
+                      '.m4a', '.mp3', '.opus', '.ogg', '.flac', '.wav', '.aac')
+YOUTUBE_ID_IN_NAME = re.compile(r'\[([A-Za-z0-9_-]{11})\]')
+
+CATALOG_COLUMNS = (
+    'video_id', 'title', 'uploader', 'channel_id', 'duration', 'upload_date', 'source_url',
+    'format', 'download_type', 'file_path', 'file_size', 'expected_size', 'sha256',
+    'started_at', 'completed_at', 'elapsed',
+)
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """حساب SHA-256 لملف بقراءة كاملة (الاستيراد، التحقق بلا مجموع من التحميل، ناتج التحويل)."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class MediaCatalog:
+    """فهرس SQLite محلي لكل مهمة مكتملة مع فهارس للبحث حسب المعرّف والقناة والتاريخ."""
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS media (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            video_id TEXT,
+            title TEXT,
+            uploader TEXT,
+            channel_id TEXT,
+            duration REAL,
+            upload_date TEXT,
+            source_url TEXT,
+            format TEXT,
+            download_type TEXT,
+            file_path TEXT NOT NULL UNIQUE,
+            file_size INTEGER,
+            expected_size INTEGER,
+            sha256 TEXT,
+            started_at REAL,
+            completed_at REAL,
+            elapsed REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_media_video_id ON media(video_id);
+        CREATE INDEX IF NOT EXISTS idx_media_channel ON media(channel_id, completed_at);
+        CREATE INDEX IF NOT EXISTS idx_media_completed ON media(completed_at);
+    """
+
+    def __init__(self, path=CATALOG_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        # الاتصال مشترك بين الخيوط، لذا نحميه بقفل
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.executescript(self.SCHEMA)
+
+    def record(self, entry):
+        """تسجيل (أو تحديث) ملف مكتمل؛ المفتاح الفريد هو مسار الملف."""
+        self.record_many([entry])
+
+    def record_many(self, entries):
+        """تسجيل عدة ملفات في معاملة واحدة."""
+        placeholders = ', '.join('?' for _ in CATALOG_COLUMNS)
+        updates = ', '.join(f'{c} = COALESCE(excluded.{c}, {c})' for c in CATALOG_COLUMNS if c != 'file_path')
+        sql = (f"INSERT INTO media ({', '.join(CATALOG_COLUMNS)}) VALUES ({placeholders}) "
+               f"ON CONFLICT(file_path) DO UPDATE SET {updates}")
+        rows = [tuple(entry.get(c) for c in CATALOG_COLUMNS) for entry in entries]
+        with self._lock, self._conn:
+            self._conn.executemany(sql, rows)
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params).fetchall()]
+
+    def has(self, video_id):
+        """هل سبق تحميل هذا الفيديو؟"""
+        with self._lock:
+            row = self._conn.execute('SELECT 1 FROM media WHERE video_id = ? LIMIT 1', (video_id,)).fetchone()
+        return row is not None
+
+    def relocate(self, old_path, new_path, **fields):
+        """نقل سجل ملف إلى مساره الجديد (بعد التحويل) مع تحديث حقوله مثل الحجم والمجموع."""
+        assignments = ', '.join(f'{column} = ?' for column in fields)
+        with self._lock, self._conn:
+            if new_path != old_path:
+                self._conn.execute('DELETE FROM media WHERE file_path = ?', (new_path,))
+            self._conn.execute(f"UPDATE media SET file_path = ?{', ' + assignments if fields else ''} "
+                               f"WHERE file_path = ?", (new_path, *fields.values(), old_path))
+
+    def remove(self, file_path):
+        """حذف سجل ملف لم يعد موجوداً على القرص."""
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM media WHERE file_path = ?', (file_path,))
+
+    def find_by_id(self, video_id):
+        return self._query('SELECT * FROM media WHERE video_id = ? ORDER BY completed_at DESC', (video_id,))
+
+    def find_by_channel(self, channel_id, since=None):
+        return self._query('SELECT * FROM media WHERE channel_id = ? AND completed_at >= ? ORDER BY completed_at DESC',
+                           (channel_id, since or 0))
+
+    def find_by_date(self, start, end):
+        """الملفات المكتملة بين طابعين زمنيين (ثوانٍ منذ epoch)."""
+        return self._query('SELECT * FROM media WHERE completed_at BETWEEN ? AND ? ORDER BY completed_at', (start, end))
+
+    def import_folder(self, folder, compute_checksums=False):
+        """استيراد مجلد موجود دفعة واحدة. يستخدم ملفات .info.json المجاورة والمعرّف داخل الاسم إن وُجدا."""
+        entries = []
+        for root, dirs, files in os.walk(folder):
+            # مجلد الملفات المؤقتة (OUTPUT_TEMP_DIR) وكل مجلد مخفي لا يحوي وسائط منتهية
+            dirs[:] = [name for name in dirs if name != OUTPUT_TEMP_DIR and not name.startswith('.')]
+            for name in files:
+                if name.startswith('.') or not name.lower().endswith(CATALOG_MEDIA_EXTS):
+                    continue
+                path = os.path.join(root, name)
+                stem = os.path.splitext(path)[0]
+                entry = {'file_path': path, 'title': os.path.splitext(name)[0]}
+                info_path = stem + '.info.json'
+                if os.path.exists(info_path):
+                    try:
+                        with open(info_path, encoding='utf-8') as fh:
+                            info = json.load(fh)
+                        entry.update({
+                            'video_id': info.get('id'),
+                            'title': info.get('title') or entry['title'],
+                            'uploader': info.get('uploader'),
+                            'channel_id': info.get('channel_id') or info.get('uploader_id'),
+                            'duration': info.get('duration'),
+                            'upload_date': info.get('upload_date'),
+                            'source_url': info.get('webpage_url'),
+                        })
+                    except (OSError, ValueError):
+                        pass
+                if not entry.get('video_id'):
+                    match = YOUTUBE_ID_IN_NAME.search(name)
+                    entry['video_id'] = match.group(1) if match else None
+                stat = os.stat(path)
+                entry['file_size'] = stat.st_size
+                entry['completed_at'] = stat.st_mtime
+                if compute_checksums:
+                    entry['sha256'] = file_sha256(path)
+                entries.append(entry)
+        self.record_many(entries)
+        return len(entries)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# ----------------------------------------------------------------------
+## 3.4 وضع اختبار التحمل (Soak Test)
+# ----------------------------------------------------------------------
+class _StandInHandler(http.server.BaseHTTPRequestHandler):
+    """خادم محلي بديل يقدّم ملف فيديو صغير اصطناعي لكل مسار."""
+    payload = b'\x00\x00\x00\x18ftypmp42' + b'\x00' * (64 * 1024)
+    protocol_version = 'HTTP/1.1'
+
+    def _send_headers(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Content-Length', str(len(self.payload)))
+        self.end_headers()
+
+    def do_HEAD(self):
+        self._send_headers()
+
+    def do_GET(self):
+        self._send_headers()
+        self.wfile.write(self.payload)
+
+    def log_message(self, *_args):
+        pass
+
+
+def start_stand_in_server(handler=_StandInHandler):
+    """تشغيل خادم HTTP محلي على منفذ عشوائي في خيط خلفي."""
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _process_memory_mb():
+    """الذاكرة المقيمة (RSS) للعملية بالميغابايت."""
+    try:
+        with open('/proc/self/statm') as fh:
+            return int(fh.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _process_thread_count():
+    try:
+        return len(os.listdir('/proc/self/task'))
+    except OSError:
+        return threading.active_count()
+
+
+def run_soak_test(job_count, concurrency=4, sample_every=250):
+    """تشغيل آلاف مهام الجلب الاصطناعية عبر YtdlpWorker الحقيقي وتقرير نمو الذاكرة والخيوط."""
+    app = QCoreApplication.instance() or QCoreApplication(sys.argv[:1])
+    server = start_stand_in_server()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    state = {'started': 0, 'finished': 0, 'errors': 0, 'in_flight': set()}
+    samples = []
+
+    def sample():
+        samples.append((state['finished'], _process_memory_mb(), _process_thread_count(),
+                        len(JOB_REGISTRY.active), len(JOB_REGISTRY.history)))
+
+    def on_error(_message):
+        state['errors'] += 1
+
+    def launch():
+        while state['started'] < job_count and len(state['in_flight']) < concurrency:
+            state['started'] += 1
+            worker = YtdlpWorker(url=f"{base_url}/video/{state['started']}.mp4")
+            worker.download_error.connect(on_error)
+            worker.finished.connect(functools.partial(on_finished, worker))
+            state['in_flight'].add(worker)
+            worker.start()
+
+    def on_finished(worker):
+        state['finished'] += 1
+        state['in_flight'].discard(worker)
+        release_worker(worker)
+        if state['finished'] % sample_every == 0:
+            sample()
+        if state['finished'] >= job_count:
+            app.quit()
+        else:
+            launch()
+
+    sample()
+    started = time.monotonic()
+    QTimer.singleShot(0, launch)
+    app.exec()
+    elapsed = time.monotonic() - started
+    worker_pool().waitForDone()
+    server.shutdown()
+    sample()
+
+    print(f"soak: {job_count} jobs in {elapsed:.1f}s ({job_count / max(elapsed, 1e-9):.1f} jobs/s), errors: {state['errors']}")
+    print(f"{'jobs':>8} {'rss MB':>9} {'threads':>8} {'active':>7} {'history':>8}")
+    for finished, rss, threads, active, history in samples:
+        print(f"{finished:>8} {rss:>9.1f} {threads:>8} {active:>7} {history:>8}")
+    first, last = samples[0], samples[-1]
+    print(f"growth: rss {last[1] - first[1]:+.1f} MB, threads {last[2] - first[2]:+d}")
+    return samples
+
+
+# ----------------------------------------------------------------------
+## 3.5 نماذج القوائم الكبيرة (Model/View)
+# ----------------------------------------------------------------------
+SORT_ROLE = Qt.ItemDataRole.UserRole + 1
+LAZY_BATCH_SIZE = 200
+
+
+class FormatListModel(QAbstractListModel):
+    """نموذج الصيغ: الصفوف تُنشأ عند الحاجة (fetchMore) والنص يُولَّد عند العرض فقط."""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._formats = []
+        self._loaded = 0
+
+    def set_formats(self, formats):
+        self.beginResetModel()
+        self._formats = list(formats)
+        self._loaded = min(LAZY_BATCH_SIZE, len(self._formats))
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._loaded
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._loaded < len(self._formats)
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        count = min(LAZY_BATCH_SIZE, len(self._formats) - self._loaded)
+        if count <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self._loaded, self._loaded + count - 1)
+        self._loaded += count
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= self._loaded:
+            return None
+        fmt = self._formats[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return f"⚙️ {fmt['resolution']} - {fmt['ext']} ({fmt['filesize']}) - {fmt['note']}"
+        if role == Qt.ItemDataRole.UserRole:
+            return fmt
+        if role == SORT_ROLE:
+            return fmt.get('filesize_bytes') or 0
+        return None
+
+
+class FormatFilterProxyModel(QSortFilterProxyModel):
+    """الفرز والتصفية داخل النموذج بدل إعادة بناء القائمة صفاً صفاً."""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.show_audio_only = False
+        self.setSortRole(SORT_ROLE)
+        self.setDynamicSortFilter(True)
+
+    def set_show_audio_only(self, show):
+        self.show_audio_only = show
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        fmt = self.sourceModel().index(source_row, 0, source_parent).data(Qt.ItemDataRole.UserRole)
+        # عرض فقط صيغ الفيديو التي يمكن دمجها (لتجنب عرض صيغ الصوت المنفصلة هنا)
+        return self.show_audio_only or fmt.get('vcodec') != 'none'
+
+
+JOB_TERMINAL_STATUSES = ('done', 'error', 'cancelled')
+
+
+class JobListModel(QAbstractListModel):
+    """نموذج قائمة المهام مع تحديثات تقدم مجمّعة (دفعة واحدة كل FLUSH_INTERVAL_MS)."""
+    FLUSH_INTERVAL_MS = 100
+
+    def __init__(self, max_rows=5000, parent=None):
+        super().__init__(parent)
+        self.max_rows = max_rows
+        self._jobs = []
+        self._rows = {}
+        self._pending = {}
+        self._flush_timer = QTimer(self)
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.setInterval(self.FLUSH_INTERVAL_MS)
+        self._flush_timer.timeout.connect(self._flush)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._jobs)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= len(self._jobs):
+            return None
+        job = self._jobs[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return f"#{job['job_id']} {job['title']} - {job['status']} ({job['progress']}%)"
+        if role == Qt.ItemDataRole.UserRole:
+            return job
+        return None
+
+    def add_jobs(self, jobs):
+        """إضافة عدة مهام بعملية إدراج واحدة."""
+        if not jobs:
+            return
+        self._trim(len(jobs))
+        first = len(self._jobs)
+        self.beginInsertRows(QModelIndex(), first, first + len(jobs) - 1)
+        for job in jobs:
+            job.setdefault('status', 'queued')
+            job.setdefault('progress', 0)
+            self._rows[job['job_id']] = len(self._jobs)
+            self._jobs.append(job)
+        self.endInsertRows()
+
+    def update_job(self, job_id, **changes):
+        """تسجيل تغيير مؤجل؛ التغييرات المتتالية للمهمة نفسها تُدمج قبل العرض."""
+        if job_id not in self._rows:
+            return
+        self._pending.setdefault(job_id, {}).update(changes)
+        if not self._flush_timer.isActive():
+            self._flush_timer.start()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        rows = []
+        for job_id, changes in self._pending.items():
+            row = self._rows.get(job_id)
+            if row is not None:
+                self._jobs[row].update(changes)
+                rows.append(row)
+        self._pending.clear()
+        if rows:
+            self.dataChanged.emit(self.index(min(rows)), self.index(max(rows)))
+
+    def _trim(self, incoming):
+        """حذف أقدم المهام المنتهية عند تجاوز الحد الأقصى للصفوف."""
+        overflow = len(self._jobs) + incoming - self.max_rows
+        if overflow <= 0:
+            return
+        self._flush()
+        removable = [row for row, job in enumerate(self._jobs)
+                     if job['status'] in JOB_TERMINAL_STATUSES][:overflow]
+        for row in reversed(removable):
+            self.beginRemoveRows(QModelIndex(), row, row)
+            del self._jobs[row]
+            self.endRemoveRows()
+        self._rows = {job['job_id']: row for row, job in enumerate(self._jobs)}
+
+
+# ----------------------------------------------------------------------
+## 3.6 طابور مهام مشترك بين عدة عمليات وأجهزة (Shared Job Queue)
+# ----------------------------------------------------------------------
+QUEUE_LEASE_SECONDS = 60
+QUEUE_HEARTBEAT_SECONDS = 15
+QUEUE_POLL_SECONDS = 2
+# قالب اسم الملف لمهام الطابور (العنوان غير معروف قبل الاستخراج)
+QUEUE_TITLE_TEMPLATE = '%(title).80B [%(id)s]'
+# بديل عند غياب العنوان (مسار الصور المصغرة بلا استخراج) حتى لا تُسمى كل الملفات "NA [<id>]"
+QUEUE_ID_TEMPLATE = '[%(id)s]'
+
+
+class SharedJobQueue:
+    """طابور مهام دائم في ملف SQLite مع مطالبات مؤقتة (Leases) ونبضات حياة.
+
+    يمكن لعدة عمليات (على جهاز واحد أو عدة أجهزة تتشارك نظام ملفات يدعم أقفال SQLite)
+    سحب المهام منه؛ المهمة التي تنتهي مهلة مطالبتها تعود للطابور تلقائياً.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            url TEXT NOT NULL,
+            options TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 3,
+            lease_owner TEXT,
+            lease_host TEXT,
+            lease_expires REAL,
+            created_at REAL,
+            updated_at REAL,
+            error TEXT,
+            result TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs(status, lease_expires, id);
+        CREATE INDEX IF NOT EXISTS idx_jobs_host ON jobs(lease_host, status);
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript(self.SCHEMA)
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """معاملة BEGIN IMMEDIATE: قفل كتابة واحد على مستوى الملف بين كل العمليات."""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    def enqueue(self, url, options=None, max_attempts=3):
+        return self.enqueue_many([url], options, max_attempts)[0]
+
+    def enqueue_many(self, urls, options=None, max_attempts=3):
+        now = time.time()
+        payload = json.dumps(options or {})
+        ids = []
+        with self._transaction() as conn:
+            for url in urls:
+                cursor = conn.execute(
+                    'INSERT INTO jobs (url, options, max_attempts, created_at, updated_at) VALUES (?, ?, ?, ?, ?)',
+                    (url, payload, max_attempts, now, now))
+                ids.append(cursor.lastrowid)
+        return ids
+
+    def claim(self, worker_id, host=None, lease_seconds=QUEUE_LEASE_SECONDS, host_limit=None):
+        """مطالبة أقدم مهمة متاحة (أو منتهية المهلة) مع احترام حد التزامن لكل جهاز."""
+        host = host or socket.gethostname()
+        now = time.time()
+        with self._transaction() as conn:
+            if host_limit is not None:
+                running = conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'running' AND lease_host = ? AND lease_expires > ?",
+                    (host, now)).fetchone()[0]
+                if running >= host_limit:
+                    return None
+            while True:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' OR (status = 'running' AND lease_expires <= ?) "
+                    "ORDER BY id LIMIT 1", (now,)).fetchone()
+                if row is None:
+                    return None
+                if row['status'] == 'running' and row['attempts'] >= row['max_attempts']:
+                    conn.execute("UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ?",
+                                 ('lease expired', now, row['id']))
+                    continue
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', lease_owner = ?, lease_host = ?, lease_expires = ?, "
+                    "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    (worker_id, host, now + lease_seconds, now, row['id']))
+                job = dict(row)
+                job['options'] = json.loads(job['options'])
+                job['attempts'] += 1
+                return job
+
+    def heartbeat(self, job_id, worker_id, lease_seconds=QUEUE_LEASE_SECONDS):
+        """تمديد المطالبة؛ تعيد False إذا فقد العامل المطالبة (انتهت وأخذها غيره)."""
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? WHERE id = ? AND lease_owner = ? AND status = 'running'",
+                (now + lease_seconds, now, job_id, worker_id))
+        return cursor.rowcount == 1
+
+    def complete(self, job_id, worker_id, result=None):
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, lease_expires = NULL, updated_at = ? "
+                "WHERE id = ? AND lease_owner = ?",
+                (json.dumps(result), time.time(), job_id, worker_id))
+
+    def fail(self, job_id, worker_id, error, retry=True):
+        """تسجيل فشل؛ تعاد المهمة للطابور إن بقيت محاولات."""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = CASE WHEN ? AND attempts < max_attempts THEN 'queued' ELSE 'failed' END, "
+                "error = ?, lease_owner = NULL, lease_host = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE id = ? AND lease_owner = ?",
+                (retry, error, time.time(), job_id, worker_id))
+
+    def stats(self):
+        with self._lock:
+            rows = self._conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall()
+        return {status: count for status, count in rows}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _run_queue_job(queue, job, worker_id, lease_seconds):
+    """تنفيذ مهمة واحدة عبر YtdlpWorker مع نبضات حياة حتى تنتهي."""
+    options = {'format': 'bestvideo*+bestaudio/best', 'postprocessor': [], 'title_slug': QUEUE_TITLE_TEMPLATE}
+    options.update(job['options'])
+    worker = YtdlpWorker(url=job['url'], download_options=options)
+    outcome = {}
+    direct = Qt.ConnectionType.DirectConnection
+    worker.download_error.connect(lambda message: outcome.setdefault('error', message), direct)
+    worker.artifacts_ready.connect(lambda artifacts: outcome.setdefault('artifacts', artifacts), direct)
+    worker.start()
+    try:
+        while not worker.wait(QUEUE_HEARTBEAT_SECONDS):
+            if not queue.heartbeat(job['id'], worker_id, lease_seconds):
+                # أخذ عامل آخر المهمة بعد انتهاء المهلة؛ نلغي نسختنا
+                worker.cancel_download()
+                worker.wait()
+                return
+        if 'error' in outcome:
+            # العامل استنفد محاولاته؛ الأخطاء غير الدائمة تعود للطابور لمحاولة لاحقة
+            queue.fail(job['id'], worker_id, outcome['error'], retry=worker.error_kind != ERROR_PERMANENT)
+        else:
+            queue.complete(job['id'], worker_id, outcome.get('artifacts'))
+    finally:
+        # لا حلقة أحداث في وضع العامل فلا يُنفَّذ deleteLater: نفصل الإشارات، والكائن يُحرَّر مع آخر مرجع له هنا
+        worker.download_error.disconnect()
+        worker.artifacts_ready.disconnect()
+
+
+def run_queue_worker(db_path, concurrency=2, host_limit=None, lease_seconds=QUEUE_LEASE_SECONDS,
+                     exit_when_empty=False):
+    """وضع العامل: عدة خيوط تسحب المهام من الطابور المشترك حتى يُطلب الإيقاف."""
+    queue = SharedJobQueue(db_path)
+    host = socket.gethostname()
+    stop = threading.Event()
+
+    def loop(slot):
+        worker_id = f"{host}:{os.getpid()}:{slot}"
+        while not stop.is_set():
+            # لا نأخذ مهمة (ولا مهلتها) إذا لم يبق على القرص إلا الهامش
+            if not DISK_ADMISSION.has_headroom():
+                stop.wait(QUEUE_POLL_SECONDS)
+                continue
+            job = queue.claim(worker_id, host, lease_seconds, host_limit)
+            if job is None:
+                if exit_when_empty:
+                    stats = queue.stats()
+                    if not stats.get('queued') and not stats.get('running'):
+                        return
+                stop.wait(QUEUE_POLL_SECONDS)
+                continue
+            print(f"[QUEUE]: {worker_id} job #{job['id']} (attempt {job['attempts']}) {job['url']}")
+            try:
+                _run_queue_job(queue, job, worker_id, lease_seconds)
+            except Exception as e:
+                queue.fail(job['id'], worker_id, str(e))
+
+    threads = [threading.Thread(target=loop, args=(slot,), daemon=True) for slot in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(1)
+    except KeyboardInterrupt:
+        stop.set()
+    print(f"[QUEUE]: {queue.stats()}")
+    queue.close()
+
+
+# ----------------------------------------------------------------------
+## 3.7 مسار سريع للبيانات الوصفية بالجملة (Metadata Fast Path)
+# ----------------------------------------------------------------------
+# روابط الصور المصغرة الثابتة لـ YouTube (بترتيب الأفضلية) - لا تحتاج استخراجاً
+YOUTUBE_THUMBNAIL_URLS = (
+    'https://i.ytimg.com/vi/{id}/maxresdefault.jpg',
+    'https://i.ytimg.com/vi/{id}/hqdefault.jpg',
+)
+METADATA_FIELDS = ('id', 'title', 'uploader', 'channel_id', 'uploader_id', 'upload_date',
+                   'duration', 'webpage_url', 'view_count', 'tags')
+METADATA_WORKERS = 8
+METADATA_BATCH_SIZE = 100
+
+
+class PooledHttpClient:
+    """عميل HTTP بسيط يُبقي اتصالاً دائماً (keep-alive) لكل مضيف في كل خيط."""
+    def __init__(self, timeout=20):
+        self.timeout = timeout
+        self._local = threading.local()
+        self._all = []
+        self._lock = threading.Lock()
+
+    def _connection(self, scheme, netloc):
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = {}
+        conn = connections.get((scheme, netloc))
+        if conn is None:
+            factory = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+            conn = connections[(scheme, netloc)] = factory(netloc, timeout=self.timeout)
+            with self._lock:
+                self._all.append(conn)
+        return conn
+
+    def _drop(self, scheme, netloc):
+        conn = self._local.connections.pop((scheme, netloc), None)
+        if conn is not None:
+            conn.close()
+
+    def get(self, url, max_redirects=3, headers=None):
+        """تعيد (رمز الحالة، المحتوى، نوع المحتوى)."""
+        request_headers = {'User-Agent': 'Mozilla/5.0', **(headers or {}), 'Connection': 'keep-alive'}
+        for _ in range(max_redirects + 1):
+            parts = urlsplit(url)
+            target = parts.path + (f'?{parts.query}' if parts.query else '')
+            for attempt in range(2):
+                conn = self._connection(parts.scheme, parts.netloc)
+                try:
+                    conn.request('GET', target or '/', headers=request_headers)
+                    response = conn.getresponse()
+                    body = response.read()
+                    break
+                except (http.client.HTTPException, OSError):
+                    # الاتصال المُعاد استخدامه قد يكون أُغلق من الخادم؛ نعيد المحاولة باتصال جديد مرة واحدة
+                    self._drop(parts.scheme, parts.netloc)
+                    if attempt:
+                        raise
+            if response.status in (301, 302, 303, 307, 308) and response.getheader('Location'):
+                url = urllib.parse.urljoin(url, response.getheader('Location'))
+                continue
+            return response.status, body, response.getheader('Content-Type', '')
+        raise http.client.HTTPException(f"too many redirects: {url}")
+
+    def close_all(self):
+        with self._lock:
+            connections, self._all = self._all, []
+        for conn in connections:
+            conn.close()
+
+
+class MetadataHarvester:
+    """جلب الصور المصغرة والأوصاف والبيانات الوصفية لعدة روابط بالتوازي دون استخراج كامل.
+
+    - الصور المصغرة فقط لفيديو معروف المعرّف: لا استخراج إطلاقاً (روابط i.ytimg.com ثابتة).
+    - قوائم التشغيل والقنوات: سرد مسطح (extract_flat) ثم معالجة كل فيديو على حدة.
+    - الوصف والبيانات: extract_info(process=False) بدون اختيار الصيغ أو التحميل.
+    """
+    def __init__(self, fields=('thumbnail', 'description', 'metadata'), layout=None,
+                 max_workers=METADATA_WORKERS, batch_size=METADATA_BATCH_SIZE):
+        self.fields = set(fields)
+        self.layout = layout or OUTPUT_LAYOUT
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.http = PooledHttpClient()
+
+    def _ydl_opts(self, name_template):
+        return {'quiet': True, 'skip_download': True, 'extract_flat': 'in_playlist',
+                'outtmpl': self.layout.output_template(name_template), 'paths': {'home': self.layout.root}}
+
+    def expand(self, urls):
+        """تحويل روابط القوائم والقنوات إلى قائمة فيديوهات (مع البيانات المتاحة من السرد المسطح)."""
+        videos = []
+        canonicals, rejects = URL_NORMALIZER.normalize_batch(urls)
+        for url, reason in rejects:
+            # روابط غير YouTube تُمرَّر كما هي لـ yt-dlp
+            if reason == 'unsupported host':
+                videos.append({'url': url})
+        for canonical in canonicals:
+            if canonical.kind not in ('playlist', 'channel'):
+                videos.append({'url': canonical.url, 'id': canonical.id})
+                continue
+            listing_url = canonical.url + ('/videos' if canonical.kind == 'channel' else '')
+            with YDL_SESSION_POOL.session({'quiet': True, 'extract_flat': 'in_playlist'}) as ydl:
+                listing = ydl.extract_info(listing_url, download=False, process=False)
+            for entry in listing.get('entries') or []:
+                if entry and entry.get('id'):
+                    videos.append(dict(entry, url=entry.get('url') or f"https://www.youtube.com/watch?v={entry['id']}"))
+        return videos
+
+    def resolve(self, video):
+        """جلب الحقول المطلوبة فقط لفيديو واحد."""
+        needs_extraction = bool(self.fields & {'description', 'metadata'}) or not video.get('id')
+        if not needs_extraction:
+            thumbnails = video.get('thumbnails') or []
+            if not thumbnails:
+                thumbnails = [{'url': tmpl.format(id=video['id']), 'preference': -i}
+                              for i, tmpl in enumerate(YOUTUBE_THUMBNAIL_URLS)]
+            return dict(video, thumbnails=thumbnails)
+        with YDL_SESSION_POOL.session({'quiet': True}) as ydl:
+            info = ydl.extract_info(video['url'], download=False, process=False)
+        return info
+
+    def _fetch_thumbnail(self, info):
+        """تنزيل أفضل صورة مصغرة متاحة؛ تعيد (المحتوى، الامتداد) أو (None, None)."""
+        thumbnails = sorted(info.get('thumbnails') or [],
+                            key=lambda t: (t.get('preference') or 0, (t.get('width') or 0) * (t.get('height') or 0)),
+                            reverse=True)
+        if not thumbnails and info.get('thumbnail'):
+            thumbnails = [{'url': info['thumbnail']}]
+        for thumbnail in thumbnails:
+            try:
+                status, body, content_type = self.http.get(thumbnail['url'])
+            except (http.client.HTTPException, OSError):
+                continue
+            if status == 200 and body:
+                ext = os.path.splitext(urlsplit(thumbnail['url']).path)[1].lstrip('.').lower()
+                if ext not in ('jpg', 'jpeg', 'png', 'webp'):
+                    ext = 'webp' if 'webp' in content_type else 'png' if 'png' in content_type else 'jpg'
+                return body, ext
+        return None, None
+
+    def _process(self, video):
+        info = self.resolve(video)
+        thumbnail = self._fetch_thumbnail(info) if 'thumbnail' in self.fields else (None, None)
+        return info, thumbnail
+
+    def harvest(self, urls, name_template=QUEUE_TITLE_TEMPLATE, job_id=None, seed_info=None):
+        """تنفيذ الجلب بالجملة؛ تعيد قائمة {'info', 'artifacts'} لكل فيديو ومعها الأخطاء.
+
+        seed_info: بيانات معروفة مسبقاً (مثل القناة والتاريخ من جلب الصيغ) تُدمج مع كل فيديو.
+        """
+        videos = [dict(seed_info or {}, **video) for video in self.expand(urls)]
+        results, errors = [], []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for start in range(0, len(videos), self.batch_size):
+                batch = videos[start:start + self.batch_size]
+                futures = {executor.submit(self._process, video): video for video in batch}
+                completed = []
+                for future in concurrent.futures.as_completed(futures):
+                    try:
+                        completed.append(future.result())
+                    except Exception as e:
+                        errors.append((futures[future].get('url'), str(e)))
+                results.extend(self._write_batch(completed, name_template, job_id))
+        self.http.close_all()
+        return results, errors
+
+    def _write_batch(self, completed, name_template, job_id):
+        """كتابة الأوصاف والصور وسطر JSON لكل فيديو في ملف بيانات واحد للدفعة."""
+        written, metadata_lines = [], []
+        with YDL_SESSION_POOL.session(self._ydl_opts(name_template)) as ydl:
+            for info, (thumbnail_data, thumbnail_ext) in completed:
+                template = name_template
+                if not info.get('title') and '%(title)' in template:
+                    template = QUEUE_ID_TEMPLATE
+                outtmpl = self.layout.output_template(template)
+                base = os.path.splitext(ydl.prepare_filename(dict(info, ext='tmp'), outtmpl=outtmpl))[0]
+                artifacts = {}
+                if thumbnail_data:
+                    artifacts['thumbnail'] = f"{base}.{thumbnail_ext}"
+                if 'description' in self.fields and info.get('description') is not None:
+                    artifacts['description'] = f"{base}.description"
+                for kind, path in artifacts.items():
+                    with atomic_output_path(path) as temp_path:
+                        if kind == 'thumbnail':
+                            with open(temp_path, 'wb') as fh:
+                                fh.write(thumbnail_data)
+                        else:
+                            with open(temp_path, 'w', encoding='utf-8') as fh:
+                                fh.write(info['description'])
+                    if job_id is not None:
+                        ARTIFACT_INDEX.add(job_id, kind, path)
+                if 'metadata' in self.fields:
+                    metadata_lines.append(json.dumps({k: info.get(k) for k in METADATA_FIELDS}, ensure_ascii=False))
+                written.append({'info': info, 'artifacts': artifacts})
+        if metadata_lines:
+            metadata_path = os.path.join(self.layout.root, 'metadata.jsonl')
+            with open(metadata_path, 'a', encoding='utf-8') as fh:
+                fh.write('\n'.join(metadata_lines) + '\n')
+            if job_id is not None:
+                ARTIFACT_INDEX.add(job_id, 'metadata', metadata_path)
+        return written
+
+
+# ----------------------------------------------------------------------
+## 3.8 استخراج الصوت بالترميز الأصلي ووضع الصوت بالجملة (Audio Extraction)
+# ----------------------------------------------------------------------
+AUDIO_NATIVE = 'native'
+AUDIO_DEFAULT_QUALITY = '192'
+AUDIO_CODEC_CHOICES = (
+    (AUDIO_NATIVE, "الأصلي (بدون إعادة ترميز)"),
+    ('mp3', "MP3"),
+    ('aac', "AAC (m4a)"),
+    ('opus', "Opus"),
+    ('flac', "FLAC"),
+)
+# ترميز المصدر => الحاوية المطابقة (نسخ المسار الصوتي كما هو)
+NATIVE_AUDIO_CONTAINERS = {'aac': 'm4a', 'alac': 'm4a', 'opus': 'opus', 'vorbis': 'ogg', 'mp3': 'mp3', 'flac': 'flac'}
+# الترميز المطلوب => (مرمّز ffmpeg، الامتداد، بادئة acodec في صيغ yt-dlp لتفضيل مصدر مطابق)
+AUDIO_ENCODERS = {
+    'mp3': ('libmp3lame', 'mp3', 'mp3'),
+    'aac': ('aac', 'm4a', 'mp4a'),
+    'opus': ('libopus', 'opus', 'opus'),
+    'flac': ('flac', 'flac', 'flac'),
+}
+
+
+def audio_download_options(codec=AUDIO_NATIVE, quality=AUDIO_DEFAULT_QUALITY):
+    """الصيغة والمعالجات اللاحقة لتحميل صوت فقط.
+
+    الترميز الأصلي: FFmpegExtractAudio مع 'best' ينسخ المسار الصوتي إلى حاوية تطابقه (بلا إعادة ترميز).
+    ترميز محدد: نفضّل مصدراً بنفس الترميز، فلا يُعاد الترميز إلا إن لم يتوفر.
+    """
+    if codec == AUDIO_NATIVE:
+        return {'format': 'bestaudio/best',
+                'postprocessor': [{'key': 'FFmpegExtractAudio', 'preferredcodec': 'best'}]}
+    acodec_prefix = AUDIO_ENCODERS[codec][2]
+    return {'format': f'bestaudio[acodec^={acodec_prefix}]/bestaudio/best',
+            'postprocessor': [{'key': 'FFmpegExtractAudio', 'preferredcodec': codec, 'preferredquality': quality}]}
+
+
+def probe_audio_codec(path):
+    """ترميز أول مسار صوتي في الملف عبر ffprobe؛ None إذا تعذر."""
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-select_streams', 'a:0', '-show_entries', 'stream=codec_name',
+         '-of', 'csv=p=0', path],
+        capture_output=True, text=True)
+    return result.stdout.strip() or None
+
+
+def available_cores():
+    """عدد الأنوية المتاحة لهذه العملية (يحترم تقييد الأنوية إن وُجد)."""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+class BatchAudioExtractor:
+    """تحميل الصوت لعدة روابط (فيديو/قائمة/قناة) واستخراجه بعمليات ffmpeg موزعة على الأنوية.
+
+    التحميل (شبكي) والاستخراج (معالج) مرحلتان منفصلتان: كل ملف ينتهي تحميله يُسلَّم فوراً
+    لمجمع ffmpeg بحجم عدد الأنوية، وكل عملية ffmpeg تعمل بخيط واحد.
+    """
+    def __init__(self, codec=AUDIO_NATIVE, quality=AUDIO_DEFAULT_QUALITY, layout=None,
+                 download_workers=4, ffmpeg_workers=None):
+        if codec != AUDIO_NATIVE and codec not in AUDIO_ENCODERS:
+            raise ValueError(f"ترميز صوت غير مدعوم: {codec}")
+        self.codec = codec
+        self.quality = quality
+        self.layout = layout or OUTPUT_LAYOUT
+        self.download_workers = download_workers
+        self.ffmpeg_workers = ffmpeg_workers or available_cores()
+
+    def _target(self, source_codec):
+        """(الامتداد، وسائط ffmpeg للمسار الصوتي) للترميز المصدر."""
+        # أسماء ffprobe للترميزات تطابق مفاتيح AUDIO_ENCODERS
+        if self.codec in (AUDIO_NATIVE, source_codec):
+            ext = NATIVE_AUDIO_CONTAINERS.get(source_codec)
+            if ext:
+                return ext, ['-c:a', 'copy']
+            # ترميز بلا حاوية صوتية مطابقة: نرجع إلى MP3
+            return 'mp3', ['-c:a', 'libmp3lame', '-b:a', f'{AUDIO_DEFAULT_QUALITY}k']
+        encoder, ext, _prefix = AUDIO_ENCODERS[self.codec]
+        quality_args = [] if encoder == 'flac' else ['-b:a', f'{self.quality}k']
+        return ext, ['-c:a', encoder] + quality_args
+
+    def extract_file(self, source):
+        """استخراج المسار الصوتي من ملف محلي؛ تعيد مسار الملف الصوتي النهائي."""
+        source_codec = probe_audio_codec(source)
+        if source_codec is None:
+            raise ValueError(f"لا يوجد مسار صوتي في {source}")
+        ext, codec_args = self._target(source_codec)
+        target = f"{os.path.splitext(source)[0]}.{ext}"
+        if target == source and codec_args[1] == 'copy':
+            return source  # الملف أصلاً بالترميز والحاوية المطلوبين
+        with atomic_output_path(target) as temp_path:
+            result = subprocess.run(
+                ['ffmpeg', '-y', '-v', 'error', '-threads', '1', '-i', source, '-map', '0:a:0', '-vn']
+                + codec_args + [temp_path],
+                capture_output=True, text=True)
+            if result.returncode != 0:
+                raise RuntimeError(result.stderr.strip()[-500:] or f"ffmpeg exit {result.returncode}")
+        if os.path.abspath(target) != os.path.abspath(source):
+            os.remove(source)
+        return target
+
+    def _download(self, video, name_template):
+        """تحميل أفضل صوت بدون معالجات لاحقة؛ الاستخراج يتم في مجمع ffmpeg."""
+        ydl_opts = {
+            'quiet': True,
+            'noprogress': True,
+            'format': audio_download_options(self.codec)['format'],
+            'outtmpl': self.layout.output_template(name_template),
+            'paths': self.layout.ydl_paths(),
+        }
+        with YDL_SESSION_POOL.session(ydl_opts) as ydl:
+            info = ydl.extract_info(video['url'], download=True)
+        return [download['filepath'] for download in info.get('requested_downloads') or []
+                if download.get('filepath')]
+
+    def run(self, urls, name_template=QUEUE_TITLE_TEMPLATE, job_id=None):
+        """تنفيذ الدفعة؛ تعيد (قائمة الملفات الصوتية، قائمة (الرابط، الخطأ))."""
+        videos = MetadataHarvester(fields=()).expand(urls)
+        outputs, errors = [], []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.ffmpeg_workers) as ffmpeg_pool, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=self.download_workers) as download_pool:
+            downloads = {download_pool.submit(self._download, video, name_template): video for video in videos}
+            extractions = {}
+            for future in concurrent.futures.as_completed(downloads):
+                url = downloads[future]['url']
+                try:
+                    for path in future.result():
+                        extractions[ffmpeg_pool.submit(self.extract_file, path)] = url
+                except Exception as e:
+                    errors.append((url, str(e)))
+            for future in concurrent.futures.as_completed(extractions):
+                try:
+                    path = future.result()
+                except Exception as e:
+                    errors.append((extractions[future], str(e)))
+                    continue
+                outputs.append(path)
+                if job_id is not None:
+                    ARTIFACT_INDEX.add(job_id, 'media', path)
+        return outputs, errors
+
+
+# ----------------------------------------------------------------------
+## 3.9 تسجيل البث المباشر بمقاطع متتالية (Live Recording)
+# ----------------------------------------------------------------------
+LIVE_SEGMENT_MAX_BYTES = 256 * 1024 * 1024
+LIVE_SEGMENT_MAX_SECONDS = 600
+LIVE_RETAIN_SEGMENTS = 12  # حد الاحتفاظ الافتراضي لتسجيلات الواجهة (~ساعتان بمقاطع 10 دقائق)
+LIVE_MIN_POLL_SECONDS = 1.0
+LIVE_MAX_IDLE_POLLS = 10  # قائمة لم تتغير بعد هذا العدد من الجولات => البث انتهى أو انقطع
+HLS_ATTRIBUTE_RE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+
+def parse_hls_playlist(text, base_url):
+    """تحليل قائمة HLS.
+
+    قائمة رئيسية: {'variants': [(bandwidth, url), ...]}
+    قائمة مقاطع: {'target_duration', 'segments': [(sequence, duration, url), ...], 'ended'}
+    """
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    if not lines or lines[0] != '#EXTM3U':
+        raise ValueError("ليست قائمة HLS صالحة")
+    variants, segments = [], []
+    target_duration, sequence, ended = 6.0, 0, False
+    pending_duration, pending_bandwidth = None, None
+    for line in lines[1:]:
+        if line.startswith('#EXT-X-STREAM-INF:'):
+            attributes = dict(HLS_ATTRIBUTE_RE.findall(line.split(':', 1)[1]))
+            pending_bandwidth = int(attributes.get('BANDWIDTH', '0').strip('"') or 0)
+        elif line.startswith('#EXT-X-TARGETDURATION:'):
+            target_duration = float(line.split(':', 1)[1])
+        elif line.startswith('#EXT-X-MEDIA-SEQUENCE:'):
+            sequence = int(line.split(':', 1)[1])
+        elif line.startswith('#EXTINF:'):
+            pending_duration = float(line.split(':', 1)[1].split(',')[0])
+        elif line.startswith('#EXT-X-ENDLIST'):
+            ended = True
+        elif not line.startswith('#'):
+            url = urllib.parse.urljoin(base_url, line)
+            if pending_bandwidth is not None:
+                variants.append((pending_bandwidth, url))
+                pending_bandwidth = None
+            else:
+                segments.append((sequence, pending_duration or target_duration, url))
+                sequence += 1
+                pending_duration = None
+    if variants:
+        return {'variants': variants}
+    return {'target_duration': target_duration, 'segments': segments, 'ended': ended}
+
+
+class LiveRecorder:
+    """تسجيل بث مباشر (HLS) إلى مقاطع متتالية محدودة الحجم والمدة.
+
+    كل مقطع يُكتب كملف .part ثم يُنهى بإعادة تسمية ذرية ويُفهرس فوراً (فهرس المهمة + سطر JSON
+    بجوار المقاطع) لتعالجه المراحل اللاحقة أثناء استمرار التسجيل. الذاكرة محدودة بمقطع HLS واحد
+    (آخر رقم تسلسل فقط يُحفظ)، والقرص محدود اختيارياً بعدد المقاطع المحتفَظ بها.
+
+    أخطاء الشبكة تُصنَّف بـ classify_error: العابرة والحظر تُعاد بسياسات RETRY_POLICIES، وانتهاء صلاحية
+    القائمة يعيد الاستخراج، ومقطع خرج من النافذة المنزلقة (404/410 أو فشل بعد كل المحاولات) يُتخطى.
+    """
+    def __init__(self, url, name_template=QUEUE_TITLE_TEMPLATE, layout=None, job_id=None,
+                 max_segment_bytes=LIVE_SEGMENT_MAX_BYTES, max_segment_seconds=LIVE_SEGMENT_MAX_SECONDS,
+                 retain_segments=None, on_segment=None, on_disk_wait=None, on_segment_removed=None):
+        self.url = url
+        self.name_template = name_template
+        self.layout = layout or OUTPUT_LAYOUT
+        self.job_id = job_id
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_seconds = max_segment_seconds
+        self.retain_segments = retain_segments
+        self.on_segment = on_segment
+        self.on_disk_wait = on_disk_wait
+        self.on_segment_removed = on_segment_removed
+        self.http = PooledHttpClient()
+        self.headers = {}
+        self.segments = collections.deque()  # المقاطع المنتهية الموجودة على القرص فقط
+        self.segment_count = 0
+        self.bytes_recorded = 0
+        self.skipped_segments = 0
+        self._current = None
+
+    def _resolve(self):
+        """رابط قائمة المقاطع (الأعلى جودة) والمسار الأساسي لملفات التسجيل."""
+        if urlsplit(self.url).path.endswith('.m3u8'):
+            playlist_url, info = self.url, {'id': 'live', 'title': os.path.basename(urlsplit(self.url).path)[:-5]}
+        else:
+            with YDL_SESSION_POOL.session({'quiet': True, 'format': 'best[protocol^=m3u8]/best'}) as ydl:
+                info = ydl.extract_info(self.url, download=False)
+            playlist_url = info['url']
+            self.headers = info.get('http_headers') or {}
+        with YDL_SESSION_POOL.session({'quiet': True, 'outtmpl': self.layout.output_template(self.name_template),
+                                       'paths': {'home': self.layout.root}}) as ydl:
+            base = os.path.splitext(ydl.prepare_filename(dict(info, ext='ts')))[0]
+        return playlist_url, base
+
+    def _fetch(self, url):
+        status, body, _content_type = self.http.get(url, headers=self.headers)
+        if status != 200:
+            raise urllib.error.HTTPError(url, status, f"live fetch failed: {url}", None, None)
+        return body
+
+    def _with_retries(self, operation, stop_event, on_expired=None):
+        """تنفيذ طلب مع إعادة المحاولة حسب فئة الخطأ؛ الانتظار بين المحاولات يُقطع بـ stop_event."""
+        attempt = 0
+        while True:
+            try:
+                return operation()
+            except Exception as e:
+                kind = classify_error(e)
+                policy = RETRY_POLICIES.get(kind)
+                attempt += 1
+                if policy is None or attempt >= policy.max_attempts:
+                    raise
+                if kind == ERROR_EXPIRED and on_expired:
+                    on_expired()
+                if stop_event.wait(policy.delay(attempt)):
+                    raise SystemExit("Download cancelled by user.")
+
+    def _media_playlist(self, playlist_url):
+        playlist = parse_hls_playlist(self._fetch(playlist_url).decode('utf-8', 'replace'), playlist_url)
+        if 'variants' in playlist:
+            _bandwidth, media_url = max(playlist['variants'])
+            return media_url, parse_hls_playlist(self._fetch(media_url).decode('utf-8', 'replace'), media_url)
+        return playlist_url, playlist
+
+    def _remove_segment(self, base, path):
+        """حذف مقطع تجاوز حد الاحتفاظ مع كل ما يشير إليه (فهرس المهمة، سطر JSON، الفهرس عبر الاستدعاء)."""
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+        with open(f"{base}.live.jsonl", 'a', encoding='utf-8') as fh:
+            fh.write(json.dumps({'path': path, 'removed_at': time.time()}, ensure_ascii=False) + '\n')
+        if self.job_id is not None:
+            ARTIFACT_INDEX.remove(self.job_id, path)
+        if self.on_segment_removed:
+            self.on_segment_removed(path)
+
+    def _open_segment(self, base, stop_event):
+        # الانتظار بين مقاطع HLS (لا طلب مفتوح)؛ الإيقاف أثناءه ينهي التسجيل
+        DISK_ADMISSION.wait_for_space(min(self.max_segment_bytes, RESERVATION_SHRINK_STEP),
+                                      stop_event.is_set, self.on_disk_wait)
+        self.segment_count += 1
+        final_path = f"{base}.live-{self.segment_count:04d}.ts"
+        directory, name = os.path.split(final_path)
+        os.makedirs(directory or '.', exist_ok=True)
+        stem, ext = os.path.splitext(name)
+        temp_path = os.path.join(directory, f".{stem}.part{ext}")
+        self._current = {'path': final_path, 'temp': temp_path, 'file': open(temp_path, 'wb'),
+                         'bytes': 0, 'seconds': 0.0, 'first_sequence': None, 'last_sequence': None, 'skipped': 0}
+
+    def _finalize_segment(self, base):
+        """إنهاء المقطع الحالي: إغلاق، إعادة تسمية ذرية، فهرسة، ثم تطبيق حد الاحتفاظ."""
+        current, self._current = self._current, None
+        if current is None:
+            return None
+        current['file'].close()
+        if not current['bytes']:
+            os.remove(current['temp'])
+            self.segment_count -= 1
+            return None
+        os.replace(current['temp'], current['path'])
+        record = {key: current[key] for key in ('path', 'bytes', 'seconds', 'first_sequence', 'last_sequence',
+                                                'skipped')}
+        record['finalized_at'] = time.time()
+        with open(f"{base}.live.jsonl", 'a', encoding='utf-8') as fh:
+            fh.write(json.dumps(record, ensure_ascii=False) + '\n')
+        if self.job_id is not None:
+            ARTIFACT_INDEX.add(self.job_id, 'segment', current['path'])
+        self.segments.append(current['path'])
+        if self.retain_segments and len(self.segments) > self.retain_segments:
+            self._remove_segment(base, self.segments.popleft())
+        if self.on_segment:
+            self.on_segment(record)
+        return record
+
+    def record(self, stop_event=None, max_duration=None):
+        """التسجيل حتى انتهاء البث أو stop_event أو max_duration ثانية؛ تعيد قائمة المقاطع الباقية."""
+        stop_event = stop_event or threading.Event()
+        playlist_url, base = self._resolve()
+        started = time.monotonic()
+        last_sequence, idle_polls = -1, 0
+
+        def poll():
+            nonlocal playlist_url
+            playlist_url, playlist = self._media_playlist(playlist_url)
+            return playlist
+
+        def refresh():
+            # رابط القائمة الموقّع انتهت صلاحيته: استخراج جديد
+            nonlocal playlist_url
+            playlist_url, _base = self._resolve()
+
+        try:
+            while not stop_event.is_set():
+                playlist = self._with_retries(poll, stop_event, refresh)
+                new_segments = [segment for segment in playlist['segments'] if segment[0] > last_sequence]
+                idle_polls = 0 if new_segments else idle_polls + 1
+                for sequence, duration, segment_url in new_segments:
+                    if stop_event.is_set():
+                        break
+                    if self._current is None:
+                        self._open_segment(base, stop_event)
+                    current = self._current
+                    try:
+                        data = self._with_retries(functools.partial(self._fetch, segment_url), stop_event)
+                    except SystemExit:
+                        raise
+                    except Exception:
+                        # المقطع خرج من النافذة المنزلقة أو تعذر جلبه: فجوة في التسجيل بدل إنهائه
+                        last_sequence = sequence
+                        current['skipped'] += 1
+                        self.skipped_segments += 1
+                        continue
+                    current['file'].write(data)
+                    current['bytes'] += len(data)
+                    current['seconds'] += duration
+                    current['first_sequence'] = sequence if current['first_sequence'] is None else current['first_sequence']
+                    current['last_sequence'] = last_sequence = sequence
+                    self.bytes_recorded += len(data)
+                    if current['bytes'] >= self.max_segment_bytes or current['seconds'] >= self.max_segment_seconds:
+                        self._finalize_segment(base)
+                if playlist['ended'] or idle_polls >= LIVE_MAX_IDLE_POLLS:
+                    break
+                if max_duration and time.monotonic() - started >= max_duration:
+                    break
+                # نصف مدة المقطع: لا نفوت مقاطع ولا نستنزف الخادم
+                stop_event.wait(max(LIVE_MIN_POLL_SECONDS, playlist['target_duration'] / 2))
+        except SystemExit:
+            # أُوقف التسجيل أثناء انتظار المساحة أو بين محاولات الإعادة
+            pass
+        finally:
+            self._finalize_segment(base)
+            self.http.close_all()
+        return list(self.segments)
+
+
+class _LiveHlsHandler(http.server.BaseHTTPRequestHandler):
+    """خادم بث HLS بديل: قائمة لا نهائية بنافذة منزلقة من المقاطع الاصطناعية (للاختبار)."""
+    segment_seconds = 1.0
+    segment_bytes = 32 * 1024
+    window = 5
+    started_at = time.monotonic()
+    protocol_version = 'HTTP/1.1'
+
+    def _send(self, body, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == '/master.m3u8':
+            self._send(b'#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=500000\nlow.m3u8\n'
+                       b'#EXT-X-STREAM-INF:BANDWIDTH=2000000\nlive.m3u8\n', 'application/vnd.apple.mpegurl')
+        elif path in ('/live.m3u8', '/low.m3u8'):
+            newest = int((time.monotonic() - self.started_at) / self.segment_seconds)
+            first = max(0, newest - self.window + 1)
+            lines = ['#EXTM3U', '#EXT-X-VERSION:3', f'#EXT-X-TARGETDURATION:{int(self.segment_seconds) or 1}',
+                     f'#EXT-X-MEDIA-SEQUENCE:{first}']
+            for sequence in range(first, newest + 1):
+                lines += [f'#EXTINF:{self.segment_seconds:.3f},', f'seg-{sequence}.ts']
+            self._send(('\n'.join(lines) + '\n').encode(), 'application/vnd.apple.mpegurl')
+        elif path.startswith('/seg-'):
+            sequence = int(path[5:-3])
+            self._send(sequence.to_bytes(4, 'big') * (self.segment_bytes // 4), 'video/mp2t')
+        else:
+            self.send_error(404)
+
+    def log_message(self, *_args):
+        pass
+
+
+# ----------------------------------------------------------------------
+## 3.10 مزامنة القنوات والقوائم تدريجياً (Incremental Sync)
+# ----------------------------------------------------------------------
+SYNC_CURSOR_SIZE = 200       # أحدث المعرّفات المحفوظة لكل مصدر مرتب من الأحدث
+SYNC_STOP_AFTER_KNOWN = 5    # معرّفات معروفة متتالية قبل التوقف (يتحمل فيديو مثبتاً أو محذوفاً)
+SYNC_PLAYLIST_CURSOR_SIZE = 5000  # حد المعرّفات المحفوظة لقائمة تُسرد كاملة (أحدثها إضافة يبقى)
+
+
+class SyncCursorStore:
+    """مؤشرات المزامنة لكل مصدر (قناة/قائمة) في ملف الفهرس نفسه."""
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sync_cursors (
+            source_key TEXT PRIMARY KEY,
+            source_url TEXT NOT NULL,
+            seen_ids TEXT NOT NULL,
+            last_sync REAL,
+            last_new INTEGER,
+            last_scanned INTEGER,
+            last_elapsed REAL,
+            resume_after TEXT
+        );
+    """
+
+    def __init__(self, path=CATALOG_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.executescript(self.SCHEMA)
+            columns = {row['name'] for row in self._conn.execute('PRAGMA table_info(sync_cursors)')}
+            if 'resume_after' not in columns:
+                self._conn.execute('ALTER TABLE sync_cursors ADD COLUMN resume_after TEXT')
+
+    def get(self, source_key):
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM sync_cursors WHERE source_key = ?', (source_key,)).fetchone()
+        if row is None:
+            return None
+        cursor = dict(row)
+        cursor['seen_ids'] = json.loads(cursor['seen_ids'])
+        return cursor
+
+    def save(self, source_key, source_url, seen_ids, report):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO sync_cursors (source_key, source_url, seen_ids, last_sync, last_new, last_scanned, "
+                "last_elapsed, resume_after) VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(source_key) DO UPDATE SET "
+                "source_url = excluded.source_url, seen_ids = excluded.seen_ids, last_sync = excluded.last_sync, "
+                "last_new = excluded.last_new, last_scanned = excluded.last_scanned, "
+                "last_elapsed = excluded.last_elapsed, resume_after = excluded.resume_after",
+                (source_key, source_url, json.dumps(seen_ids), time.time(), report['new'], report['scanned'],
+                 report['elapsed'], report.get('resume_after')))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ChannelSync:
+    """مزامنة تدريجية: سرد المصدر من الأحدث والتوقف عند الوصول إلى معرّفات معروفة.
+
+    القنوات (وقوائم الرفع UU...) مرتبة من الأحدث، فيكفي أول صفحة غالباً. القوائم العادية قد تضيف
+    في آخرها، فتُسرد كاملة سرداً مسطحاً (بدون استخراج أي فيديو) وتُقارن بكل المعرّفات المحفوظة.
+    المعرّفات الموجودة في فهرس الوسائط تُعد معروفة أيضاً، فأول مزامنة لمجلد مستورد لا تعيد كل شيء.
+
+    إذا قطع الحد (limit) السرد، يُحفظ آخر عنصر عولج في resume_after: المزامنة التالية لا تتوقف عند
+    المعروف قبل تجاوزه، فلا تضيع العناصر الأقدم التي لم تُعالج بعد. مزامنة مقطوعة لم تصل إليه تُبقيه
+    كما هو (أقدم نقطة معلقة)، فالعناصر الجديدة الأحدث منه تُلتقط في الطريق إليه.
+    """
+    def __init__(self, store=None, catalog=None, cursor_size=SYNC_CURSOR_SIZE, stop_after_known=SYNC_STOP_AFTER_KNOWN):
+        self.store = store or SyncCursorStore()
+        self.catalog = catalog
+        self.cursor_size = cursor_size
+        self.stop_after_known = stop_after_known
+
+    @staticmethod
+    def source(url):
+        """(المفتاح، رابط السرد، مرتب من الأحدث؟) لرابط قناة أو قائمة."""
+        canonical, _reason = URL_NORMALIZER.parse(url)
+        if canonical is None:
+            return url, url, False
+        if canonical.kind == 'channel':
+            return canonical.key, canonical.url + '/videos', True
+        if canonical.kind == 'playlist':
+            return canonical.key, canonical.url, canonical.id.startswith('UU')
+        raise ValueError(f"ليس رابط قناة أو قائمة: {url}")
+
+    @contextlib.contextmanager
+    def _entries(self, listing_url):
+        """مدخلات السرد المسطح كمولّد كسول: الصفحات التالية لا تُطلب إلا عند الحاجة."""
+        with YDL_SESSION_POOL.session({'quiet': True, 'extract_flat': 'in_playlist'}) as ydl:
+            listing = ydl.extract_info(listing_url, download=False, process=False)
+            yield listing.get('entries') or []
+
+    def _is_known(self, video_id, seen):
+        return video_id in seen or (self.catalog is not None and self.catalog.has(video_id))
+
+    def scan(self, url, limit=None):
+        """إيجاد العناصر الجديدة لمصدر واحد؛ تعيد (العناصر الجديدة من الأحدث، التقرير، المعرّفات المحدّثة)."""
+        started = time.monotonic()
+        key, listing_url, newest_first = self.source(url)
+        cursor = self.store.get(key)
+        previous = cursor['seen_ids'] if cursor else []
+        seen = set(previous)
+        resume_after = cursor.get('resume_after') if cursor else None
+        new_entries, listed, scanned, stopped_early, truncated = [], set(), 0, False, False
+        consecutive_known = consecutive_cursor_hits = 0
+        with self._entries(listing_url) as entries:
+            for entry in entries:
+                if not entry or not entry.get('id'):
+                    continue
+                scanned += 1
+                listed.add(entry['id'])
+                if entry['id'] == resume_after:
+                    # تجاوزنا آخر ما عولج في المزامنة المقطوعة السابقة: يبدأ العد من هنا
+                    resume_after = None
+                    consecutive_known = consecutive_cursor_hits = 0
+                    continue
+                if self._is_known(entry['id'], seen):
+                    consecutive_known += 1
+                    consecutive_cursor_hits += entry['id'] in seen
+                    # مؤشر قصير (مصدر كان صغيراً) يكفي تجاوزه كله؛ غير ذلك نحتاج stop_after_known متتالية
+                    if newest_first and resume_after is None and (
+                            consecutive_known >= self.stop_after_known or 0 < len(seen) <= consecutive_cursor_hits):
+                        stopped_early = True
+                        break
+                    continue
+                consecutive_known = consecutive_cursor_hits = 0
+                new_entries.append(dict(entry, url=entry.get('url') or f"https://www.youtube.com/watch?v={entry['id']}"))
+                if limit and len(new_entries) >= limit:
+                    stopped_early = truncated = True
+                    break
+        new_ids = [entry['id'] for entry in new_entries]
+        if newest_first:
+            seen_ids = list(dict.fromkeys(new_ids + previous))[:self.cursor_size]
+        else:
+            # سرد كامل: المعرّفات التي حُذفت من القائمة لا داعي لحفظها
+            kept = previous if truncated else [video_id for video_id in previous if video_id in listed]
+            seen_ids = (kept + [video_id for video_id in new_ids if video_id not in seen])[-SYNC_PLAYLIST_CURSOR_SIZE:]
+        if truncated and newest_first:
+            # إن لم نصل إلى النقطة المعلقة السابقة تبقى كما هي، فما بعدها لم يُعالج بعد
+            if resume_after is None:
+                resume_after = new_entries[-1]['id']
+        elif not truncated:
+            # سرد كامل حتى المعروف أو النهاية: لا شيء معلق
+            resume_after = None
+        report = {'source': key, 'new': len(new_entries), 'scanned': scanned, 'stopped_early': stopped_early,
+                  'truncated': truncated, 'resume_after': resume_after,
+                  'first_sync': cursor is None, 'last_sync': cursor['last_sync'] if cursor else None,
+                  'elapsed': time.monotonic() - started}
+        return new_entries, report, seen_ids
+
+    def sync(self, urls, queue=None, job_options=None, limit=None):
+        """مزامنة عدة مصادر؛ العناصر الجديدة تُضاف للطابور المشترك ثم يُحفظ المؤشر.
+
+        بدون طابور (معاينة) لا يُحفظ المؤشر، فالعناصر المعروضة تبقى جديدة في المزامنة التالية.
+        تعيد (قائمة التقارير لكل مصدر، كل العناصر الجديدة).
+        """
+        reports, all_new = [], []
+        for url in urls:
+            try:
+                new_entries, report, seen_ids = self.scan(url, limit)
+            except Exception as e:
+                reports.append({'source': url, 'error': str(e)})
+                continue
+            if queue is not None:
+                if new_entries:
+                    # الأقدم أولاً حتى تُحمَّل بترتيب النشر
+                    queue.enqueue_many([entry['url'] for entry in reversed(new_entries)], job_options)
+                # نحفظ المؤشر بعد الإضافة للطابور فقط؛ فشل الإضافة يعني إعادة المحاولة في المزامنة التالية
+                self.store.save(report['source'], url, seen_ids, report)
+            reports.append(report)
+            all_new.extend(new_entries)
+        return reports, all_new
+
+
 # ----------------------------------------------------------------------
 ## 4. تطبيق النافذة الرئيسية (MainWindow)
 # ----------------------------------------------------------------------
@@ -418,9 +3666,19 @@ class YtdlpGui(QMainWindow):
         self.video_title = ""
         self.video_title_slug = ""
         self.download_worker = None
+        self.conversion_worker = None
         self.download_type = None
         self.downloaded_file = None
         self.is_download_complete = False
+        self.video_info = {}
+        self.download_options = {}
+        self.download_started_at = None
+        self.expected_size = None
+        self.catalog = MediaCatalog()
+        self.jobs_model = JobListModel(parent=self)
+        self.current_job_id = None
+        self.job_artifacts = {}
+        self.job_integrity = {}
 
         # تهيئة القوائم
         self.page1_url_input = self._create_page1_url_input()
@@ -434,6 +3692,7 @@ class YtdlpGui(QMainWindow):
         self.stacked_widget.addWidget(self.page4_finish)     # index 3
 
         self.stacked_widget.setCurrentIndex(0)
+        self.update_all_custom_buttons()
         self.apply_theme(self.current_theme)
 
     def _create_header_widget(self):
@@ -442,7 +3701,7 @@ class YtdlpGui(QMainWindow):
         h_layout = QHBoxLayout(header)
         h_layout.setContentsMargins(0, 0, 0, 0)
 
-        self.theme_button = CustomButton(THEMES[self.current_theme]["THEME_BUTTON_TEXT"])
+        self.theme_button = CustomButton(THEMES[self.current_theme]["THEME_BUTTON_TEXT"], variant='theme')
         self.theme_button.setFixedSize(QSize(45, 45))
         self.theme_button.setToolTip("تبديل الوضع")
         font = QFont()
@@ -461,79 +3720,32 @@ class YtdlpGui(QMainWindow):
         self.apply_theme(self.current_theme)
 
     def apply_theme(self, theme_name):
-        """تطبيق ورقة الأنماط على جميع العناصر بناءً على الوضع المختار."""
+        """تطبيق ورقة الأنماط المترجمة مسبقاً على جميع العناصر دفعة واحدة."""
         theme = THEMES[theme_name]
-
         self.theme_button.setText(theme['THEME_BUTTON_TEXT'])
-        self.theme_button.set_theme_colors(theme['THEME_BUTTON_COLOR'], theme['THEME_BUTTON_COLOR'], theme['THEME_BUTTON_COLOR'])
-
-        # 1. تحديث الأنماط العامة (QSS)
-        global_style = f"""
-            QWidget {{
-                background-color: {theme['BG']};
-                color: {theme['FG']};
-                font-family: 'Arial', 'Segoe UI', sans-serif;
-            }}
-            QLineEdit, QComboBox, QListWidget {{
-                padding: 10px;
-                border: 2px solid #555555;
-                border-radius: 10px;
-                background-color: {theme['INPUT_BG']};
-                color: {theme['FG']};
-            }}
-            QListWidget::item:selected {{
-                background-color: {theme['PROGRESS_BAR']};
-                color: white;
-            }}
-            QLabel#header {{
-                font-size: 24px;
-                font-weight: 800;
-                color: {theme['HEADER']};
-                margin-bottom: 20px;
-            }}
-            QProgressBar {{
-                border: 2px solid {theme['FG']};
-                border-radius: 10px;
-                text-align: center;
-                background-color: {theme['INPUT_BG']};
-                color: {theme['FG']};
-                font-weight: bold;
-            }}
-            QProgressBar::chunk {{
-                background-color: {theme['PROGRESS_BAR']};
-                border-radius: 8px;
-            }}
-            QCheckBox {{
-                color: {theme['FG']};
-                spacing: 8px;
-                padding: 5px;
-            }}
-        """
-        self.setStyleSheet(global_style)
+        # ورقة واحدة للنافذة كلها: الأزرار تُلوَّن عبر محددات الخاصية variant
+        self.setStyleSheet(compile_theme_stylesheet(theme_name))
 
-        # 2. تحديث أنماط الأزرار المخصصة
-        self.update_all_custom_buttons(theme)
+    def update_all_custom_buttons(self):
+        """تعيين نوع كل زر مخصص مرة واحدة (الألوان نفسها تأتي من ورقة الأنماط العامة)."""
 
-    def update_all_custom_buttons(self, theme):
-        """تحديث ألوان كل الأزرار المخصصة."""
+        self.next_button_page1.set_success_style()
+        self.btn_download.set_success_style()
+        self.btn_convert.set_success_style()
+        self.btn_reload.set_success_style()
 
-        self.next_button_page1.set_success_style(theme)
-        self.btn_download.set_success_style(theme)
-        self.btn_convert.set_success_style(theme)
-        self.btn_reload.set_success_style(theme)
+        self.paste_button.set_warning_style()
 
-        self.paste_button.set_warning_style(theme)
+        self.exit_button_page1.set_danger_style()
+        self.btn_cancel.set_danger_style()
+        self.btn_exit_page2.set_danger_style()
+        self.btn_cancel_convert.set_danger_style()
+        self.btn_exit_page3.set_danger_style()
+        self.btn_exit_page4.set_danger_style()
 
-        self.exit_button_page1.set_danger_style(theme)
-        self.btn_cancel.set_danger_style(theme)
-        self.btn_exit_page2.set_danger_style(theme)
-        self.btn_cancel_convert.set_danger_style(theme)
-        self.btn_exit_page3.set_danger_style(theme)
-        self.btn_exit_page4.set_danger_style(theme)
-
-        self.btn_back_page2.set_danger_style(theme)
-        self.btn_back_page3.set_danger_style(theme)
-        self.btn_back_page4.set_danger_style(theme)
+        self.btn_back_page2.set_danger_style()
+        self.btn_back_page3.set_danger_style()
+        self.btn_back_page4.set_danger_style()
 
 
     # ----------------------------------------------------------------------
@@ -541,26 +3753,13 @@ class YtdlpGui(QMainWindow):
     # ----------------------------------------------------------------------
     def is_youtube_link(self, text):
         """تحقق من أن النص رابط YouTube صالح."""
-        youtube_regex = re.compile(
-            r'(https?://)?(www\.)?(youtube|youtu\.be)\.(com|be)/[^\s]+'
-        )
-        return bool(youtube_regex.match(text.strip()))
+        canonical, _reason = URL_NORMALIZER.parse(text)
+        return canonical is not None
 
     def clean_url(self, url):
-        """تنظيف الرابط (إزالة البارامترات غير الضرورية)."""
-        match = re.search(r'v=([^&]+)|list=([^&]+)', url)
-        if match:
-            if match.group(1):
-                return f"https://www.youtube.com/watch?v={match.group(1)}"
-            elif match.group(2):
-                return f"https://www.youtube.com/playlist?list={match.group(2)}"
-
-        if 'youtu.be' in url:
-            match_short = re.search(r'youtu\.be/([^?&/]+)', url)
-            if match_short:
-                return f"https://www.youtube.com/watch?v={match_short.group(1)}"
-
-        return url
+        """تنظيف الرابط (تحويله إلى الصيغة القانونية الموحدة)."""
+        canonical, _reason = URL_NORMALIZER.parse(url)
+        return canonical.url if canonical else url
 
     def paste_clipboard(self):
         """اللصق من الحافظة بعد التحقق."""
@@ -573,6 +3772,15 @@ class YtdlpGui(QMainWindow):
         else:
             self.show_message("الحافظة لا تحتوي على رابط YouTube صالح.", "red")
 
+    def _on_worker_finished(self):
+        """تفكيك العامل المنتهي حتى لا تتراكم كائنات Qt واتصالاتها."""
+        worker = self.sender()
+        if worker is self.download_worker:
+            self.download_worker = None
+        elif worker is self.conversion_worker:
+            self.conversion_worker = None
+        release_worker(worker)
+
     def show_message(self, message, color="black"):
         """عرض رسالة حالة مؤقتة."""
         print(f"[{color.upper()}]: {message}")
@@ -624,14 +3832,22 @@ class YtdlpGui(QMainWindow):
         self.youtube_url = self.clean_url(url)
         self.show_message(f"الرابط نظيف: {self.youtube_url}", "blue")
 
-        self.download_worker = YtdlpWorker(url=self.youtube_url)
+        self.download_worker = YtdlpWorker(url=self.youtube_url, probe_sizes=True)
+        self.download_worker.finished.connect(self._on_worker_finished)
         self.download_worker.formats_ready.connect(self.on_formats_ready)
+        self.download_worker.metadata_ready.connect(self.on_metadata_ready)
         self.download_worker.download_error.connect(self.on_error)
         self.download_worker.start()
 
         self.show_message("جاري جلب معلومات الفيديو والصيغ المتاحة... ⏳", "blue")
         self.next_button_page1.setEnabled(False)
 
+    def on_metadata_ready(self, info):
+        """حفظ بيانات الفيديو الوصفية للفهرس والتحقق من تحميله سابقاً."""
+        self.video_info = info
+        if info.get('video_id') and self.catalog.has(info['video_id']):
+            self.show_message("تنبيه: هذا الفيديو موجود مسبقاً في الفهرس.", "blue")
+
     def on_formats_ready(self, formats, title):
         """تعبئة قائمة الصيغ والانتقال للقائمة 2."""
         self.video_formats = formats
@@ -665,8 +3881,14 @@ class YtdlpGui(QMainWindow):
         self.chk_video_audio_merged = QCheckBox("فيديو + صوت (مدمج) 🎬")
         self.chk_audio_only = QCheckBox("صوت فقط 🎧")
 
+        self.audio_codec_combo = QComboBox()
+        for codec, label in AUDIO_CODEC_CHOICES:
+            self.audio_codec_combo.addItem(label, codec)
+        self.audio_codec_combo.setEnabled(False)
+
         options_layout_basic.addWidget(self.chk_video_audio_merged)
         options_layout_basic.addWidget(self.chk_audio_only)
+        options_layout_basic.addWidget(self.audio_codec_combo)
         layout.addWidget(options_group_basic)
 
         # خيارات البيانات المساعدة
@@ -685,11 +3907,16 @@ class YtdlpGui(QMainWindow):
         self.chk_thumbnail.stateChanged.connect(self._handle_download_option_change)
         self.chk_description.stateChanged.connect(self._handle_download_option_change)
 
-        self.formats_list = QListWidget()
-        self.formats_list.setSelectionMode(QListWidget.SelectionMode.SingleSelection)
+        self.formats_model = FormatListModel(self)
+        self.formats_proxy = FormatFilterProxyModel(self)
+        self.formats_proxy.setSourceModel(self.formats_model)
+        self.formats_list = QListView()
+        self.formats_list.setModel(self.formats_proxy)
+        self.formats_list.setUniformItemSizes(True)
+        self.formats_list.setSelectionMode(QListView.SelectionMode.SingleSelection)
         self.formats_list.setMinimumHeight(150)
         self.formats_list.setEnabled(False)
-        self.formats_list.currentItemChanged.connect(self._handle_download_option_change)
+        self.formats_list.selectionModel().currentChanged.connect(self._handle_download_option_change)
         layout.addWidget(self.formats_list)
 
         self.download_progress_bar = QProgressBar()
@@ -739,27 +3966,26 @@ class YtdlpGui(QMainWindow):
 
         # تفعيل وتعطيل قائمة الصيغ: تفعيلها فقط عند اختيار الفيديو المدمج
         self.formats_list.setEnabled(self.chk_video_audio_merged.isChecked())
+        self.audio_codec_combo.setEnabled(self.chk_audio_only.isChecked())
 
         # تفعيل زر التحميل
-        can_download = (self.chk_video_audio_merged.isChecked() and self.formats_list.currentItem() is not None) or \
+        can_download = (self.chk_video_audio_merged.isChecked() and self._current_format() is not None) or \
                        self.chk_audio_only.isChecked() or \
                        self.chk_thumbnail.isChecked() or \
                        self.chk_description.isChecked()
 
         self.btn_download.setEnabled(can_download)
 
+    def _current_format(self):
+        """قاموس الصيغة المحددة حالياً أو None."""
+        index = self.formats_list.currentIndex()
+        return index.data(Qt.ItemDataRole.UserRole) if index.isValid() else None
+
     def update_page2_formats(self):
-        """تعبئة قائمة الصيغ بعد جلبها من yt-dlp."""
+        """تعبئة قائمة الصيغ بعد جلبها من yt-dlp (التصفية والفرز في النموذج)."""
         self.video_title_label.setText(f"عنوان الفيديو: {self.video_title}")
-        self.formats_list.clear()
-
-        for fmt in self.video_formats:
-            # عرض فقط صيغ الفيديو التي يمكن دمجها (لتجنب عرض صيغ الصوت المنفصلة هنا)
-            if 'صوت فقط' not in fmt['resolution']:
-                item_text = f"⚙️ {fmt['resolution']} - {fmt['ext']} ({fmt['filesize']}) - {fmt['note']}"
-                item = QListWidgetItem(item_text)
-                item.setData(Qt.ItemDataRole.UserRole, fmt)
-                self.formats_list.addItem(item)
+        self.formats_model.set_formats(self.video_formats)
+        self.formats_proxy.sort(0, Qt.SortOrder.DescendingOrder)
 
         # إعادة تعيين الخيارات
         self.chk_video_audio_merged.setChecked(False)
@@ -778,18 +4004,26 @@ class YtdlpGui(QMainWindow):
             'postprocessor': [],
             'write_description': self.chk_description.isChecked(),
             'write_thumbnail': self.chk_thumbnail.isChecked(),
-            'title_slug': self.video_title_slug
+            'title_slug': self.video_title_slug,
+            'video_info': {
+                'title': self.video_info.get('title'),
+                'uploader': self.video_info.get('uploader'),
+                'channel_id': self.video_info.get('channel_id'),
+                'upload_date': self.video_info.get('upload_date'),
+                'duration': self.video_info.get('duration'),
+            },
         }
 
         self.download_type = None
+        self.expected_size = None
 
         if self.chk_video_audio_merged.isChecked():
-            selected_item = self.formats_list.currentItem()
-            if not selected_item:
+            fmt_data = self._current_format()
+            if not fmt_data:
                 self.show_message("يرجى اختيار جودة للفيديو.", "red")
                 return
 
-            fmt_data = selected_item.data(Qt.ItemDataRole.UserRole)
+            self.expected_size = fmt_data.get('filesize_bytes')
 
             # --- التصحيح الحاسم لمشكلة format not available ---
             resolution_str = fmt_data['resolution'] # e.g., '1080p'
@@ -808,11 +4042,15 @@ class YtdlpGui(QMainWindow):
             self.download_type = 'video_audio_merged'
 
         elif self.chk_audio_only.isChecked():
-            options['format'] = "bestaudio/best"
-            # تحويل إلى MP3 192kbps
-            options['postprocessor'] = [{'key': 'FFmpegExtractAudio', 'preferredcodec': 'mp3', 'preferredquality': '192'}]
+            # الترميز الأصلي بلا إعادة ترميز، أو الترميز المحدد عند الحاجة
+            options.update(audio_download_options(self.audio_codec_combo.currentData()))
             self.download_type = 'audio_only'
 
+        # بث مباشر: تسجيل بمقاطع متتالية (لا يوجد حجم كلي لعرض نسبة تقدم)
+        is_live = self.download_type is not None and self.video_info.get('is_live')
+        if is_live:
+            options['live_record'] = True
+
         # إذا لم يكن هناك تحميل للفيديو أو الصوت، فهذا يعني تحميل بيانات مساعدة فقط
         if not self.download_type:
             if self.chk_thumbnail.isChecked() or self.chk_description.isChecked():
@@ -824,16 +4062,30 @@ class YtdlpGui(QMainWindow):
                 return
 
         self.download_progress_bar.setVisible(True)
+        self.download_progress_bar.setRange(0, 0 if is_live else 100)
         self.download_progress_bar.setValue(0)
         self.btn_download.setDisabled(True)
         self.btn_cancel.setEnabled(True)
         self.btn_back_page2.setDisabled(True)
 
+        self.download_options = options
+        self.job_artifacts = {}
+        self.job_integrity = {}
+        self.download_started_at = time.time()
         self.download_worker = YtdlpWorker(url=self.youtube_url, download_options=options)
+        self.download_worker.finished.connect(self._on_worker_finished)
         self.download_worker.download_progress.connect(self.update_download_progress)
+        self.download_worker.artifacts_ready.connect(self.on_artifacts_ready)
+        self.download_worker.integrity_ready.connect(self.on_integrity_ready)
         self.download_worker.download_finished.connect(self.on_download_finished)
         self.download_worker.download_error.connect(self.on_download_error)
+        self.download_worker.download_cancelled.connect(self.on_download_cancelled)
+        self.download_worker.download_paused.connect(lambda message: self.show_message(message, "orange"))
+        self.download_worker.live_segment_ready.connect(self.on_live_segment_ready)
+        self.download_worker.live_segment_removed.connect(self.on_live_segment_removed)
         self.download_worker.start()
+        self.current_job_id = self.download_worker.job_id
+        self.jobs_model.add_jobs([{'job_id': self.current_job_id, 'title': self.video_title, 'status': 'running'}])
 
     def cancel_download(self):
         """إلغاء عملية التحميل."""
@@ -843,13 +4095,25 @@ class YtdlpGui(QMainWindow):
     def update_download_progress(self, percent):
         """تحديث شريط التقدم."""
         self.download_progress_bar.setValue(percent)
+        self.jobs_model.update_job(self.current_job_id, progress=percent)
+
+    def on_artifacts_ready(self, artifacts):
+        """حفظ مسارات ملفات المهمة لتستخدمها مرحلة التحويل مباشرة."""
+        self.job_artifacts = artifacts
+
+    def on_integrity_ready(self, reports):
+        """حفظ نتائج التحقق (المجاميع الاختبارية) لتسجيلها مع المهمة."""
+        self.job_integrity = reports
 
     def on_download_finished(self, filename):
         """التعامل مع اكتمال التحميل."""
         self.downloaded_file = filename
         self.is_download_complete = True
+        self.download_progress_bar.setRange(0, 100)
         self.download_progress_bar.setValue(100)
         self.show_message(f"اكتمل التحميل! الملف: {filename}", "green")
+        self._record_in_catalog(filename)
+        self.jobs_model.update_job(self.current_job_id, status='done', progress=100)
 
         self.btn_download.setEnabled(True)
         self.btn_cancel.setDisabled(True)
@@ -861,9 +4125,59 @@ class YtdlpGui(QMainWindow):
         else:
             self.stacked_widget.setCurrentIndex(3)
 
+    def _record_in_catalog(self, filename):
+        """تسجيل المهمة المكتملة في فهرس SQLite."""
+        completed_at = time.time()
+        info = self.video_info
+        try:
+            self.catalog.record({
+                'video_id': info.get('video_id'),
+                'title': info.get('title') or self.video_title,
+                'uploader': info.get('uploader'),
+                'channel_id': info.get('channel_id'),
+                'duration': info.get('duration'),
+                'upload_date': info.get('upload_date'),
+                'source_url': self.youtube_url,
+                'format': self.download_options.get('format'),
+                'download_type': self.download_type,
+                'file_path': filename,
+                'file_size': os.path.getsize(filename) if os.path.isfile(filename) else None,
+                'expected_size': self.expected_size,
+                'sha256': self.job_integrity.get(filename, {}).get('sha256'),
+                'started_at': self.download_started_at,
+                'completed_at': completed_at,
+                'elapsed': completed_at - self.download_started_at if self.download_started_at else None,
+            })
+        except sqlite3.Error as e:
+            self.show_message(f"تعذر تحديث الفهرس: {e}", "red")
+
+    def on_live_segment_ready(self, record):
+        """مقطع بث منتهٍ وجاهز للمعالجة بينما يستمر التسجيل."""
+        self._record_in_catalog(record['path'])
+        self.show_message(f"مقطع بث جاهز: {os.path.basename(record['path'])} "
+                          f"({self.download_worker._format_size(record['bytes'])})", "blue")
+
+    def on_live_segment_removed(self, path):
+        """مقطع حذفه حد الاحتفاظ: لا يبقى في الفهرس سجل لملف غير موجود."""
+        try:
+            self.catalog.remove(path)
+        except sqlite3.Error as e:
+            self.show_message(f"تعذر تحديث الفهرس: {e}", "red")
+
     def on_download_error(self, message):
         """التعامل مع أخطاء التحميل."""
         self.show_message(f"خطأ في التحميل: {message}", "red")
+        self.jobs_model.update_job(self.current_job_id, status='error')
+        self.download_progress_bar.setVisible(False)
+        self.btn_download.setEnabled(True)
+        self.btn_cancel.setDisabled(True)
+        self.btn_back_page2.setEnabled(True)
+        self.is_download_complete = False
+
+    def on_download_cancelled(self):
+        """التعامل مع إلغاء التحميل (الملفات الجزئية تبقى للاستئناف لاحقاً)."""
+        self.show_message("تم إلغاء التحميل.", "orange")
+        self.jobs_model.update_job(self.current_job_id, status='cancelled')
         self.download_progress_bar.setVisible(False)
         self.btn_download.setEnabled(True)
         self.btn_cancel.setDisabled(True)
@@ -993,17 +4307,23 @@ class YtdlpGui(QMainWindow):
         conversion_options = {
             'image_format': self.image_format_combo.currentText(),
             'title_slug': self.video_title_slug,
-            'is_video_convert': is_video_convert # لتشغيل محاكاة الفيديو
+            'is_video_convert': is_video_convert,
+            'video_codec': VIDEO_CODEC_CHOICES.get(self.codec_combo.currentText(), 'copy'),
+            'container': self.format_combo.currentText() if self.format_combo.currentIndex() > 0 else None,
+            'artifacts': self.job_artifacts,
+            'video_info': self.video_info,
         }
 
-        self.show_message("بدأ تحويل الملفات... 🚀", "blue")
-
         # **تشغيل عامل التحويل (Worker)**
         self.conversion_worker = ConversionWorker(url=self.youtube_url, options=conversion_options)
+        self.conversion_worker.finished.connect(self._on_worker_finished)
         self.conversion_worker.conversion_progress.connect(self.update_conversion_progress)
         self.conversion_worker.conversion_finished.connect(self.on_conversion_finished)
+        self.conversion_worker.media_converted.connect(self.on_media_converted)
         self.conversion_worker.conversion_error.connect(self.on_download_error)
-        self.conversion_worker.start()
+        # المجدول يرتب المهام حسب كلفتها المتوقعة ويبدأ هذه عند توفر مكان لها
+        predicted = conversion_scheduler().submit(self.conversion_worker)
+        self.show_message(f"بدأ تحويل الملفات... 🚀 (الزمن المتوقع ~{predicted:.0f} ثانية)", "blue")
 
     def update_conversion_progress(self, percent):
         """تحديث شريط تقدم التحويل."""
@@ -1011,7 +4331,8 @@ class YtdlpGui(QMainWindow):
 
     def cancel_conversion_simulation(self):
         """إلغاء التحويل."""
-        if hasattr(self, 'conversion_worker') and self.conversion_worker.isRunning():
+        if self.conversion_worker is not None:
+            # قد تكون قيد التشغيل أو ما زالت تنتظر دورها في المجدول
             self.conversion_worker.cancel_conversion()
             self.show_message("تم إلغاء التحويل.", "red")
             self.btn_convert.setEnabled(True)
@@ -1020,6 +4341,16 @@ class YtdlpGui(QMainWindow):
             self.convert_progress_bar.setVisible(False)
             self.stacked_widget.setCurrentIndex(3)
 
+    def on_media_converted(self, result):
+        """تحديث فهرس المهمة والفهرس SQLite بعد استبدال الملف المحمّل بناتج التحويل."""
+        media = self.job_artifacts.get('media') or []
+        self.job_artifacts['media'] = [result['path'] if path == result['source'] else path for path in media]
+        try:
+            self.catalog.relocate(result['source'], result['path'], file_size=result['file_size'],
+                                  sha256=result['sha256'])
+        except sqlite3.Error as e:
+            self.show_message(f"تعذر تحديث الفهرس: {e}", "red")
+
     def on_conversion_finished(self):
         """التعامل مع اكتمال التحويل."""
         self.show_message("اكتمل التحويل بنجاح!", "green")
@@ -1042,6 +4373,13 @@ class YtdlpGui(QMainWindow):
 
         layout.addSpacing(30)
 
+        layout.addWidget(QLabel("سجل المهام:"))
+        self.jobs_list = QListView()
+        self.jobs_list.setModel(self.jobs_model)
+        self.jobs_list.setUniformItemSizes(True)
+        self.jobs_list.setMinimumHeight(120)
+        layout.addWidget(self.jobs_list)
+
         h_layout = QHBoxLayout()
 
         self.btn_back_page4 = CustomButton("رجوع ⬅️")
@@ -1064,14 +4402,26 @@ class YtdlpGui(QMainWindow):
 
     def reset_application(self):
         """إعادة تعيين التطبيق للبدء من جديد (القائمة 1)."""
+        worker, self.download_worker = self.download_worker, None
+        if worker is not None:
+            if worker.isRunning():
+                # يُحرَّر في _on_worker_finished عند انتهائه
+                worker.cancel_download()
+            else:
+                # انتهى بالفعل: لا ننتظر إشارة finished (قد تكون سُلّمت) ونحرره الآن
+                worker.finished.disconnect(self._on_worker_finished)
+                release_worker(worker)
         self.youtube_url = ""
         self.video_formats = []
         self.video_title = ""
-        self.download_worker = None
         self.download_type = None
         self.downloaded_file = None
         self.is_download_complete = False
         self.video_title_slug = "" # إعادة تعيين الـ slug
+        self.video_info = {}
+        self.download_started_at = None
+        self.job_artifacts = {}
+        self.job_integrity = {}
 
         self.url_line_edit.clear()
 
@@ -1080,7 +4430,7 @@ class YtdlpGui(QMainWindow):
         self.chk_audio_only.setChecked(False)
         self.chk_thumbnail.setChecked(False)
         self.chk_description.setChecked(False)
-        self.formats_list.clear()
+        self.formats_model.set_formats([])
         self.formats_list.setEnabled(False)
 
         self.convert_progress_bar.setVisible(False)
@@ -1092,14 +4442,262 @@ class YtdlpGui(QMainWindow):
         self.show_message("تمت إعادة تعيين التطبيق. يرجى إدخال رابط جديد. 🎬", "black")
 
 
+# ----------------------------------------------------------------------
+## 4.5 قياس أداء الأوضاع (Theme Benchmark)
+# ----------------------------------------------------------------------
+def run_theme_benchmark(iterations=50):
+    """قياس زمن أول رسم للنافذة وزمن كل تبديل للوضع (مع معالجة أحداث الرسم)."""
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+
+    started = time.perf_counter()
+    window = YtdlpGui()
+    window.show()
+    app.processEvents()
+    first_paint = time.perf_counter() - started
+
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        window.toggle_theme()
+        window.repaint()
+        app.processEvents()
+        timings.append(time.perf_counter() - started)
+
+    timings.sort()
+    print(f"first paint: {first_paint * 1000:.1f} ms")
+    print(f"theme switch ({iterations}x): median {timings[len(timings) // 2] * 1000:.2f} ms, "
+          f"p95 {timings[int(len(timings) * 0.95) - 1] * 1000:.2f} ms, max {timings[-1] * 1000:.2f} ms")
+    window.close()
+    return first_paint, timings
+
+
 # ----------------------------------------------------------------------
 ## 5. نقطة الدخول (Entry Point)
 # ----------------------------------------------------------------------
+def _parse_cli_args():
+    """قراءة خيارات سطر الأوامر؛ الخيارات غير المعروفة تُترك لـ Qt."""
+    parser = argparse.ArgumentParser(description="YT-DLP GUI")
+    parser.add_argument('--import-folder', metavar='PATH',
+                        help="استيراد مجلد موجود إلى فهرس SQLite ثم الخروج")
+    parser.add_argument('--checksums', action='store_true',
+                        help="حساب SHA-256 للملفات المستوردة")
+    parser.add_argument('--soak', type=int, metavar='JOBS',
+                        help="تشغيل اختبار تحمل بعدد من المهام الاصطناعية على خادم محلي ثم الخروج")
+    parser.add_argument('--bench-theme', type=int, metavar='N',
+                        help="قياس زمن أول رسم و N مرة تبديل للوضع ثم الخروج")
+    parser.add_argument('--queue', metavar='DB',
+                        help="ملف SQLite للطابور المشترك (مع --enqueue أو --queue-worker)")
+    parser.add_argument('--enqueue', nargs='+', metavar='URL',
+                        help="إضافة روابط إلى الطابور المشترك ثم الخروج")
+    parser.add_argument('--format', default=None,
+                        help="صيغة yt-dlp لمهام الطابور")
+    parser.add_argument('--max-mb-per-minute', type=float, default=None,
+                        help="اختيار الصيغة تلقائياً لمهام الطابور: أعلى جودة لا تتجاوز هذا الحجم لكل دقيقة")
+    parser.add_argument('--max-height', type=int, default=None,
+                        help="اختيار الصيغة تلقائياً لمهام الطابور: أقصى ارتفاع للفيديو")
+    parser.add_argument('--remux-container', choices=sorted(REMUX_FRIENDLY_CODECS), default=None,
+                        help="اختيار الصيغة تلقائياً لمهام الطابور: تفضيل ترميزات تُنقل إلى هذه الحاوية دون إعادة ترميز")
+    parser.add_argument('--full-decode', action='store_true',
+                        help="فك ترميز كل ملف ناتج بالكامل للتحقق من سلامته (أبطأ؛ الافتراضي فحص الحاوية فقط)")
+    parser.add_argument('--queue-worker', action='store_true',
+                        help="تشغيل عامل يسحب المهام من الطابور المشترك")
+    parser.add_argument('--concurrency', type=int, default=2,
+                        help="عدد المهام المتزامنة في هذه العملية")
+    parser.add_argument('--host-limit', type=int, default=None,
+                        help="الحد الأقصى للمهام المتزامنة على هذا الجهاز (عبر كل العمليات)")
+    parser.add_argument('--exit-when-empty', action='store_true',
+                        help="إنهاء العامل عند فراغ الطابور")
+    parser.add_argument('--harvest-metadata', nargs='+', metavar='URL',
+                        help="جلب الصور المصغرة والأوصاف والبيانات الوصفية بالجملة (فيديو/قائمة/قناة) ثم الخروج")
+    parser.add_argument('--batch-audio', nargs='+', metavar='URL',
+                        help="تحميل الصوت بالجملة (فيديو/قائمة/قناة) مع الاستخراج على كل الأنوية ثم الخروج")
+    parser.add_argument('--audio-codec', choices=[codec for codec, _label in AUDIO_CODEC_CHOICES], default=None,
+                        help=f"ترميز الصوت لـ --batch-audio و --enqueue/--sync (الافتراضي لـ --batch-audio: {AUDIO_NATIVE})؛ "
+                             "مع --enqueue/--sync يحدد الصيغة بنفسه فلا يُجمع مع --format")
+    parser.add_argument('--convert', nargs='+', metavar='PATH',
+                        help="تحويل ملفات محلية عبر مجدول التحويل (الأقصر أولاً) ثم الخروج")
+    parser.add_argument('--video-codec', choices=sorted(set(VIDEO_CODEC_CHOICES.values())), default='copy',
+                        help="مرمّز الفيديو لـ --convert")
+    parser.add_argument('--container', default=None,
+                        help="الحاوية الناتجة لـ --convert (الافتراضي: حاوية المصدر)")
+    parser.add_argument('--max-heavy', type=int, default=1,
+                        help="الحد الأقصى للترميزات الثقيلة المتزامنة لـ --convert")
+    parser.add_argument('--record-live', metavar='URL',
+                        help="تسجيل بث مباشر بمقاطع متتالية حتى انتهائه ثم الخروج")
+    parser.add_argument('--live-stand-in', action='store_true',
+                        help="تسجيل بث HLS اصطناعي لا نهائي من خادم محلي (للاختبار، مع --record-seconds)")
+    parser.add_argument('--segment-mb', type=float, default=LIVE_SEGMENT_MAX_BYTES / (1024 * 1024),
+                        help="الحد الأقصى لحجم مقطع التسجيل (MB)")
+    parser.add_argument('--segment-minutes', type=float, default=LIVE_SEGMENT_MAX_SECONDS / 60,
+                        help="الحد الأقصى لمدة مقطع التسجيل (دقائق)")
+    parser.add_argument('--retain-segments', type=int, default=None,
+                        help="عدد المقاطع المنتهية المحتفَظ بها على القرص (الأقدم يُحذف)")
+    parser.add_argument('--record-seconds', type=float, default=None,
+                        help="إيقاف التسجيل بعد عدد من الثواني")
+    parser.add_argument('--sync', nargs='+', metavar='URL',
+                        help="مزامنة تدريجية لقنوات/قوائم: سرد الجديد فقط منذ آخر مزامنة (مع --queue للإضافة للطابور)")
+    parser.add_argument('--sync-limit', type=int, default=None,
+                        help="الحد الأقصى للعناصر الجديدة لكل مصدر (مفيد لأول مزامنة)")
+    parser.add_argument('--profile', action='store_true',
+                        help=f"تحليل أداء كل مهمة وحفظ النتائج في {PROFILE_DIR}/ (مثل {PROFILE_ENV_VAR}=1)")
+    return parser.parse_known_args()
+
+
+def _queue_job_options(cli_args):
+    """خيارات مهام الطابور من سطر الأوامر (لـ --enqueue و --sync)؛ يرفع ValueError للتركيبات المتعارضة."""
+    job_options = {'format': cli_args.format} if cli_args.format else {}
+    policy = {key: value for key, value in (('max_mb_per_minute', cli_args.max_mb_per_minute),
+                                            ('max_height', cli_args.max_height),
+                                            ('remux_container', cli_args.remux_container)) if value}
+    if policy:
+        if cli_args.format:
+            raise ValueError("--format لا يُجمع مع خيارات الاختيار التلقائي (--max-mb-per-minute/--max-height/--remux-container)")
+        job_options['format_policy'] = policy
+    if cli_args.audio_codec:
+        # --audio-codec يحدد الصيغة (أفضل صوت) بنفسه؛ لا نتجاهل --format أو سياسة الاختيار بصمت
+        if cli_args.format or policy:
+            raise ValueError("--audio-codec لا يُجمع مع --format أو خيارات الاختيار التلقائي لمهام الطابور")
+        job_options.update(audio_download_options(cli_args.audio_codec))
+    if cli_args.full_decode:
+        job_options['full_decode'] = True
+    return job_options
+
+
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
+    cli_args, qt_args = _parse_cli_args()
+
+    if cli_args.profile:
+        os.environ[PROFILE_ENV_VAR] = '1'
+
+    if cli_args.import_folder:
+        catalog = MediaCatalog()
+        count = catalog.import_folder(cli_args.import_folder, compute_checksums=cli_args.checksums)
+        print(f"تم استيراد {count} ملف إلى الفهرس: {catalog.path}")
+        catalog.close()
+        sys.exit(0)
+
+    if cli_args.sync:
+        try:
+            job_options = _queue_job_options(cli_args)
+        except ValueError as e:
+            print(e)
+            sys.exit(2)
+        catalog = MediaCatalog()
+        queue = SharedJobQueue(cli_args.queue) if cli_args.queue else None
+        reports, new_entries = ChannelSync(catalog=catalog).sync(cli_args.sync, queue, job_options, cli_args.sync_limit)
+        for report in reports:
+            if 'error' in report:
+                print(f"[RED]: {report['source']}: {report['error']}")
+                continue
+            print(f"[SYNC]: {report['source']}: +{report['new']} جديد (تم فحص {report['scanned']}"
+                  f"{'، توقف عند المعروف' if report['stopped_early'] else ''}) في {report['elapsed']:.1f} ثانية")
+        if queue is None:
+            for entry in new_entries:
+                print(entry['url'])
+        else:
+            print(f"الطابور: {queue.stats()}")
+            queue.close()
+        catalog.close()
+        YDL_SESSION_POOL.close_all()
+        sys.exit(1 if any('error' in report for report in reports) else 0)
+
+    if cli_args.enqueue or cli_args.queue_worker:
+        if not cli_args.queue:
+            print("يرجى تحديد ملف الطابور عبر --queue")
+            sys.exit(2)
+        if cli_args.enqueue:
+            accepted = [URL_NORMALIZER.parse(url)[0] for url in cli_args.enqueue]
+            urls = [canonical.url if canonical else url for canonical, url in zip(accepted, cli_args.enqueue)]
+            queue = SharedJobQueue(cli_args.queue)
+            try:
+                job_options = _queue_job_options(cli_args)
+            except ValueError as e:
+                print(e)
+                sys.exit(2)
+            ids = queue.enqueue_many(urls, job_options)
+            print(f"تمت إضافة {len(ids)} مهمة إلى الطابور: {queue.stats()}")
+            queue.close()
+        if cli_args.queue_worker:
+            run_queue_worker(cli_args.queue, cli_args.concurrency, cli_args.host_limit,
+                             exit_when_empty=cli_args.exit_when_empty)
+        YDL_SESSION_POOL.close_all()
+        sys.exit(0)
+
+    if cli_args.harvest_metadata:
+        results, errors = MetadataHarvester().harvest(cli_args.harvest_metadata)
+        print(f"تم جلب بيانات {len(results)} فيديو، الأخطاء: {len(errors)}")
+        for url, error in errors:
+            print(f"[RED]: {url}: {error}")
+        YDL_SESSION_POOL.close_all()
+        sys.exit(1 if errors else 0)
+
+    if cli_args.batch_audio:
+        extractor = BatchAudioExtractor(cli_args.audio_codec or AUDIO_NATIVE)
+        outputs, errors = extractor.run(cli_args.batch_audio)
+        print(f"تم استخراج {len(outputs)} ملف صوتي ({extractor.ffmpeg_workers} عملية ffmpeg متوازية)، "
+              f"الأخطاء: {len(errors)}")
+        for url, error in errors:
+            print(f"[RED]: {url}: {error}")
+        YDL_SESSION_POOL.close_all()
+        sys.exit(1 if errors else 0)
+
+    if cli_args.convert:
+        scheduler = ConversionScheduler(max_heavy=cli_args.max_heavy)
+        catalog = MediaCatalog()
+        failures = []
+        for path in cli_args.convert:
+            worker = ConversionWorker(url=None, options={
+                'image_format': '-- الأصلي (لا تحويل) --', 'title_slug': os.path.basename(path),
+                'is_video_convert': True, 'video_codec': cli_args.video_codec, 'container': cli_args.container,
+                'artifacts': {'media': [path]}})
+            worker.conversion_error.connect(lambda message, path=path: failures.append((path, message)),
+                                            Qt.ConnectionType.DirectConnection)
+            worker.media_converted.connect(
+                lambda result: catalog.relocate(result['source'], result['path'], file_size=result['file_size'],
+                                                sha256=result['sha256']), Qt.ConnectionType.DirectConnection)
+            scheduler.submit(worker)
+        for worker, predicted in scheduler.pending():
+            print(f"[SCHEDULE]: {worker.options['title_slug']} ~{predicted:.1f}s")
+        scheduler.wait()
+        catalog.close()
+        print(f"تم تحويل {len(cli_args.convert) - len(failures)} ملف، الأخطاء: {len(failures)}")
+        for path, message in failures:
+            print(f"[RED]: {path}: {message}")
+        sys.exit(1 if failures else 0)
+
+    if cli_args.record_live or cli_args.live_stand_in:
+        live_url = cli_args.record_live
+        if cli_args.live_stand_in:
+            server = start_stand_in_server(_LiveHlsHandler)
+            live_url = f"http://127.0.0.1:{server.server_address[1]}/master.m3u8"
+        recorder = LiveRecorder(live_url, max_segment_bytes=int(cli_args.segment_mb * 1024 * 1024),
+                                max_segment_seconds=cli_args.segment_minutes * 60,
+                                retain_segments=cli_args.retain_segments,
+                                on_segment=lambda record: print(f"[LIVE]: {record['path']} "
+                                                                f"({record['bytes']} B, {record['seconds']:.1f}s)"))
+        try:
+            recorder.record(max_duration=cli_args.record_seconds)
+        except KeyboardInterrupt:
+            pass
+        print(f"تم تسجيل {recorder.segment_count} مقطع ({recorder.bytes_recorded} بايت)")
+        YDL_SESSION_POOL.close_all()
+        sys.exit(0)
+
+    if cli_args.soak:
+        run_soak_test(cli_args.soak)
+        YDL_SESSION_POOL.close_all()
+        sys.exit(0)
+
+    if cli_args.bench_theme:
+        run_theme_benchmark(cli_args.bench_theme)
+        sys.exit(0)
+
+    app = QApplication(sys.argv[:1] + qt_args)
 
     app.setLayoutDirection(Qt.LayoutDirection.RightToLeft)
 
     window = YtdlpGui()
     window.show()
-    sys.exit(app.exec())
+    exit_code = app.exec()
+    YDL_SESSION_POOL.close_all()
+    sys.exit(exit_code)